@@ -0,0 +1,130 @@
+import numpy as np
+
+from db_manager import anios_activos_autores
+from indices_memoria import IndiceVersionado
+
+
+# =========================================
+#  Años activos de cada autor (bitsets en memoria)
+# =========================================
+
+# Índice por worker: una fila de bits por autor (bit j = año min_year + j, empaquetados en
+# bytes con np.packbits), construida con una sola consulta a author_year_counts. Las
+# preguntas sobre una ventana de años se responden con máscaras sobre todas las filas a
+# la vez, sin volver a la base de datos:
+#   - consistentes: activos todos los años de la ventana -> (bits & máscara) == máscara
+#   - activos al menos k años                          -> popcount(bits & máscara) >= k
+#   - racha más larga dentro de la ventana             -> una pasada por columna (años)
+# Se reconstruye cuando cambia la versión de los datos (ver indices_memoria.py).
+
+# Número de bits a 1 de cada byte
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class IndiceActividad:
+
+    def __init__(self, filas):
+        # filas: [(full_name, [años]), ...] ordenadas por nombre
+        self.nombres = [f[0] for f in filas]
+        anios = [a for f in filas for a in f[1]]
+        self.min_year = min(anios) if anios else 0
+        self.max_year = max(anios) if anios else -1
+        activos = np.zeros((len(filas), self.max_year - self.min_year + 1), dtype=bool)
+        autores = np.repeat(np.arange(len(filas)), [len(f[1]) for f in filas])
+        activos[autores, np.array(anios, dtype=np.int64) - self.min_year] = True
+        self.bits = np.packbits(activos, axis=1, bitorder="little")
+
+    def _mascara(self, year_start, year_end):
+        # Bits de la ventana recortada a los años con datos
+        anios = np.arange(self.min_year, self.min_year + self.bits.shape[1] * 8)
+        return np.packbits((anios >= year_start) & (anios <= year_end), bitorder="little")
+
+    def _recortar(self, year_start, year_end):
+        # La ventana dentro de los años con datos, o None si no tiene ninguno
+        year_start, year_end = max(year_start, self.min_year), min(year_end, self.max_year)
+        return (year_start, year_end) if year_start <= year_end else None
+
+    def _anios(self, filas, year_start, year_end):
+        # Matriz booleana (autores x años) de la ventana ya recortada, solo para las filas pedidas
+        assert self.min_year <= year_start <= year_end <= self.max_year, "ventana sin recortar"
+        desde = year_start - self.min_year
+        hasta = year_end - self.min_year + 1
+        return np.unpackbits(self.bits[filas], axis=1, bitorder="little")[:, desde:hasta].astype(bool), desde
+
+    def consistentes(self, year_start, year_end):
+        # Años sin ningún dato dentro de la ventana: nadie puede haber publicado en todos
+        if year_start < self.min_year or year_end > self.max_year:
+            return []
+        mascara = self._mascara(year_start, year_end)
+        filas = np.flatnonzero(((self.bits & mascara) == mascara).all(axis=1))
+        return [
+            {"full_name": self.nombres[i], "first_year": year_start, "last_year": year_end,
+             "num_years": year_end - year_start + 1}
+            for i in filas
+        ]
+
+    def activos_al_menos(self, year_start, year_end, min_anios, limite):
+        ventana = self._recortar(year_start, year_end)
+        if ventana is None:
+            return 0, []
+        year_start, year_end = ventana
+        cuentas = POPCOUNT[self.bits & self._mascara(year_start, year_end)].sum(axis=1)
+        filas = np.flatnonzero(cuentas >= min_anios)
+        if not len(filas):
+            return 0, []
+        # Más años primero; a igualdad, por nombre (el orden del índice)
+        filas = filas[np.argsort(-cuentas[filas], kind="stable")][:limite]
+        anios, desde = self._anios(filas, year_start, year_end)
+        primero = anios.argmax(axis=1)
+        ultimo = anios.shape[1] - 1 - anios[:, ::-1].argmax(axis=1)
+        return int((cuentas >= min_anios).sum()), [
+            {"full_name": self.nombres[i], "num_years": int(cuentas[i]),
+             "first_year": self.min_year + desde + int(primero[j]),
+             "last_year": self.min_year + desde + int(ultimo[j])}
+            for j, i in enumerate(filas)
+        ]
+
+    def rachas_mas_largas(self, year_start, year_end, top):
+        ventana = self._recortar(year_start, year_end)
+        if ventana is None:
+            return []
+        year_start, year_end = ventana
+        # Solo los autores con algún año en la ventana
+        filas = np.flatnonzero((self.bits & self._mascara(year_start, year_end)).any(axis=1))
+        anios, desde = self._anios(filas, year_start, year_end)
+        actual = np.zeros(len(filas), dtype=np.int32)
+        mejor = np.zeros(len(filas), dtype=np.int32)
+        fin = np.zeros(len(filas), dtype=np.int32)
+        for columna in range(anios.shape[1]):
+            actual = (actual + 1) * anios[:, columna]
+            mejora = actual > mejor
+            mejor = np.where(mejora, actual, mejor)
+            fin = np.where(mejora, columna, fin)
+        orden = np.argsort(-mejor, kind="stable")[:top]
+        return [
+            {"full_name": self.nombres[filas[j]], "racha": int(mejor[j]),
+             "desde": self.min_year + desde + int(fin[j] - mejor[j] + 1),
+             "hasta": self.min_year + desde + int(fin[j])}
+            for j in orden
+        ]
+
+
+_indice = IndiceVersionado("Índice de actividad", lambda: IndiceActividad(anios_activos_autores()),
+                           resumen=lambda indice: f"{len(indice.nombres)} autores")
+construir_indice = _indice.construir
+obtener_indice = _indice.obtener
+
+
+def autores_consistentes(year_start, year_end):
+    """Autores con algún paper en todos los años de [year_start, year_end] (como db_manager.autores_consistentes)."""
+    return obtener_indice().consistentes(year_start, year_end)
+
+
+def autores_activos(year_start, year_end, min_anios, limite=100):
+    """(total, autores) con papers en al menos min_anios años de la ventana; los de más años primero."""
+    return obtener_indice().activos_al_menos(year_start, year_end, min_anios, limite)
+
+
+def rachas_autores(year_start, year_end, top=20):
+    """Los top autores con la racha de años consecutivos publicando más larga dentro de la ventana."""
+    return obtener_indice().rachas_mas_largas(year_start, year_end, top)
@@ -0,0 +1,475 @@
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+import anyio
+from fastapi.encoders import jsonable_encoder
+
+import db_manager
+from db_manager import version_datos
+
+
+# =========================================
+#  Caché de respuestas compartida entre workers
+# =========================================
+
+# Los endpoints de estadísticas son funciones puras de (endpoint, parámetros) hasta la
+# siguiente actualización de datos. Se guardan en un SQLite local (modo WAL) que comparten
+# todos los workers de uvicorn. La clave incluye la versión del dataset (el contador que
+# incrementa refrescar_agregados() al final de cada carga, también si se lanza
+# importar_bibtex.py a mano) y una generación que se incrementa al invalidar.
+
+RUTA_CACHE = os.environ.get("CACHE_RESPUESTAS_RUTA", "cache_respuestas.sqlite3")
+CACHE_MAX_BYTES_ENTRADA = 4 * 1024 * 1024    # respuestas más grandes no se guardan
+CACHE_MAX_BYTES_TOTAL = 256 * 1024 * 1024    # al pasarse se desalojan las menos usadas (LRU)
+VERSION_TTL_S = 5                            # cada worker relee la versión como mucho cada 5 s
+
+CONJUNTO_TTL_S = 30 * 60                         # un conjunto caduca 30 min después de su último uso
+CONJUNTO_MAX_BYTES = 16 * 1024 * 1024            # ids de más (comprimidos) no se guardan: se resuelven en cada uso
+CONJUNTOS_MAX_BYTES_TOTAL = 64 * 1024 * 1024     # al pasarse se borran los que antes caducan
+ETAGS_MAX_FILAS = 100_000                        # enlaces ETag -> conjuntos (LRU)
+
+logger = logging.getLogger(__name__)
+
+# Con True (p. ej. en el modo explain) los endpoints cacheados calculan siempre y no guardan
+sin_cache = contextvars.ContextVar("sin_cache", default=False)
+# ETag base de la petición en curso (lo pone ETagMiddleware); None fuera de las rutas con ETag
+etag_peticion = contextvars.ContextVar("etag_peticion", default=None)
+
+_local = threading.local()
+_version = {"valor": None, "leida": 0.0}
+_version_lock = threading.Lock()
+
+
+def _conexion_cache():
+    # Una conexión SQLite por hilo (no se pueden compartir entre hilos)
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(RUTA_CACHE, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Los conjuntos de antes guardaban solo los ids; son efímeros, así que se descartan
+        columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(conjuntos)")}
+        if columnas and "receta" not in columnas:
+            conn.execute("DROP TABLE conjuntos")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                clave         TEXT PRIMARY KEY,
+                endpoint      TEXT NOT NULL,
+                valor         BLOB NOT NULL,
+                tam           INTEGER NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entradas_acceso ON entradas (ultimo_acceso);
+            CREATE TABLE IF NOT EXISTS contadores (
+                endpoint TEXT PRIMARY KEY,
+                aciertos INTEGER NOT NULL DEFAULT 0,
+                fallos   INTEGER NOT NULL DEFAULT 0,
+                grandes  INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                nombre TEXT PRIMARY KEY,
+                valor  INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (nombre, valor) VALUES ('generacion', 0);
+            CREATE TABLE IF NOT EXISTS conjuntos (
+                id      TEXT PRIMARY KEY,
+                receta  TEXT NOT NULL,
+                version TEXT NOT NULL,
+                ids     BLOB,
+                n       INTEGER,
+                tam     INTEGER NOT NULL,
+                expira  REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_conjuntos_expira ON conjuntos (expira);
+            CREATE TABLE IF NOT EXISTS etags_conjuntos (
+                etag      TEXT PRIMARY KEY,
+                conjuntos TEXT NOT NULL,
+                usado     REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_etags_conjuntos_usado ON etags_conjuntos (usado);
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _version_actual():
+    # Versión del dataset, cacheada unos segundos en el proceso para no ir a Postgres en cada petición
+    with _version_lock:
+        if time.monotonic() - _version["leida"] > VERSION_TTL_S:
+            _version["valor"] = version_datos()
+            _version["leida"] = time.monotonic()
+        return _version["valor"]
+
+
+def _normalizar(params):
+    # Sin los None (equivalen a no pasar el parámetro); el orden lo fija sort_keys en _clave.
+    # Los textos se dejan tal cual: algunas consultas comparan el nombre exacto.
+    return {nombre: valor for nombre, valor in params.items() if valor is not None}
+
+
+def _clave(endpoint, params, version, generacion):
+    texto = json.dumps([endpoint, _normalizar(params), version, generacion], sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def _contar(conn, endpoint, columna):
+    conn.execute(
+        f"INSERT INTO contadores (endpoint, {columna}) VALUES (?, 1) "
+        f"ON CONFLICT(endpoint) DO UPDATE SET {columna} = {columna} + 1",
+        (endpoint,),
+    )
+
+
+def _desalojar(conn):
+    total = conn.execute("SELECT COALESCE(SUM(tam), 0) FROM entradas").fetchone()[0]
+    if total <= CACHE_MAX_BYTES_TOTAL:
+        return
+    # Borro las menos usadas recientemente hasta quedar por debajo del límite
+    sobrante = total - CACHE_MAX_BYTES_TOTAL
+    conn.execute("""
+        DELETE FROM entradas WHERE clave IN (
+            SELECT clave FROM (
+                SELECT clave, tam, SUM(tam) OVER (ORDER BY ultimo_acceso, clave) AS acumulado
+                FROM entradas
+            ) WHERE acumulado - tam < ?
+        )
+    """, (sobrante,))
+
+
+_NO_ENCONTRADO = object()
+
+def _buscar(endpoint, params, conjuntos=()):
+    """
+    Busca (endpoint, params) para la versión actual de los datos. Devuelve (valor, (clave, generacion));
+    valor es _NO_ENCONTRADO si no está, y la tupla es None si la caché no está disponible.
+    Si la respuesta guardada hace referencia a conjuntos de resultados (campos 'conjuntos') que ya
+    han caducado, cuenta como no encontrada para que se vuelvan a calcular.
+    """
+    try:
+        conn = _conexion_cache()
+        generacion = conn.execute("SELECT valor FROM meta WHERE nombre = 'generacion'").fetchone()[0]
+        clave = _clave(endpoint, params, _version_actual(), generacion)
+        fila = conn.execute("SELECT valor FROM entradas WHERE clave = ?", (clave,)).fetchone()
+        if fila is not None:
+            valor = json.loads(fila[0])
+            if conjuntos and not _renovar_conjuntos(conn, [valor.get(campo) for campo in conjuntos]):
+                return _NO_ENCONTRADO, (clave, generacion)
+            conn.execute("UPDATE entradas SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave))
+            _contar(conn, endpoint, "aciertos")
+            return valor, (clave, generacion)
+        return _NO_ENCONTRADO, (clave, generacion)
+    except sqlite3.Error:
+        logger.exception("Caché de respuestas no disponible")
+        return _NO_ENCONTRADO, None
+
+
+def _guardar(endpoint, clave, generacion, resultado):
+    try:
+        conn = _conexion_cache()
+        valor = json.dumps(resultado, separators=(",", ":")).encode("utf-8")
+        _contar(conn, endpoint, "fallos")
+        if len(valor) > CACHE_MAX_BYTES_ENTRADA:
+            _contar(conn, endpoint, "grandes")
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Si se invalidó mientras se calculaba, la respuesta puede ser de los datos antiguos
+            actual = conn.execute("SELECT valor FROM meta WHERE nombre = 'generacion'").fetchone()[0]
+            if actual == generacion:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entradas (clave, endpoint, valor, tam, ultimo_acceso) VALUES (?, ?, ?, ?, ?)",
+                    (clave, endpoint, valor, len(valor), time.time()),
+                )
+                _desalojar(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.Error:
+        logger.exception("No se pudo guardar en la caché de respuestas")
+
+
+def obtener_o_calcular(endpoint, params, calcular, conjuntos=()):
+    """
+    Devuelve la respuesta cacheada de (endpoint, params) para la versión actual de los datos,
+    o la calcula con calcular(), la guarda y la devuelve. Si la caché falla, se calcula sin ella.
+    """
+    if sin_cache.get():
+        return jsonable_encoder(calcular())
+    valor, estado = _buscar(endpoint, params, conjuntos)
+    if valor is _NO_ENCONTRADO:
+        valor = jsonable_encoder(calcular())
+        if estado is not None:
+            _guardar(endpoint, *estado, valor)
+    if conjuntos:
+        _enlazar_etag(etag_peticion.get(), [valor.get(campo) for campo in conjuntos])
+    return valor
+
+
+async def obtener_o_calcular_async(endpoint, params, calcular, conjuntos=()):
+    # Igual que obtener_o_calcular, con calcular() asíncrono y el SQLite fuera del bucle de eventos
+    if sin_cache.get():
+        return jsonable_encoder(await calcular())
+    valor, estado = await anyio.to_thread.run_sync(_buscar, endpoint, params, conjuntos)
+    if valor is _NO_ENCONTRADO:
+        valor = jsonable_encoder(await calcular())
+        if estado is not None:
+            await anyio.to_thread.run_sync(_guardar, endpoint, *estado, valor)
+    if conjuntos:
+        await anyio.to_thread.run_sync(_enlazar_etag, etag_peticion.get(), [valor.get(campo) for campo in conjuntos])
+    return valor
+
+
+def cacheado(endpoint, conjuntos=()):
+    """
+    Decorador para endpoints de FastAPI: cachea la respuesta según sus parámetros.
+    Mantiene la firma del endpoint (functools.wraps), así que FastAPI ve los mismos parámetros.
+    Vale tanto para endpoints 'def' como 'async def'. 'conjuntos' son los campos de la
+    respuesta que llevan el id de un conjunto de resultados (ver crear_conjunto).
+    """
+    def decorador(funcion):
+        if inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                return await obtener_o_calcular_async(endpoint, kwargs, lambda: funcion(*args, **kwargs), conjuntos)
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            return obtener_o_calcular(endpoint, kwargs, lambda: funcion(*args, **kwargs), conjuntos)
+        return envoltura
+    return decorador
+
+
+def invalidar_cache():
+    """Invalida toda la caché (se llama al terminar una importación)."""
+    with _version_lock:
+        _version["leida"] = 0.0
+    conn = _conexion_cache()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("UPDATE meta SET valor = valor + 1 WHERE nombre = 'generacion'")
+    conn.execute("DELETE FROM entradas")
+    conn.execute("DELETE FROM etags_conjuntos")
+    conn.execute("COMMIT")
+
+
+def version_dataset():
+    """
+    Versión de los datos común a todos los workers: la versión de la BD más la generación
+    de la caché. La usan los índices en memoria para saber cuándo reconstruirse.
+    """
+    generacion = _conexion_cache().execute("SELECT valor FROM meta WHERE nombre = 'generacion'").fetchone()[0]
+    return f"{_version_actual()}:{generacion}"
+
+
+# =========================================
+#  Conjuntos de resultados
+# =========================================
+
+# Los endpoints de estadísticas devuelven el id de un conjunto con los papers de su
+# respuesta y la exportación lo recibe, así que no viajan listas enormes de ids a
+# Streamlit y de vuelta. Crear el conjunto solo guarda la receta (la función de db_manager
+# que devuelve los ids y sus argumentos) y la versión de los datos: la lista completa se
+# calcula la primera vez que se exporta y desde entonces se reutiliza. Van en el mismo
+# SQLite que la caché para que cualquier worker pueda exportar un conjunto creado por
+# otro. El id se deriva de la receta y la versión, así que la misma consulta repetida
+# reutiliza el conjunto y solo renueva su TTL.
+
+def _renovar_conjuntos(conn, ids_conjunto):
+    # True si todos siguen vivos (un None es un conjunto que no se pudo crear)
+    ahora = time.time()
+    for conjunto in ids_conjunto:
+        if conjunto is None:
+            continue
+        cur = conn.execute(
+            "UPDATE conjuntos SET expira = ? WHERE id = ? AND expira > ?",
+            (ahora + CONJUNTO_TTL_S, conjunto, ahora),
+        )
+        if cur.rowcount == 0:
+            return False
+    return True
+
+
+def _desalojar_conjuntos(conn):
+    conn.execute("DELETE FROM conjuntos WHERE expira <= ?", (time.time(),))
+    total = conn.execute("SELECT COALESCE(SUM(tam), 0) FROM conjuntos").fetchone()[0]
+    if total <= CONJUNTOS_MAX_BYTES_TOTAL:
+        return
+    sobrante = total - CONJUNTOS_MAX_BYTES_TOTAL
+    conn.execute("""
+        DELETE FROM conjuntos WHERE id IN (
+            SELECT id FROM (
+                SELECT id, tam, SUM(tam) OVER (ORDER BY expira, id) AS acumulado
+                FROM conjuntos
+            ) WHERE acumulado - tam < ?
+        )
+    """, (sobrante,))
+
+
+def _comprimir_ids(paper_ids):
+    ids = array("q", sorted(set(paper_ids)))
+    return ids, zlib.compress(ids.tobytes(), 1)
+
+
+def crear_conjunto(funcion, *args, paper_ids=None):
+    """
+    Crea el conjunto de los papers que devuelve funcion(*args) (una función de db_manager) y
+    devuelve su id, o None si la caché no está disponible; en ese caso se exporta por el
+    camino antiguo. No ejecuta la consulta: si ya se tienen los ids se pasan en paper_ids.
+    """
+    receta = json.dumps([funcion.__name__, args], separators=(",", ":"), default=str)
+    datos = n = None
+    if paper_ids is not None:
+        ids, datos = _comprimir_ids(paper_ids)
+        n = len(ids)
+        if len(datos) > CONJUNTO_MAX_BYTES:
+            datos = n = None
+    try:
+        version = version_dataset()
+        conjunto = hashlib.sha256(f"{receta}|{version}".encode("utf-8")).hexdigest()[:32]
+        conn = _conexion_cache()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                INSERT INTO conjuntos (id, receta, version, ids, n, tam, expira) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    expira = excluded.expira,
+                    ids = COALESCE(conjuntos.ids, excluded.ids),
+                    n = COALESCE(conjuntos.n, excluded.n),
+                    tam = MAX(conjuntos.tam, excluded.tam)
+            """, (conjunto, receta, version, datos, n, len(receta) + len(datos or b""), time.time() + CONJUNTO_TTL_S))
+            _desalojar_conjuntos(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.Error:
+        logger.exception("No se pudo guardar el conjunto de resultados")
+        return None
+    return conjunto
+
+
+# Una respuesta con conjuntos puede revalidarse con un 304 durante mucho más que su TTL
+# (el ETag solo cambia con los datos) y el cliente seguiría exportando con un conjunto
+# caducado. Por eso se anota qué conjuntos lleva la respuesta de cada ETag y el 304 los
+# renueva igual que si se hubiera vuelto a calcular la respuesta.
+
+def _enlazar_etag(etag, ids_conjunto):
+    ids_conjunto = [conjunto for conjunto in ids_conjunto if conjunto is not None]
+    if etag is None or not ids_conjunto:
+        return
+    try:
+        conn = _conexion_cache()
+        conn.execute(
+            "INSERT OR REPLACE INTO etags_conjuntos (etag, conjuntos, usado) VALUES (?, ?, ?)",
+            (etag, json.dumps(ids_conjunto), time.time()),
+        )
+        conn.execute("""
+            DELETE FROM etags_conjuntos WHERE etag IN (
+                SELECT etag FROM etags_conjuntos ORDER BY usado DESC LIMIT -1 OFFSET ?
+            )
+        """, (ETAGS_MAX_FILAS,))
+    except sqlite3.Error:
+        logger.exception("No se pudo enlazar el ETag con sus conjuntos")
+
+
+def renovar_conjuntos_etag(etag):
+    """
+    Para ETagMiddleware antes de responder 304: renueva el TTL de los conjuntos que lleva
+    la respuesta con ese ETag. False si alguno ha caducado; entonces hay que mandar la
+    respuesta entera, que trae conjuntos nuevos. Las respuestas sin conjuntos no están.
+    """
+    try:
+        conn = _conexion_cache()
+        fila = conn.execute("SELECT conjuntos FROM etags_conjuntos WHERE etag = ?", (etag,)).fetchone()
+        if fila is None:
+            return True
+        if not _renovar_conjuntos(conn, json.loads(fila[0])):
+            return False
+        conn.execute("UPDATE etags_conjuntos SET usado = ? WHERE etag = ?", (time.time(), etag))
+        return True
+    except sqlite3.Error:
+        logger.exception("Caché de respuestas no disponible")
+        return True
+
+
+def obtener_conjunto(conjunto):
+    """
+    Ids de papers del conjunto, o None si no existe o ha caducado. Cada uso renueva el TTL.
+    La primera vez ejecuta la receta y guarda los ids; si los datos han cambiado desde que
+    se creó el conjunto ya no serían los de la respuesta, así que también devuelve None.
+    """
+    conn = _conexion_cache()
+    if not _renovar_conjuntos(conn, [conjunto]):
+        return None
+    fila = conn.execute("SELECT receta, version, ids FROM conjuntos WHERE id = ?", (conjunto,)).fetchone()
+    if fila is None:
+        return None
+    receta, version, datos = fila
+    if datos is not None:
+        return array("q", zlib.decompress(datos)).tolist()
+    if version != version_dataset():
+        return None
+
+    nombre, args = json.loads(receta)
+    ids, datos = _comprimir_ids(getattr(db_manager, nombre)(*args))
+    if len(datos) <= CONJUNTO_MAX_BYTES:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE conjuntos SET ids = ?, n = ?, tam = ? WHERE id = ?",
+                (datos, len(ids), len(receta) + len(datos), conjunto),
+            )
+            _desalojar_conjuntos(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return ids.tolist()
+
+
+def estadisticas_cache():
+    conn = _conexion_cache()
+    entradas, bytes_total = conn.execute("SELECT COUNT(*), COALESCE(SUM(tam), 0) FROM entradas").fetchone()
+    conjuntos, bytes_conjuntos = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(tam), 0) FROM conjuntos WHERE expira > ?", (time.time(),)
+    ).fetchone()
+    generacion = conn.execute("SELECT valor FROM meta WHERE nombre = 'generacion'").fetchone()[0]
+    por_endpoint = {}
+    for endpoint, aciertos, fallos, grandes in conn.execute(
+        "SELECT endpoint, aciertos, fallos, grandes FROM contadores ORDER BY endpoint"
+    ):
+        peticiones = aciertos + fallos
+        por_endpoint[endpoint] = {
+            "aciertos": aciertos,
+            "fallos": fallos,
+            "demasiado_grandes": grandes,
+            "tasa_aciertos": round(aciertos / peticiones, 4) if peticiones else 0.0,
+        }
+    return {
+        "entradas": entradas,
+        "bytes": bytes_total,
+        "max_bytes": CACHE_MAX_BYTES_TOTAL,
+        "max_bytes_entrada": CACHE_MAX_BYTES_ENTRADA,
+        "generacion": generacion,
+        "version_datos": _version_actual(),
+        "aciertos": sum(e["aciertos"] for e in por_endpoint.values()),
+        "fallos": sum(e["fallos"] for e in por_endpoint.values()),
+        "por_endpoint": por_endpoint,
+        "conjuntos": {
+            "vivos": conjuntos,
+            "bytes": bytes_conjuntos,
+            "max_bytes": CONJUNTOS_MAX_BYTES_TOTAL,
+            "ttl_s": CONJUNTO_TTL_S,
+        },
+    }
@@ -0,0 +1,200 @@
+import contextvars
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import anyio
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+
+from cache_respuestas import sin_cache
+from db_manager import explicar_consulta
+
+
+# =========================================
+#  Registro de consultas lentas
+# =========================================
+
+# Toda consulta de db_manager que tarda más de UMBRAL_CONSULTA_LENTA_MS se anota en
+# logs/consultas_lentas.log (rotativo) con sus parámetros. A una fracción de ellas
+# (MUESTREO_PLANES) se le captura además el plan con EXPLAIN (ANALYZE, BUFFERS): vuelve
+# a ejecutar la consulta, así que se hace en un hilo aparte, sin retrasar la petición, y
+# con una cola acotada (si se llena, esos planes se pierden).
+# Cada worker rota su propio manejador: con varios workers conviene un log por proceso
+# o un umbral alto.
+
+UMBRAL_CONSULTA_LENTA_MS = float(os.environ.get("UMBRAL_CONSULTA_LENTA_MS", "500"))
+MUESTREO_PLANES = float(os.environ.get("MUESTREO_PLANES_LENTAS", "0.1"))
+DIR_LOGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+LOG_CONSULTAS_LENTAS = os.path.join(DIR_LOGS, "consultas_lentas.log")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_COPIAS = 5
+MAX_PLANES_PENDIENTES = 20
+MAX_CARACTERES_PARAMS = 2000   # listas de miles de ids no caben en una línea de log
+
+logger = logging.getLogger("consultas_lentas")
+logger.propagate = False
+
+_planes = queue.Queue(maxsize=MAX_PLANES_PENDIENTES)
+_hilo_planes = None
+_hilo_lock = threading.Lock()
+
+# Consultas de la petición en curso cuando se pide ?explain=1 (ver ExplainMiddleware)
+_capturadas = contextvars.ContextVar("consultas_capturadas", default=None)
+
+
+def iniciar_registro():
+    """Abre logs/consultas_lentas.log (idempotente). FastAPI lo llama al arrancar."""
+    if logger.handlers:
+        return
+    os.makedirs(DIR_LOGS, exist_ok=True)
+    manejador = RotatingFileHandler(LOG_CONSULTAS_LENTAS, maxBytes=LOG_MAX_BYTES,
+                                    backupCount=LOG_COPIAS, encoding="utf-8")
+    manejador.setFormatter(logging.Formatter("%(asctime)s [pid %(process)d] %(message)s"))
+    logger.addHandler(manejador)
+    logger.setLevel(logging.INFO)
+
+
+def _texto_params(params):
+    texto = repr(params)
+    return texto if len(texto) <= MAX_CARACTERES_PARAMS else texto[:MAX_CARACTERES_PARAMS] + "...(truncado)"
+
+
+def anotar_consulta(nombre, query, params, segundos, filas=None, error=None):
+    """Observador para db_manager.observar_consultas()."""
+    capturadas = _capturadas.get()
+    if capturadas is not None:
+        capturadas.append({"consulta": nombre, "query": query, "params": params,
+                           "segundos": round(segundos, 6), "filas": filas,
+                           "error": None if error is None else str(error)})
+
+    if segundos * 1000 < UMBRAL_CONSULTA_LENTA_MS:
+        return
+    logger.warning("LENTA %s %.1f ms filas=%s error=%s params=%s\n%s", nombre, segundos * 1000, filas,
+                   error, _texto_params(params), query.strip())
+    if error is None and random.random() < MUESTREO_PLANES:
+        _encolar_plan(nombre, query, params)
+
+
+def _encolar_plan(nombre, query, params):
+    global _hilo_planes
+    with _hilo_lock:
+        if _hilo_planes is None:
+            _hilo_planes = threading.Thread(target=_capturar_planes, name="planes-consultas-lentas", daemon=True)
+            _hilo_planes.start()
+    try:
+        _planes.put_nowait((nombre, query, params))
+    except queue.Full:
+        pass
+
+
+def _capturar_planes():
+    while True:
+        nombre, query, params = _planes.get()
+        try:
+            plan = explicar_consulta(query, params, formato="texto")
+            logger.warning("PLAN %s params=%s\n%s", nombre, _texto_params(params), plan)
+        except Exception as e:
+            logger.warning("PLAN %s no disponible: %s", nombre, e)
+
+
+# =========================================
+#  Modo explain (?explain=1) para administradores
+# =========================================
+
+# En las rutas de análisis, ?explain=1 con la cabecera X-Admin-Token igual a la variable
+# de entorno ADMIN_TOKEN añade a la respuesta "_explain": cada consulta SQL que ha
+# ejecutado la petición con su tiempo, sus filas, sus parámetros y su plan de
+# EXPLAIN (ANALYZE, BUFFERS). Se salta la caché de respuestas y el ETag, y la respuesta
+# no se guarda en ningún sitio. Sin ADMIN_TOKEN en el entorno el modo está desactivado.
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def _pide_explain(query_string):
+    for parte in query_string.split("&"):
+        nombre, _, valor = parte.partition("=")
+        if nombre == "explain" and valor.lower() in ("1", "true"):
+            return True
+    return False
+
+
+def _token_valido(token):
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def _explicar(capturadas):
+    for consulta in capturadas:
+        if consulta["error"] is not None:
+            continue
+        try:
+            consulta["plan"] = explicar_consulta(consulta["query"], consulta["params"])
+        except Exception as e:
+            consulta["plan"] = None
+            consulta["error_plan"] = str(e)
+    return capturadas
+
+
+class ExplainMiddleware:
+
+    def __init__(self, app, rutas):
+        self.app = app
+        self.rutas = tuple(rutas)
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.rutas)
+                or not _pide_explain(scope["query_string"].decode("latin-1"))):
+            await self.app(scope, receive, send)
+            return
+
+        cabeceras = dict(scope["headers"])
+        if not _token_valido(cabeceras.get(b"x-admin-token", b"").decode("latin-1") or None):
+            respuesta = JSONResponse({"detail": "explain=1 solo está disponible para administradores."},
+                                     status_code=403)
+            await respuesta(scope, receive, send)
+            return
+
+        # Sin If-None-Match: la petición siempre se ejecuta entera. Se cambia en el mismo scope
+        # (no en una copia) para que la ruta que deja FastAPI llegue a MetricasMiddleware
+        scope["headers"] = [(k, v) for k, v in scope["headers"] if k != b"if-none-match"]
+        capturadas = []
+        token_capturadas = _capturadas.set(capturadas)
+        token_cache = sin_cache.set(True)
+        inicio = time.perf_counter()
+        mensajes = []
+
+        async def guardar(message):
+            mensajes.append(message)
+
+        try:
+            await self.app(scope, receive, guardar)
+        finally:
+            _capturadas.reset(token_capturadas)
+            sin_cache.reset(token_cache)
+        duracion = time.perf_counter() - inicio
+
+        inicio_respuesta = mensajes[0]
+        cuerpo = b"".join(m.get("body", b"") for m in mensajes[1:])
+        cabeceras = MutableHeaders(scope=inicio_respuesta)
+        if inicio_respuesta["status"] == 200 and cabeceras.get("content-type", "").startswith("application/json"):
+            datos = json.loads(cuerpo)
+            explain = {
+                "duracion_s": round(duracion, 6),
+                "sql_s": round(sum(c["segundos"] for c in capturadas), 6),
+                "consultas": await anyio.to_thread.run_sync(_explicar, capturadas),
+            }
+            datos = {**datos, "_explain": explain} if isinstance(datos, dict) else {"datos": datos, "_explain": explain}
+            cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8")
+            cabeceras["content-length"] = str(len(cuerpo))
+            if "etag" in cabeceras:
+                del cabeceras["etag"]
+            cabeceras["cache-control"] = "no-store"
+
+        await send(inicio_respuesta)
+        await send({"type": "http.response.body", "body": cuerpo})
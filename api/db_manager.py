@@ -1,7 +1,11 @@
 import psycopg2
 import json
+import threading
+import time
 from collections import Counter, defaultdict
+from contextlib import contextmanager
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from typing import Optional, List, Dict, Any
 
 
@@ -13,39 +17,293 @@ DB_PARAMS = {
     'port': 5432
 }
 
+# =========================================
+#  Pool de conexiones
+# =========================================
+
+# Un pool por proceso (cada worker de uvicorn tiene el suyo). El máximo se dimensiona
+# frente al threadpool de FastAPI/anyio (40 hilos por defecto): si hay más hilos que
+# conexiones, los que sobran esperan en obtener() y se ve en 'esperando'/'espera_*'.
+POOL_MIN_CONEXIONES = 2
+POOL_MAX_CONEXIONES = 20
+POOL_TIMEOUT_ESPERA = 30  # segundos esperando una conexión libre antes de dar error
+
+
+class PoolConexiones:
+    """
+    ThreadedConnectionPool con espera bloqueante cuando está lleno (el de psycopg2
+    lanza PoolError directamente) y estadísticas de uso.
+    """
+
+    def __init__(self, minconn, maxconn, **params):
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **params)
+        self._huecos = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.maxconn = maxconn
+        self.en_uso = 0
+        self.esperando = 0
+        self.total_obtenidas = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def obtener(self, timeout=POOL_TIMEOUT_ESPERA):
+        inicio = time.perf_counter()
+        with self._lock:
+            self.esperando += 1
+        try:
+            if not self._huecos.acquire(timeout=timeout):
+                raise PoolError(f"No hay conexiones libres tras {timeout}s de espera")
+        finally:
+            with self._lock:
+                self.esperando -= 1
+        espera = time.perf_counter() - inicio
+
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._huecos.release()
+            raise
+
+        with self._lock:
+            self.en_uso += 1
+            self.total_obtenidas += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+        return conn
+
+    def devolver(self, conn):
+        try:
+            # putconn hace rollback si quedó una transacción abierta y descarta las rotas
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            with self._lock:
+                self.en_uso -= 1
+            self._huecos.release()
+
+    def cerrar(self):
+        self._pool.closeall()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "max_conexiones": self.maxconn,
+                "en_uso": self.en_uso,
+                "libres": self.maxconn - self.en_uso,
+                "esperando": self.esperando,
+                "total_obtenidas": self.total_obtenidas,
+                "espera_total_s": round(self.espera_total, 6),
+                "espera_media_s": round(self.espera_total / self.total_obtenidas, 6) if self.total_obtenidas else 0.0,
+                "espera_max_s": round(self.espera_max, 6),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def iniciar_pool(minconn=POOL_MIN_CONEXIONES, maxconn=POOL_MAX_CONEXIONES):
+    """Crea el pool del proceso (idempotente). FastAPI lo llama al arrancar."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolConexiones(minconn, maxconn, **DB_PARAMS)
+        return _pool
+
+def cerrar_pool():
+    """Cierra todas las conexiones del pool. FastAPI lo llama al parar."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+
+def estadisticas_pool():
+    pool = _pool
+    return pool.estadisticas() if pool is not None else None
+
+@contextmanager
+def conexion():
+    """
+    Presta una conexión del pool durante el bloque 'with'. Al salir hace commit
+    (o rollback si hubo excepción) y la devuelve al pool.
+    """
+    pool = _pool or iniciar_pool()  # scripts que usan db_manager sin pasar por FastAPI
+    conn = pool.obtener()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.devolver(conn)
+
+# =========================================
+#  Ejecución de consultas
+# =========================================
+
+# Funciones a las que se avisa tras cada consulta con (nombre, query, params, segundos,
+# filas, error): filas es None si no se conoce (cursores de servidor) y error la excepción
+# si la consulta falló. Las registran herramientas externas con observar_consultas()
+# (p. ej. la comprobación de planes de migraciones/comprobar_planes.py o las métricas de
+# la API) sin tocar las funciones de consulta.
+_observadores = []
+
+def observar_consultas(funcion):
+    _observadores.append(funcion)
+    return funcion
+
+def _ejecutar(cur, nombre, query, params=None):
+    inicio = time.perf_counter()
+    try:
+        cur.execute(query, params)
+    except Exception as e:
+        segundos = time.perf_counter() - inicio
+        for observador in _observadores:
+            observador(nombre, query, params, segundos, None, e)
+        raise
+    segundos = time.perf_counter() - inicio
+    filas = cur.rowcount if cur.rowcount >= 0 else None
+    for observador in _observadores:
+        observador(nombre, query, params, segundos, filas, None)
+
+EXPLAIN_TIMEOUT_MS = 60000
+
+def explicar_consulta(query, params=None, formato="json"):
+    """
+    Ejecuta la consulta con EXPLAIN (ANALYZE, BUFFERS) y devuelve su plan (JSON o texto).
+    ANALYZE la ejecuta de verdad, así que va en una transacción de solo lectura que se
+    deshace: si la consulta escribe, falla en vez de escribir. No avisa a los observadores.
+    """
+    with conexion() as conn, conn.cursor() as cur:
+        try:
+            cur.execute("SET TRANSACTION READ ONLY")
+            cur.execute("SET LOCAL statement_timeout = %s", (EXPLAIN_TIMEOUT_MS,))
+            cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT {'JSON' if formato == 'json' else 'TEXT'}) " + query, params)
+            filas = cur.fetchall()
+        finally:
+            conn.rollback()
+    return filas[0][0][0] if formato == "json" else "\n".join(f[0] for f in filas)
+
+def version_datos():
+    """
+    Versión del dataset: el contador que incrementa refrescar_agregados() al final de cada
+    carga (migraciones/007_version_datos.sql), así que cambia aunque se importe dos veces el mismo día.
+    """
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "version_datos", "SELECT version FROM version_datos")
+        fila = cur.fetchone()
+    return str(fila[0]) if fila else None
+
 def get_connection():
-    return psycopg2.connect(**DB_PARAMS)
+    """Dependencia de FastAPI: conexión del pool que se devuelve al acabar la petición."""
+    with conexion() as conn:
+        yield conn
 
 # 1. Ranking general de autores
+def limites_anios():
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "limites_anios", "SELECT MIN(year), MAX(year) FROM conference_editions")
+        return cur.fetchone()
+
 def ranking_autores(year_start=None, year_end=None):
-    conn = get_connection(); cur = conn.cursor()
+    # Suma sobre el agregado author_year_counts (no recorre paper_authors)
     query = '''
-        SELECT a.full_name, COUNT(DISTINCT p.id) AS total
-        FROM authors a
-        JOIN paper_authors pa ON a.id = pa.author_id
-        JOIN papers p ON pa.paper_id = p.id
-        JOIN conference_editions ce ON p.edition_id = ce.id
+        SELECT a.full_name, SUM(ayc.papers) AS total
+        FROM author_year_counts ayc
+        JOIN authors a ON a.id = ayc.author_id
     '''
     filtros, params = [], []
     if year_start is not None:
-        filtros.append('ce.year >= %s')
+        filtros.append('ayc.year >= %s')
         params.append(int(year_start))
     if year_end is not None:
-        filtros.append('ce.year <= %s')
+        filtros.append('ayc.year <= %s')
         params.append(int(year_end))
     if filtros:
         query += ' WHERE ' + ' AND '.join(filtros)
     query += ' GROUP BY a.full_name ORDER BY total DESC LIMIT 20'
-    cur.execute(query, tuple(params))
-    data = cur.fetchall()
-    cur.close(); conn.close()
-    return data
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "ranking_autores", query, tuple(params))
+        return cur.fetchall()
+
+
+def _papers_del_conjunto(desde, filtros, params, ids="full", despues=None, limite=None):
+    """
+    Dos columnas (SQL, params) con los papers distintos de 'desde' (FROM ... con papers p)
+    que cumplen 'filtros', según 'ids':
+      full -> NULL y todos los ids ordenados
+      none -> cuántos son (COUNT DISTINCT) y NULL: no se construye la lista
+      page -> cuántos son y los limite + 1 siguientes a 'despues' por clave (p.id > despues);
+              el de más indica si hay página siguiente
+    """
+    where = ('WHERE ' + ' AND '.join(filtros)) if filtros else ''
+    if ids == 'full':
+        return f'NULL, (SELECT array_agg(DISTINCT p.id ORDER BY p.id) {desde} {where})', list(params)
+    total = f'(SELECT COUNT(DISTINCT p.id) {desde} {where})'
+    if ids == 'none':
+        return f'{total}, NULL', list(params)
+    filtros_pagina, params_pagina = list(filtros), list(params)
+    if despues is not None:
+        filtros_pagina.append('p.id > %s')
+        params_pagina.append(int(despues))
+    pagina = f'''(SELECT array_agg(id ORDER BY id) FROM (
+                SELECT DISTINCT p.id {desde} {'WHERE ' + ' AND '.join(filtros_pagina) if filtros_pagina else ''}
+                ORDER BY p.id LIMIT %s) pagina)'''
+    return f'{total}, {pagina}', list(params) + params_pagina + [int(limite) + 1]
+
+
+def ranking_autores_con_ids(year_start=None, year_end=None, ids="full", despues=None, limite=None):
+    """
+    Top-20 de autores y los papers (sin duplicados, ordenados por id) de esos autores
+    en el rango, en un solo viaje a la BD. Devuelve ([(full_name, total), ...], nº de papers,
+    [paper_id, ...]); 'ids', 'despues' y 'limite' como en _papers_del_conjunto.
+    El ranking sale de author_year_counts; solo los ids de esos 20 autores tocan paper_authors.
+    """
+    filtros_ayc, filtros_ce, params = [], [], []
+    if year_start is not None:
+        filtros_ayc.append('ayc.year >= %s')
+        filtros_ce.append('ce.year >= %s')
+        params.append(int(year_start))
+    if year_end is not None:
+        filtros_ayc.append('ayc.year <= %s')
+        filtros_ce.append('ce.year <= %s')
+        params.append(int(year_end))
+    where_ayc = 'WHERE ' + ' AND '.join(filtros_ayc) if filtros_ayc else ''
+    columnas_ids, params_ids = _papers_del_conjunto('''
+             FROM top t
+             JOIN authors a ON a.full_name = t.full_name
+             JOIN paper_authors pa ON pa.author_id = a.id
+             JOIN papers p ON pa.paper_id = p.id
+             JOIN conference_editions ce ON p.edition_id = ce.id''', filtros_ce, params, ids, despues, limite)
+
+    query = f'''
+        WITH top AS (
+            SELECT a.full_name, SUM(ayc.papers) AS total
+            FROM author_year_counts ayc
+            JOIN authors a ON a.id = ayc.author_id
+            {where_ayc}
+            GROUP BY a.full_name
+            ORDER BY total DESC, a.full_name
+            LIMIT 20
+        )
+        SELECT
+            (SELECT json_agg(json_build_array(full_name, total) ORDER BY total DESC, full_name) FROM top),
+            {columnas_ids}
+    '''
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "ranking_autores_con_ids", query, tuple(params + params_ids))
+        ranking, total, paper_ids = cur.fetchone()
+    paper_ids = paper_ids or []
+    return [tuple(r) for r in ranking or []], len(paper_ids) if total is None else total, paper_ids
 
 
+def obtener_ids_papers_ranking_autores(year_start=None, year_end=None):
+    # Solo los ids (para exportar el conjunto de /ranking/autores)
+    return ranking_autores_con_ids(year_start, year_end)[2]
 
 
 def obtener_ids_papers_por_autor(nombre, year_start=None, year_end=None):
-    conn = get_connection(); cur = conn.cursor()
     query = """
         SELECT DISTINCT p.id
         FROM papers p
@@ -62,84 +320,121 @@ def obtener_ids_papers_por_autor(nombre, year_start=None, year_end=None):
         query += " AND ce.year <= %s"
         params.append(int(year_end))
 
-    cur.execute(query, tuple(params))
-    ids = [r[0] for r in cur.fetchall()]
-    cur.close(); conn.close()
-    return ids
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_ids_papers_por_autor", query, tuple(params))
+        return [r[0] for r in cur.fetchall()]
 
 
-# 2. Ranking autores por conferencia
-def ranking_por_conferencia(conferencia, year_start=None, year_end=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        query = '''
-            SELECT a.full_name, COUNT(p.id) AS total
+def contar_papers_autor(nombre):
+    # Solo el número de papers del autor (lectura directa de author_year_counts)
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "contar_papers_autor", '''
+            SELECT COALESCE(SUM(ayc.papers), 0)
             FROM authors a
-            JOIN paper_authors pa ON a.id = pa.author_id
-            JOIN papers p ON pa.paper_id = p.id
-            JOIN conference_editions ce ON p.edition_id = ce.id
-            JOIN conferences c ON ce.conference_id = c.id
-            WHERE c.name ILIKE %s
-        '''
-        params = [f"{conferencia} %"] 
+            JOIN author_year_counts ayc ON ayc.author_id = a.id
+            WHERE a.full_name = %s
+        ''', (nombre,))
+        return int(cur.fetchone()[0])
+
+
+# 2. Ranking autores por conferencia
+def conferencias_unicas():
+    # Nombre de la serie (lo que va antes del año, p. ej. "CHI" en "CHI '20: ...")
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "conferencias_unicas", """
+            SELECT DISTINCT serie
+            FROM conferences
+            WHERE name LIKE '%''%'
+            ORDER BY 1
+        """)
+        return [row[0] for row in cur.fetchall()]
 
-        if year_start:
-            query += ' AND ce.year >= %s'
-            params.append(year_start)
-        if year_end:
-            query += ' AND ce.year <= %s'
-            params.append(year_end)
+def ranking_por_conferencia(conferencia, year_start=None, year_end=None):
+    query = '''
+        SELECT a.full_name, COUNT(p.id) AS total
+        FROM authors a
+        JOIN paper_authors pa ON a.id = pa.author_id
+        JOIN papers p ON pa.paper_id = p.id
+        JOIN conference_editions ce ON p.edition_id = ce.id
+        JOIN conferences c ON ce.conference_id = c.id
+        WHERE c.serie = %s
+    '''
+    params = [conferencia]
 
-        query += ' GROUP BY a.full_name ORDER BY total DESC LIMIT 20'
+    if year_start:
+        query += ' AND ce.year >= %s'
+        params.append(year_start)
+    if year_end:
+        query += ' AND ce.year <= %s'
+        params.append(year_end)
 
-        cur.execute(query, tuple(params))
-        data = cur.fetchall()
-        return data
+    query += ' GROUP BY a.full_name ORDER BY total DESC LIMIT 20'
 
+    try:
+        with conexion() as conn, conn.cursor() as cur:
+            _ejecutar(cur, "ranking_por_conferencia", query, tuple(params))
+            return cur.fetchall()
     except Exception as e:
         print("ERROR en ranking_por_conferencia:", e)
         raise
-    finally:
-        cur.close()
-        conn.close()
 
-def get_paper_ids_from_authors_conferencia(authors, conferencia, year_start=None, year_end=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        query = '''
-            SELECT DISTINCT p.id
-            FROM papers p
-            JOIN paper_authors pa ON p.id = pa.paper_id
-            JOIN authors a ON pa.author_id = a.id
+def ranking_por_conferencia_con_ids(conferencia, year_start=None, year_end=None, ids="full", despues=None, limite=None):
+    """
+    Igual que ranking_autores_con_ids pero limitado a una conferencia: top-20 de
+    autores y sus papers en esa conferencia, en una sola consulta.
+    """
+    filtros, params = ['c.serie = %s'], [conferencia]
+    if year_start:
+        filtros.append('ce.year >= %s')
+        params.append(year_start)
+    if year_end:
+        filtros.append('ce.year <= %s')
+        params.append(year_end)
+    where_clause = 'WHERE ' + ' AND '.join(filtros)
+    columnas_ids, params_ids = _papers_del_conjunto('''
+             FROM top t
+             JOIN authors a ON a.full_name = t.full_name
+             JOIN paper_authors pa ON pa.author_id = a.id
+             JOIN papers p ON pa.paper_id = p.id
+             JOIN conference_editions ce ON p.edition_id = ce.id
+             JOIN conferences c ON ce.conference_id = c.id''', filtros, params, ids, despues, limite)
+
+    query = f'''
+        WITH top AS (
+            SELECT a.full_name, COUNT(p.id) AS total
+            FROM authors a
+            JOIN paper_authors pa ON a.id = pa.author_id
+            JOIN papers p ON pa.paper_id = p.id
             JOIN conference_editions ce ON p.edition_id = ce.id
             JOIN conferences c ON ce.conference_id = c.id
-            WHERE a.full_name = ANY(%s)
-              AND c.name ILIKE %s
-        '''
-        params = [authors, f"{conferencia} %"]
-
-        if year_start:
-            query += ' AND ce.year >= %s'
-            params.append(year_start)
-        if year_end:
-            query += ' AND ce.year <= %s'
-            params.append(year_end)
-
-        cur.execute(query, tuple(params))
-        return [row[0] for row in cur.fetchall()]
-    finally:
-        cur.close()
-        conn.close()
+            {where_clause}
+            GROUP BY a.full_name
+            ORDER BY total DESC, a.full_name
+            LIMIT 20
+        )
+        SELECT
+            (SELECT json_agg(json_build_array(full_name, total) ORDER BY total DESC, full_name) FROM top),
+            {columnas_ids}
+    '''
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "ranking_por_conferencia_con_ids", query, tuple(params + params_ids))
+        ranking, total, paper_ids = cur.fetchone()
+    paper_ids = paper_ids or []
+    return [tuple(r) for r in ranking or []], len(paper_ids) if total is None else total, paper_ids
+
+
+def obtener_ids_papers_ranking_conferencia(conferencia, year_start=None, year_end=None):
+    # Solo los ids (para exportar el conjunto de /ranking/conferencia)
+    return ranking_por_conferencia_con_ids(conferencia, year_start, year_end)[2]
 
 # 3. Palabras clave más usadas
 def palabras_clave_mas_usadas(year_start=None, year_end=None, top_n=None, return_total=False):
-    conn = get_connection()
-    cur = conn.cursor()
-    
+    # Conteo y top-N en Postgres sobre paper_keywords (keywords ya normalizadas al importar).
+    # 'total' = nº de pares (paper, keyword) del rango, calculado antes del LIMIT.
     query = '''
-        SELECT p.keywords FROM papers p
+        SELECT pk.keyword, COUNT(*) AS n, SUM(COUNT(*)) OVER ()::bigint AS total
+        FROM paper_keywords pk
+        JOIN papers p ON p.id = pk.paper_id
         JOIN conference_editions ce ON p.edition_id = ce.id
     '''
     filtros, params = [], []
@@ -151,52 +446,44 @@ def palabras_clave_mas_usadas(year_start=None, year_end=None, top_n=None, return
         params.append(year_end)
     if filtros:
         query += ' WHERE ' + ' AND '.join(filtros)
+    query += ' GROUP BY pk.keyword ORDER BY n DESC, pk.keyword'
+    if top_n is not None:
+        query += ' LIMIT %s'
+        params.append(top_n)
 
-    cur.execute(query, tuple(params))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "palabras_clave_mas_usadas", query, tuple(params))
+        rows = cur.fetchall()
 
-    all_keywords = []
-    for row in rows:
-        if row[0]:
-            keywords = [kw.strip().lower() for kw in row[0].split(',') if kw.strip()]
-            all_keywords.extend(keywords)
-
-    count = Counter(all_keywords)
-    total = sum(count.values())
+    top = [(kw, n) for kw, n, _total in rows]
+    total = rows[0][2] if rows else 0
 
     if return_total:
-        return count.most_common(top_n), total
+        return top, total
     else:
-        return count.most_common(top_n)
-
-from typing import List, Optional
+        return top
 
 def obtener_ids_papers_por_keywords(
     lista_keywords: List[str],
     year_start: Optional[int] = None,
     year_end: Optional[int] = None
 ):
-    # Sanitizar/normalizar entrada
-    kws = [kw.strip() for kw in (lista_keywords or []) if kw and kw.strip()]
+    # Sanitizar/normalizar entrada igual que normalizar_keywords() en la BD
+    kws = [kw.strip().lower() for kw in (lista_keywords or []) if kw and kw.strip()]
     if not kws:
         return []
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    # Construir los OR de forma parametrizada
-    kw_filters = ' OR '.join(["p.keywords ILIKE %s" for _ in kws])
-
-    query = f"""
+    # Igualdad exacta sobre paper_keywords (índice por keyword), así los ids
+    # coinciden con los conteos de palabras_clave_mas_usadas
+    query = """
         SELECT DISTINCT p.id
-        FROM papers p
+        FROM paper_keywords pk
+        JOIN papers p ON p.id = pk.paper_id
         JOIN conference_editions ce ON p.edition_id = ce.id
-        WHERE ({kw_filters})
+        WHERE pk.keyword = ANY(%s)
     """
 
-    params = [f"%{kw}%" for kw in kws]
+    params = [kws]
 
     # Filtros de año robustos (permiten 0 y strings)
     if year_start is not None:
@@ -206,11 +493,9 @@ def obtener_ids_papers_por_keywords(
         query += " AND ce.year <= %s"
         params.append(int(year_end))
 
-    cur.execute(query, tuple(params))
-    ids = [r[0] for r in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return ids
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_ids_papers_por_keywords", query, tuple(params))
+        return [r[0] for r in cur.fetchall()]
 
 
 # 4. Estadísticas de publicaciones españolas
@@ -229,144 +514,365 @@ def publicaciones_espanolas_por_anio(year_start=None, year_end=None):
     return sorted(resultados, key=lambda x: x["year"])
 
 
+def obtener_ids_papers_por_anios(year_start=None, year_end=None):
+    query = """
+        SELECT p.id
+        FROM papers p
+        JOIN conference_editions ce ON p.edition_id = ce.id
+        WHERE TRUE
+    """
+    params = []
+    if year_start:
+        query += " AND ce.year >= %s"
+        params.append(year_start)
+    if year_end:
+        query += " AND ce.year <= %s"
+        params.append(year_end)
+
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_ids_papers_por_anios", query, tuple(params))
+        return [row[0] for row in cur.fetchall()]
+
+
 # 5. Evolución de un autor
 def evolucion_autor(full_name, year_start=None, year_end=None):
-    conn = get_connection()
-    cur = conn.cursor()
-
     query = '''
-        SELECT ce.year, COUNT(p.id)
+        SELECT ayc.year, SUM(ayc.papers)
         FROM authors a
-        JOIN paper_authors pa ON a.id = pa.author_id
-        JOIN papers p ON pa.paper_id = p.id
-        JOIN conference_editions ce ON p.edition_id = ce.id
+        JOIN author_year_counts ayc ON ayc.author_id = a.id
         WHERE a.full_name = %s
     '''
     params = [full_name]
 
     if year_start is not None:
-        query += ' AND ce.year >= %s'
+        query += ' AND ayc.year >= %s'
         params.append(year_start)
     if year_end is not None:
-        query += ' AND ce.year <= %s'
+        query += ' AND ayc.year <= %s'
         params.append(year_end)
 
-    query += ' GROUP BY ce.year ORDER BY ce.year'
+    query += ' GROUP BY ayc.year ORDER BY ayc.year'
 
-    cur.execute(query, params)
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "evolucion_autor", query, params)
+        data = cur.fetchall()
 
     return [{"year": r[0], "total": r[1]} for r in data]
 
 # 6. Pares de co-autores con más papers
 def top_coauthor_pairs(year_start=None, year_end=None, top_n=20, min_papers=1):
-    conn = get_connection()
-    cur = conn.cursor()
-    query = '''
+    # Suma sobre coauthor_pairs (papers por pareja y año, la mantiene el importador) en vez de
+    # cruzar paper_authors consigo misma. Se agrupa por ids y solo las parejas del top (con los
+    # empates del último puesto) van a authors a por el nombre para desempatar como siempre.
+    filtros, params = [], []
+    if year_start is not None:
+        filtros.append('cp.year >= %s')
+        params.append(year_start)
+    if year_end is not None:
+        filtros.append('cp.year <= %s')
+        params.append(year_end)
+    query = f'''
+        WITH parejas AS (
+            SELECT cp.author_a, cp.author_b, SUM(cp.papers)::int AS total
+            FROM coauthor_pairs cp
+            {'WHERE ' + ' AND '.join(filtros) if filtros else ''}
+            GROUP BY cp.author_a, cp.author_b
+            HAVING SUM(cp.papers) >= %s
+            ORDER BY total DESC
+            FETCH FIRST (%s) ROWS WITH TIES
+        )
         SELECT
             LEAST(a1.full_name, a2.full_name) AS autor1,
             GREATEST(a1.full_name, a2.full_name) AS autor2,
-            COUNT(DISTINCT p.id) AS total
-        FROM paper_authors pa1
-        JOIN paper_authors pa2
-             ON pa1.paper_id = pa2.paper_id AND pa1.author_id < pa2.author_id
-        JOIN authors a1 ON a1.id = pa1.author_id
-        JOIN authors a2 ON a2.id = pa2.author_id
-        JOIN papers p   ON p.id   = pa1.paper_id
-        JOIN conference_editions ce ON ce.id = p.edition_id
-        WHERE TRUE
+            pr.total
+        FROM parejas pr
+        JOIN authors a1 ON a1.id = pr.author_a
+        JOIN authors a2 ON a2.id = pr.author_b
+        ORDER BY pr.total DESC, autor1, autor2
+        LIMIT %s
     '''
-    params = []
+    params.extend([min_papers, top_n, top_n])
+
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "top_coauthor_pairs", query, tuple(params))
+        return cur.fetchall()
+
+
+def datos_grafo_coautorias():
+    """
+    Lo necesario para construir el grafo de coautorías en memoria (grafo_coautorias.py):
+    ([(author_id, full_name)] ordenados por nombre, [(paper_id, year, author_id)]).
+    """
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "datos_grafo_coautorias", "SELECT id, full_name FROM authors ORDER BY full_name, id")
+        autores = cur.fetchall()
+        _ejecutar(cur, "datos_grafo_coautorias", '''
+            SELECT pa.paper_id, ce.year, pa.author_id
+            FROM paper_authors pa
+            JOIN papers p ON p.id = pa.paper_id
+            JOIN conference_editions ce ON ce.id = p.edition_id
+        ''')
+        return autores, cur.fetchall()
+
+
+def papers_por_pares(pairs, year_start=None, year_end=None, ids="full", despues=None, limite=None):
+    """
+    pairs: lista de tuplas (autor1, autor2) ya normalizadas (autor1 <= autor2).
+    Devuelve (nº de papers, [paper_id, ...]) sin duplicados y ordenados; 'ids', 'despues'
+    y 'limite' como en _papers_del_conjunto.
+
+    Todas las parejas van en una sola consulta como dos arrays paralelos: se
+    resuelven a ids de autor y se cruzan una vez con paper_authors.
+    """
+    if not pairs:
+        return 0, []
+
+    filtros, params = [], []
     if year_start is not None:
-        query += ' AND ce.year >= %s'
+        filtros.append('ce.year >= %s')
         params.append(year_start)
     if year_end is not None:
-        query += ' AND ce.year <= %s'
+        filtros.append('ce.year <= %s')
         params.append(year_end)
-
-    query += '''
-        GROUP BY autor1, autor2
-        HAVING COUNT(DISTINCT p.id) >= %s
-        ORDER BY total DESC, autor1, autor2
-        LIMIT %s
+    columnas_ids, params_ids = _papers_del_conjunto('''
+        FROM pares
+        JOIN paper_authors pa1 ON pa1.author_id = pares.id1
+        JOIN paper_authors pa2 ON pa2.author_id = pares.id2 AND pa2.paper_id = pa1.paper_id
+        JOIN papers p ON p.id = pa1.paper_id
+        JOIN conference_editions ce ON ce.id = p.edition_id''', filtros, params, ids, despues, limite)
+
+    query = f'''
+        WITH pares AS (
+            SELECT a1.id AS id1, a2.id AS id2
+            FROM unnest(%s::text[], %s::text[]) AS par(autor1, autor2)
+            JOIN authors a1 ON a1.full_name = par.autor1
+            JOIN authors a2 ON a2.full_name = par.autor2 AND a2.id <> a1.id
+        )
+        SELECT {columnas_ids}
     '''
-    params.extend([min_papers, top_n])
+    params_pares = [[a1 for a1, _ in pairs], [a2 for _, a2 in pairs]]
 
-    cur.execute(query, tuple(params))
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return data 
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "papers_por_pares", query, tuple(params_pares + params_ids))
+        total, paper_ids = cur.fetchone()
+    paper_ids = paper_ids or []
+    return len(paper_ids) if total is None else total, paper_ids
 
 
 def get_paper_ids_por_pares(pairs, year_start=None, year_end=None):
+    # Solo los ids (exportación de /estadisticas/coautorias)
+    return papers_por_pares(pairs, year_start, year_end)[1]
+
+
+def obtener_paper(paper_id):
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_paper", """
+            SELECT p.id, p.title, p.pages, p.publisher, p.abstract, p.doi, p.url, p.isbn, p.keywords,
+                   ce.year, ce.booktitle, c.name AS conference_name, e.name AS editorial, c.location
+            FROM papers p
+            JOIN conference_editions ce ON p.edition_id = ce.id
+            JOIN conferences c ON ce.conference_id = c.id
+            JOIN editorials e ON c.editorial_id = e.id
+            WHERE p.id = %s
+        """, (paper_id,))
+        return cur.fetchone()
+
+def obtener_autores_paper(paper_id):
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_autores_paper", """
+            SELECT a.full_name FROM authors a
+            JOIN paper_authors pa ON pa.author_id = a.id
+            WHERE pa.paper_id = %s
+            ORDER BY pa.author_order
+        """, (paper_id,))
+        return [r[0] for r in cur.fetchall()]
+
+def obtener_paper_completo(paper_id):
+    # Versión secuencial; la API lanza las dos consultas en paralelo (ver /papers/{paper_id})
+    return obtener_paper(paper_id), obtener_autores_paper(paper_id)
+
+
+def existen_papers(paper_ids):
+    # Comprobación barata antes de empezar a exportar (para poder responder 404)
+    if not paper_ids:
+        return False
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "existen_papers", "SELECT EXISTS (SELECT 1 FROM papers WHERE id = ANY(%s))", (list(paper_ids),))
+        return cur.fetchone()[0]
+
+
+# 8. Sugerencias (autocompletado)
+def terminos_sugerencias():
+    """(tipo, texto, peso) de todo lo que se puede sugerir; el peso es el nº de papers."""
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "terminos_sugerencias", """
+            SELECT 'autor', a.full_name, SUM(ayc.papers)::int
+            FROM authors a
+            JOIN author_year_counts ayc ON ayc.author_id = a.id
+            GROUP BY a.full_name
+            UNION ALL
+            SELECT 'keyword', keyword, COUNT(*)::int
+            FROM paper_keywords
+            GROUP BY keyword
+            UNION ALL
+            SELECT 'serie', c.serie, COUNT(p.id)::int
+            FROM conferences c
+            JOIN conference_editions ce ON ce.conference_id = c.id
+            JOIN papers p ON p.edition_id = ce.id
+            WHERE c.name LIKE '%''%'
+            GROUP BY c.serie
+        """)
+        return cur.fetchall()
+
+def sugerencias_aproximadas(texto, tipos, limite=10):
     """
-    pairs: lista de tuplas (autor1, autor2) ya normalizadas (autor1 <= autor2).
+    Coincidencias aproximadas con pg_trgm (para erratas o palabras cambiadas de orden):
+    [(tipo, texto, similitud), ...] de más a menos parecido.
     """
-    conn = get_connection()
-    cur = conn.cursor()
-    paper_ids = set()
+    partes = {
+        'autor':   "SELECT 'autor', full_name, similarity(full_name, %(q)s) FROM authors WHERE full_name %% %(q)s",
+        'keyword': "SELECT DISTINCT 'keyword', keyword, similarity(keyword, %(q)s) FROM paper_keywords WHERE keyword %% %(q)s",
+        'serie':   "SELECT DISTINCT 'serie', serie, similarity(serie, %(q)s) FROM conferences WHERE serie %% %(q)s",
+    }
+    query = " UNION ALL ".join(f"({partes[t]})" for t in tipos) + " ORDER BY 3 DESC, 2 LIMIT %(limite)s"
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "sugerencias_aproximadas", query, {"q": texto, "limite": limite})
+        return cur.fetchall()
+
+
+# 9. Búsqueda de texto completo (título y resumen)
+# papers.busqueda es un tsvector generado (migraciones/003_busqueda_texto_completo.sql):
+# título con peso A y resumen con peso B, con índice GIN. El texto admite la sintaxis de
+# websearch_to_tsquery: "frase exacta", OR y -excluir.
+CONFIG_BUSQUEDA = 'english'
+
+def _filtros_busqueda(texto, year_start, year_end, serie, country):
+    filtros, params = ["p.busqueda @@ websearch_to_tsquery(%s, %s)"], [CONFIG_BUSQUEDA, texto]
+    if year_start is not None:
+        filtros.append("ce.year >= %s"); params.append(year_start)
+    if year_end is not None:
+        filtros.append("ce.year <= %s"); params.append(year_end)
+    if serie:
+        filtros.append("c.serie = %s"); params.append(serie)
+    if country:
+        filtros.append("c.country = %s"); params.append(country)
+    return " AND ".join(filtros), params
 
-    base = '''
-        SELECT DISTINCT p.id
-        FROM papers p
-        JOIN paper_authors pa1 ON pa1.paper_id = p.id
-        JOIN paper_authors pa2 ON pa2.paper_id = p.id AND pa1.author_id <> pa2.author_id
-        JOIN authors a1 ON a1.id = pa1.author_id
-        JOIN authors a2 ON a2.id = pa2.author_id
-        JOIN conference_editions ce ON ce.id = p.edition_id
-        WHERE LEAST(a1.full_name, a2.full_name) = %s
-          AND GREATEST(a1.full_name, a2.full_name) = %s
-    '''
-    for (a1, a2) in pairs:
-        q = base
-        params = [a1, a2]
-        if year_start is not None:
-            q += ' AND ce.year >= %s'
-            params.append(year_start)
-        if year_end is not None:
-            q += ' AND ce.year <= %s'
-            params.append(year_end)
+def buscar_papers(texto, year_start=None, year_end=None, serie=None, country=None, pagina=1, por_pagina=20):
+    """
+    Papers que coinciden con 'texto', de más a menos relevante (ts_rank_cd), paginados.
+    Devuelve (total, filas); cada fila trae el título y un fragmento del resumen con las
+    coincidencias marcadas entre <mark> y </mark>.
+    """
+    where_clause, params = _filtros_busqueda(texto, year_start, year_end, serie, country)
+    # ts_headline es caro: solo se calcula para la página que se devuelve
+    query = f"""
+    WITH consulta AS (
+      SELECT websearch_to_tsquery(%s, %s) AS q
+    ),
+    coincidencias AS (
+      SELECT p.id, ts_rank_cd(p.busqueda, consulta.q) AS relevancia, COUNT(*) OVER () AS total
+      FROM papers p
+      JOIN conference_editions ce ON p.edition_id = ce.id
+      JOIN conferences c          ON ce.conference_id = c.id
+      CROSS JOIN consulta
+      WHERE {where_clause}
+      ORDER BY relevancia DESC, p.id
+      LIMIT %s OFFSET %s
+    )
+    SELECT m.total, p.id, ce.year, c.serie, c.country, p.doi, m.relevancia,
+           ts_headline(%s, p.title, consulta.q, 'HighlightAll=true, StartSel=<mark>, StopSel=</mark>') AS titulo,
+           ts_headline(%s, coalesce(p.abstract, ''), consulta.q,
+                       'MaxFragments=2, MaxWords=30, MinWords=10, StartSel=<mark>, StopSel=</mark>') AS fragmento
+    FROM coincidencias m
+    JOIN papers p               ON p.id = m.id
+    JOIN conference_editions ce ON p.edition_id = ce.id
+    JOIN conferences c          ON ce.conference_id = c.id
+    CROSS JOIN consulta
+    ORDER BY m.relevancia DESC, p.id
+    """
+    params = [CONFIG_BUSQUEDA, texto] + params + [por_pagina, (pagina - 1) * por_pagina, CONFIG_BUSQUEDA, CONFIG_BUSQUEDA]
+    with conexion() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        _ejecutar(cur, "buscar_papers", query, tuple(params))
+        filas = cur.fetchall()
+    if filas:
+        total = filas[0]["total"]
+    elif pagina > 1:
+        # Página fuera de rango: el total sigue siendo útil para el cliente
+        total = contar_resultados_busqueda(texto, year_start, year_end, serie, country)
+    else:
+        total = 0
+    for fila in filas:
+        del fila["total"]
+    return total, filas
 
-        cur.execute(q, tuple(params))
-        paper_ids.update([row[0] for row in cur.fetchall()])
+def contar_resultados_busqueda(texto, year_start=None, year_end=None, serie=None, country=None):
+    where_clause, params = _filtros_busqueda(texto, year_start, year_end, serie, country)
+    query = f"""
+    SELECT COUNT(*)
+    FROM papers p
+    JOIN conference_editions ce ON p.edition_id = ce.id
+    JOIN conferences c          ON ce.conference_id = c.id
+    WHERE {where_clause}
+    """
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "contar_resultados_busqueda", query, tuple(params))
+        return cur.fetchone()[0]
 
-    cur.close()
-    conn.close()
-    return list(paper_ids)
+def obtener_ids_papers_por_busqueda(texto, year_start=None, year_end=None, serie=None, country=None):
+    # Todos los resultados (sin paginar) para exportarlos
+    where_clause, params = _filtros_busqueda(texto, year_start, year_end, serie, country)
+    query = f"""
+    SELECT p.id
+    FROM papers p
+    JOIN conference_editions ce ON p.edition_id = ce.id
+    JOIN conferences c          ON ce.conference_id = c.id
+    WHERE {where_clause}
+    """
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_ids_papers_por_busqueda", query, tuple(params))
+        return [r[0] for r in cur.fetchall()]
 
 
-def obtener_paper_completo(paper_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT p.id, p.title, p.pages, p.publisher, p.abstract, p.doi, p.url, p.isbn, p.keywords,
-               ce.year, ce.booktitle, c.name AS conference_name, e.name AS editorial, c.location
-        FROM papers p
-        JOIN conference_editions ce ON p.edition_id = ce.id
-        JOIN conferences c ON ce.conference_id = c.id
-        JOIN editorials e ON c.editorial_id = e.id
-        WHERE p.id = %s
-    """, (paper_id,))
-    paper = cur.fetchone()
+# Tamaño de bloque para las exportaciones (filas por viaje al servidor)
+TAM_BLOQUE_EXPORTACION = 2000
 
-    cur.execute("""
-        SELECT a.full_name FROM authors a
-        JOIN paper_authors pa ON pa.author_id = a.id
-        WHERE pa.paper_id = %s
-    """, (paper_id,))
-    autores = [r[0] for r in cur.fetchall()]
+def iterar_papers_completos(paper_ids, tam_bloque=TAM_BLOQUE_EXPORTACION):
+    """
+    Generador que devuelve, por bloques de 'tam_bloque' filas, los papers indicados
+    con sus autores ya agregados ("A and B and C"). Una sola consulta con cursor
+    de servidor: la memoria no crece con el número de ids.
 
-    cur.close()
-    conn.close()
-    return paper, autores
+    Columnas: id, author, title, year, isbn, publisher, address, url, doi,
+              abstract, booktitle, pages, keywords, series
+    """
+    with conexion() as conn:
+        with conn.cursor(name="exportar_papers") as cur:
+            cur.itersize = tam_bloque
+            _ejecutar(cur, "iterar_papers_completos", """
+                SELECT p.id, au.author, p.title, ce.year, p.isbn, p.publisher, c.location,
+                       p.url, p.doi, p.abstract, ce.booktitle, p.pages, p.keywords, c.name
+                FROM papers p
+                JOIN conference_editions ce ON p.edition_id = ce.id
+                JOIN conferences c          ON ce.conference_id = c.id
+                JOIN editorials e           ON c.editorial_id = e.id
+                LEFT JOIN LATERAL (
+                    SELECT string_agg(btrim(a.full_name), ' and ' ORDER BY pa.author_order) AS author
+                    FROM paper_authors pa
+                    JOIN authors a ON a.id = pa.author_id
+                    WHERE pa.paper_id = p.id
+                ) au ON TRUE
+                WHERE p.id = ANY(%s)
+                ORDER BY p.id
+            """, (list(paper_ids),))
+            while True:
+                filas = cur.fetchmany(tam_bloque)
+                if not filas:
+                    break
+                yield filas
 
 
 def obtener_ids_papers_por_editorial(year_start=None, year_end=None):
-    conn = get_connection()
-    cur = conn.cursor()
     query = '''
         SELECT DISTINCT p.id
         FROM papers p
@@ -383,15 +889,11 @@ def obtener_ids_papers_por_editorial(year_start=None, year_end=None):
         params.append(year_end)
     if filtros:
         query += ' WHERE ' + ' AND '.join(filtros)
-    cur.execute(query, tuple(params))
-    ids = [r[0] for r in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return ids
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_ids_papers_por_editorial", query, tuple(params))
+        return [r[0] for r in cur.fetchall()]
 
 def obtener_ids_papers_por_conferencia(year_start=None, year_end=None):
-    conn = get_connection()
-    cur = conn.cursor()
     query = '''
         SELECT DISTINCT p.id
         FROM papers p
@@ -406,15 +908,11 @@ def obtener_ids_papers_por_conferencia(year_start=None, year_end=None):
         params.append(year_end)
     if filtros:
         query += ' WHERE ' + ' AND '.join(filtros)
-    cur.execute(query, tuple(params))
-    ids = [r[0] for r in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return ids
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_ids_papers_por_conferencia", query, tuple(params))
+        return [r[0] for r in cur.fetchall()]
 
 def autores_por_conferencia(conferencia, year_start=None, year_end=None):
-    conn = get_connection()
-    cur = conn.cursor()
     query = '''
         SELECT DISTINCT a.full_name
         FROM authors a
@@ -422,75 +920,32 @@ def autores_por_conferencia(conferencia, year_start=None, year_end=None):
         JOIN papers p ON pa.paper_id = p.id
         JOIN conference_editions ce ON p.edition_id = ce.id
         JOIN conferences c ON ce.conference_id = c.id
-        WHERE c.name ILIKE %s
+        WHERE c.serie = %s
     '''
-    params = [f"%{conferencia}%"]
+    params = [conferencia]
     if year_start:
         query += ' AND ce.year >= %s'
         params.append(year_start)
     if year_end:
         query += ' AND ce.year <= %s'
         params.append(year_end)
-    cur.execute(query, tuple(params))
-    data = cur.fetchall()
-    cur.close()
-    conn.close()
-    return [r[0] for r in data]
-
-def ranking_por_conferencia(conferencia, year_start=None, year_end=None):
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        query = '''
-            SELECT a.full_name, COUNT(p.id) AS total
-            FROM authors a
-            JOIN paper_authors pa ON a.id = pa.author_id
-            JOIN papers p ON pa.paper_id = p.id
-            JOIN conference_editions ce ON p.edition_id = ce.id
-            JOIN conferences c ON ce.conference_id = c.id
-            WHERE c.name ILIKE %s
-        '''
-        params = [f"{conferencia} %"] 
-
-        if year_start:
-            query += ' AND ce.year >= %s'
-            params.append(year_start)
-        if year_end:
-            query += ' AND ce.year <= %s'
-            params.append(year_end)
-
-        query += ' GROUP BY a.full_name ORDER BY total DESC LIMIT 20'
-
-        cur.execute(query, tuple(params))
-        data = cur.fetchall()
-        return data
-
-    except Exception as e:
-        print("ERROR en ranking_por_conferencia:", e)
-        raise
-    finally:
-        cur.close()
-        conn.close()
-
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "autores_por_conferencia", query, tuple(params))
+        return [r[0] for r in cur.fetchall()]
 
 def autores_consistentes(year_start: int, year_end: int):
-    conn = get_connection()
-    cur = conn.cursor()
     query = '''
-        SELECT a.full_name, MIN(ce.year) as first_year, MAX(ce.year) as last_year, COUNT(DISTINCT ce.year) as num_years
-        FROM authors a
-        JOIN paper_authors pa ON a.id = pa.author_id
-        JOIN papers p ON pa.paper_id = p.id
-        JOIN conference_editions ce ON p.edition_id = ce.id
-        WHERE ce.year BETWEEN %s AND %s
+        SELECT a.full_name, MIN(ayc.year) as first_year, MAX(ayc.year) as last_year, COUNT(DISTINCT ayc.year) as num_years
+        FROM author_year_counts ayc
+        JOIN authors a ON a.id = ayc.author_id
+        WHERE ayc.year BETWEEN %s AND %s
         GROUP BY a.full_name
-        HAVING COUNT(DISTINCT ce.year) = %s
+        HAVING COUNT(DISTINCT ayc.year) = %s
         ORDER BY a.full_name
     '''
-    cur.execute(query, (year_start, year_end, year_end - year_start + 1))
-    autores = cur.fetchall()
-    cur.close()
-    conn.close()
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "autores_consistentes", query, (year_start, year_end, year_end - year_start + 1))
+        autores = cur.fetchall()
     return [
         {
             "full_name": r[0],
@@ -500,6 +955,32 @@ def autores_consistentes(year_start: int, year_end: int):
         } for r in autores
     ]
 
+def anios_activos_autores():
+    """[(full_name, [años con algún paper]), ...] de todos los autores (para actividad_autores.py)."""
+    query = '''
+        SELECT a.full_name, array_agg(DISTINCT ayc.year)
+        FROM author_year_counts ayc
+        JOIN authors a ON a.id = ayc.author_id
+        GROUP BY a.full_name
+        ORDER BY a.full_name
+    '''
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "anios_activos_autores", query)
+        return cur.fetchall()
+
+
+def _filtros_cubo(year_start=None, year_end=None, serie=None, country=None):
+    filtros, params = [], []
+    if country is not None:
+        filtros.append("country = %s"); params.append(country)
+    if year_start is not None:
+        filtros.append("year >= %s"); params.append(year_start)
+    if year_end is not None:
+        filtros.append("year <= %s"); params.append(year_end)
+    if serie:
+        filtros.append("serie = %s"); params.append(serie)
+    return ("WHERE " + " AND ".join(filtros) if filtros else ""), params
+
 
 def mapa_paises_con_preview(year_start: Optional[int] = None,
                             year_end:   Optional[int] = None,
@@ -511,86 +992,72 @@ def mapa_paises_con_preview(year_start: Optional[int] = None,
       - total_authors (COUNT DISTINCT authors)
       - num_series (cuántas series distintas hay en el país)
       - series_preview (top-5 series por nº de papers, para tooltip)
-    """
-    conn = get_connection()
-    cur  = conn.cursor(cursor_factory=RealDictCursor)
-
-    filtros, params = [], []
-    if year_start is not None:
-        filtros.append("ce.year >= %s"); params.append(year_start)
-    if year_end is not None:
-        filtros.append("ce.year <= %s"); params.append(year_end)
-    if serie:
-        # Serie = lo que hay antes del apóstrofe en conferences.name
-        filtros.append("TRIM(SPLIT_PART(c.name, '''', 1)) ILIKE %s"); params.append(f"%{serie}%")
 
-    where_clause = "WHERE " + " AND ".join(filtros) if filtros else ""
+    Todo sale del cubo pais_serie_anio (país × serie × año, refrescado tras cada importación):
+    los papers se suman y los autores distintos se cuentan sobre sus arrays de ids.
+    """
+    where_clause, params = _filtros_cubo(year_start, year_end, serie)
 
     query = f"""
-    WITH base AS (
-      SELECT
-        p.id AS paper_id,
-        ce.year,
-        TRIM(SPLIT_PART(c.name, '''', 1)) AS serie,
-        btrim(regexp_replace(replace(c.location, '&amp;', '&'), '.*,\\s*', '')) AS country
-      FROM papers p
-      JOIN conference_editions ce ON p.edition_id = ce.id
-      JOIN conferences c          ON ce.conference_id = c.id
+    WITH celdas AS (
+      SELECT country, serie, papers, autores
+      FROM pais_serie_anio
       {where_clause}
     ),
-    base_ok AS (
-      SELECT * FROM base
-      WHERE country IS NOT NULL AND country <> ''
-    ),
-    country_totals AS (
-      SELECT
-        b.country,
-        COUNT(DISTINCT b.paper_id)                         AS total_papers,
-        COUNT(DISTINCT pa.author_id)                       AS total_authors
-      FROM base_ok b
-      LEFT JOIN paper_authors pa ON pa.paper_id = b.paper_id
-      GROUP BY b.country
-    ),
-    per_country_serie AS (
-      SELECT
-        country,
-        serie,
-        COUNT(DISTINCT paper_id) AS papers_serie
-      FROM base_ok
+    por_serie AS (
+      SELECT country, serie, SUM(papers)::int AS papers_serie
+      FROM celdas
       GROUP BY country, serie
     ),
-    ranked AS (
-      SELECT country, serie, papers_serie,
-             ROW_NUMBER() OVER (PARTITION BY country ORDER BY papers_serie DESC, serie) AS rn
-      FROM per_country_serie
-    ),
-    preview AS (
-      SELECT country,
-             array_agg(serie ORDER BY papers_serie DESC, serie) FILTER (WHERE rn <= 5) AS series_preview
-      FROM ranked
+    autores AS (
+      -- DISTINCT y luego COUNT(*): se agrupa con hash en vez de ordenar cada grupo
+      SELECT country, COUNT(*)::int AS total_authors
+      FROM (SELECT DISTINCT c.country, a.author_id FROM celdas c, unnest(c.autores) AS a(author_id)) d
       GROUP BY country
+    )
+    SELECT
+      ps.country,
+      SUM(ps.papers_serie)::int                                               AS total_papers,
+      COALESCE(au.total_authors, 0)                                           AS total_authors,
+      COUNT(*)::int                                                           AS num_series,
+      (array_agg(ps.serie ORDER BY ps.papers_serie DESC, ps.serie))[1:5]      AS series_preview
+    FROM por_serie ps
+    LEFT JOIN autores au ON au.country = ps.country
+    GROUP BY ps.country, au.total_authors
+    ORDER BY total_papers DESC, ps.country;
+    """
+    with conexion() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        _ejecutar(cur, "mapa_paises_con_preview", query, tuple(params))
+        return cur.fetchall()
+
+
+def _detalle_series(nombre, where_clause, params):
+    # Una fila por (país, serie) de las celdas del cubo que cumplen los filtros
+    query = f"""
+    WITH celdas AS (
+      SELECT country, serie, year, papers, autores
+      FROM pais_serie_anio
+      {where_clause}
     ),
-    num_series AS (
-      SELECT country, COUNT(*) AS num_series
-      FROM per_country_serie
-      GROUP BY country
+    autores AS (
+      SELECT country, serie, COUNT(*)::int AS total_authors
+      FROM (SELECT DISTINCT c.country, c.serie, a.author_id FROM celdas c, unnest(c.autores) AS a(author_id)) d
+      GROUP BY country, serie
     )
     SELECT
-      ct.country,
-      ct.total_papers,
-      ct.total_authors,
-      ns.num_series,
-      COALESCE(pv.series_preview, ARRAY[]::text[]) AS series_preview
-    FROM country_totals ct
-    JOIN num_series ns ON ns.country = ct.country
-    LEFT JOIN preview pv ON pv.country = ct.country
-    ORDER BY ct.total_papers DESC;
-    """
-    cur.execute(query, tuple(params))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+      c.country,
+      c.serie,
+      SUM(c.papers)::int                   AS total_papers,
+      COALESCE(au.total_authors, 0)        AS total_authors,
+      array_agg(c.year ORDER BY c.year)    AS years
+    FROM celdas c
+    LEFT JOIN autores au ON au.country = c.country AND au.serie IS NOT DISTINCT FROM c.serie
+    GROUP BY c.country, c.serie, au.total_authors
+    ORDER BY c.country, total_papers DESC, c.serie;
+    """
+    with conexion() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        _ejecutar(cur, nombre, query, tuple(params))
+        return cur.fetchall()
 
 
 def detalle_series_por_pais(country: str,
@@ -603,63 +1070,34 @@ def detalle_series_por_pais(country: str,
       - total_papers (en esa serie y país)
       - total_authors
       - years (array de años con publicaciones)
-    Ordenado por papers desc.
+    Ordenado por papers desc (sale del cubo pais_serie_anio).
     """
-    conn = get_connection()
-    cur  = conn.cursor(cursor_factory=RealDictCursor)
+    where_clause, params = _filtros_cubo(year_start, year_end, serie, country)
+    return _detalle_series("detalle_series_por_pais", where_clause, params)
 
-    filtros, params = ["btrim(regexp_replace(replace(c.location, '&amp;', '&'), '.*,\\s*', '')) = %s"], [country]
-    if year_start is not None:
-        filtros.append("ce.year >= %s"); params.append(year_start)
-    if year_end is not None:
-        filtros.append("ce.year <= %s"); params.append(year_end)
-    if serie:
-        filtros.append("TRIM(SPLIT_PART(c.name, '''', 1)) ILIKE %s"); params.append(f"%{serie}%")
 
-    where_clause = "WHERE " + " AND ".join(filtros)
-
-    query = f"""
-    WITH base AS (
-      SELECT
-        p.id AS paper_id,
-        ce.year,
-        TRIM(SPLIT_PART(c.name, '''', 1)) AS serie
-      FROM papers p
-      JOIN conference_editions ce ON p.edition_id = ce.id
-      JOIN conferences c          ON ce.conference_id = c.id
-      {where_clause}
-    )
-    SELECT
-      b.serie,
-      COUNT(DISTINCT b.paper_id)                     AS total_papers,
-      COUNT(DISTINCT pa.author_id)                   AS total_authors,
-      ARRAY_AGG(DISTINCT b.year ORDER BY b.year)     AS years
-    FROM base b
-    LEFT JOIN paper_authors pa ON pa.paper_id = b.paper_id
-    GROUP BY b.serie
-    ORDER BY total_papers DESC, b.serie;
-    """
-    cur.execute(query, tuple(params))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+def detalle_series_paises(year_start: Optional[int] = None,
+                          year_end:   Optional[int] = None,
+                          serie:      Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Lo mismo que detalle_series_por_pais para todos los países a la vez: {country: filas}."""
+    where_clause, params = _filtros_cubo(year_start, year_end, serie)
+    detalle = defaultdict(list)
+    for fila in _detalle_series("detalle_series_paises", where_clause, params):
+        detalle[fila.pop("country")].append(fila)
+    return dict(detalle)
 
 def obtener_ids_papers_por_pais_y_series(country: str,
                                          series: Optional[List[str]] = None,
                                          year_start: Optional[int] = None,
                                          year_end:   Optional[int] = None) -> List[int]:
-    conn = get_connection()
-    cur  = conn.cursor()
-
-    filtros, params = ["btrim(regexp_replace(replace(c.location, '&amp;', '&'), '.*,\\s*', '')) = %s"], [country]
+    filtros, params = ["c.country = %s"], [country]
     if year_start is not None:
         filtros.append("ce.year >= %s"); params.append(year_start)
     if year_end is not None:
         filtros.append("ce.year <= %s"); params.append(year_end)
 
     if series:
-        filtros.append("TRIM(SPLIT_PART(c.name, '''', 1)) = ANY(%s)")
+        filtros.append("c.serie = ANY(%s)")
         params.append(series)
 
     where_clause = "WHERE " + " AND ".join(filtros)
@@ -671,8 +1109,83 @@ def obtener_ids_papers_por_pais_y_series(country: str,
     JOIN conferences c          ON ce.conference_id = c.id
     {where_clause}
     """
-    cur.execute(query, tuple(params))
-    ids = [r[0] for r in cur.fetchall()]
-    cur.close()
-    conn.close()
-    return ids
+    with conexion() as conn, conn.cursor() as cur:
+        _ejecutar(cur, "obtener_ids_papers_por_pais_y_series", query, tuple(params))
+        return [r[0] for r in cur.fetchall()]
+
+
+# =========================================
+#  Trabajos de actualización (/actualizar_datos/)
+# =========================================
+
+# Un trabajo sin latido durante este tiempo se da por muerto (p. ej. la API se reinició)
+TRABAJO_LATIDO_MAXIMO = "2 minutes"
+
+def crear_trabajo_actualizacion(ano_inicio, ano_fin, log_ruta):
+    """
+    Registra un trabajo nuevo en estado 'ejecutando'. Devuelve su id, o None si ya hay
+    uno en marcha (el índice único parcial idx_trabajo_activo lo impide).
+    """
+    try:
+        with conexion() as conn, conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO trabajos_actualizacion (ano_inicio, ano_fin, log_ruta) VALUES (%s, %s, %s) RETURNING id",
+                (ano_inicio, ano_fin, log_ruta),
+            )
+            trabajo_id = cur.fetchone()[0]
+            # La ruta final lleva el id, que no se conoce hasta insertar
+            cur.execute(
+                "UPDATE trabajos_actualizacion SET log_ruta = %s WHERE id = %s",
+                (log_ruta.format(id=trabajo_id), trabajo_id),
+            )
+            return trabajo_id
+    except psycopg2.errors.UniqueViolation:
+        return None
+
+def actualizar_trabajo(trabajo_id, **campos):
+    # campos: etapa, anio_actual, filas_importadas, estado, mensaje. Siempre renueva el latido.
+    asignaciones = [f"{campo} = %s" for campo in campos] + ["latido = now()"]
+    if campos.get("estado") in ("completado", "error"):
+        asignaciones.append("terminado = now()")
+    with conexion() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE trabajos_actualizacion SET {', '.join(asignaciones)} WHERE id = %s",
+            (*campos.values(), trabajo_id),
+        )
+
+def obtener_trabajo(trabajo_id=None):
+    """Un trabajo por id (o el último si no se indica), con los segundos transcurridos."""
+    query = """
+        SELECT id, ano_inicio, ano_fin, estado, etapa, anio_actual, filas_importadas, mensaje, log_ruta,
+               creado, terminado,
+               EXTRACT(EPOCH FROM COALESCE(terminado, now()) - creado)::int AS segundos
+        FROM trabajos_actualizacion
+    """
+    if trabajo_id is None:
+        query += " ORDER BY id DESC LIMIT 1"
+        params = ()
+    else:
+        query += " WHERE id = %s"
+        params = (trabajo_id,)
+    with conexion() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        return cur.fetchone()
+
+def marcar_trabajos_abandonados():
+    # Al arrancar: los trabajos 'ejecutando' cuyo supervisor ya no da señales no van a terminar
+    with conexion() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            UPDATE trabajos_actualizacion
+            SET estado = 'abandonado', terminado = now(),
+                mensaje = 'El proceso que lo ejecutaba se detuvo antes de terminar.'
+            WHERE estado = 'ejecutando' AND latido < now() - interval '{TRABAJO_LATIDO_MAXIMO}'
+        """)
+        return cur.rowcount
+
+def guardar_estado_sistema(min_year, max_year):
+    with conexion() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM sistema_estado")
+        cur.execute(
+            "INSERT INTO sistema_estado (ultima_actualizacion, min_year, max_year) VALUES (CURRENT_DATE, %s, %s)",
+            (min_year, max_year)
+        )
@@ -0,0 +1,151 @@
+import csv
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW = True
+except ImportError:
+    PYARROW = False
+
+
+# =========================================
+#  Formatos de exportación (CSV, Parquet, Arrow IPC)
+# =========================================
+
+# Todos los /exportar_csv/* devuelven las mismas columnas; con format=parquet o
+# format=arrow van con tipos (year y id enteros, nulos de verdad) y la conferencia, la
+# serie y la editorial como diccionario. Cada bloque de filas del cursor de servidor se
+# codifica y se envía en cuanto llega: en Parquet es un row group y en Arrow un record batch.
+# Parquet y Arrow necesitan pyarrow (pip install pyarrow); sin él solo hay CSV.
+
+CAMPOS_EXPORTACION = ["id", "author", "title", "year", "isbn", "publisher", "address", "url", "doi",
+                      "abstract", "booktitle", "pages", "keywords", "series"]
+
+# formato -> (media type, extensión)
+FORMATOS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+if PYARROW:
+    _texto_diccionario = pa.dictionary(pa.int32(), pa.string())
+    ESQUEMA = pa.schema([
+        ("id", pa.int64()),
+        ("author", pa.string()),
+        ("title", pa.string()),
+        ("year", pa.int32()),
+        ("isbn", pa.string()),
+        ("publisher", _texto_diccionario),
+        ("address", pa.string()),
+        ("url", pa.string()),
+        ("doi", pa.string()),
+        ("abstract", pa.string()),
+        ("booktitle", _texto_diccionario),
+        ("pages", pa.string()),
+        ("keywords", pa.string()),
+        ("series", _texto_diccionario),
+    ])
+
+
+class CodificadorCsv:
+
+    def __init__(self):
+        self.salida = io.StringIO()
+        self.writer = csv.writer(self.salida)
+        self.writer.writerow(CAMPOS_EXPORTACION)
+
+    def bloque(self, filas):
+        self.writer.writerows(["" if v is None else v for v in fila] for fila in filas)
+        return self._recoger()
+
+    def fin(self):
+        return self._recoger()
+
+    def _recoger(self):
+        trozo = self.salida.getvalue()
+        self.salida.seek(0)
+        self.salida.truncate(0)
+        return trozo.encode("utf-8")
+
+
+class _Sumidero:
+    """
+    Fichero de solo escritura que guarda lo escrito hasta que se recoge. Lleva la cuenta
+    de la posición total (Parquet la anota en el pie), aunque lo ya recogido se descarte.
+    """
+
+    def __init__(self):
+        self.trozos = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self.trozos.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def recoger(self):
+        datos = b"".join(self.trozos)
+        self.trozos = []
+        return datos
+
+
+def _record_batch(filas):
+    columnas = list(zip(*filas))
+    arrays = []
+    for campo, valores in zip(ESQUEMA, columnas):
+        if pa.types.is_dictionary(campo.type):
+            arrays.append(pa.array(valores, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(valores, type=campo.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=ESQUEMA)
+
+
+class CodificadorArrow:
+    # Formato stream de Arrow IPC: cada bloque es un record batch con sus propios diccionarios
+
+    def __init__(self):
+        self.sumidero = _Sumidero()
+        self.writer = pa.ipc.new_stream(pa.PythonFile(self.sumidero, mode="w"), ESQUEMA)
+
+    def bloque(self, filas):
+        self.writer.write_batch(_record_batch(filas))
+        return self.sumidero.recoger()
+
+    def fin(self):
+        self.writer.close()
+        return self.sumidero.recoger()
+
+
+class CodificadorParquet:
+    # Un row group por bloque; el pie (con el esquema y los offsets) sale al final
+
+    def __init__(self):
+        self.sumidero = _Sumidero()
+        self.writer = pq.ParquetWriter(pa.PythonFile(self.sumidero, mode="w"), ESQUEMA, compression="zstd")
+
+    def bloque(self, filas):
+        self.writer.write_batch(_record_batch(filas))
+        return self.sumidero.recoger()
+
+    def fin(self):
+        self.writer.close()
+        return self.sumidero.recoger()
+
+
+def crear_codificador(formato):
+    return {"csv": CodificadorCsv, "parquet": CodificadorParquet, "arrow": CodificadorArrow}[formato]()
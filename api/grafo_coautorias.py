@@ -0,0 +1,219 @@
+import numpy as np
+
+from db_manager import datos_grafo_coautorias
+from indices_memoria import IndiceVersionado
+
+
+# =========================================
+#  Grafo de coautorías en memoria (CSR)
+# =========================================
+
+# Índice por worker con el grafo de coautorías entre autores (por nombre, como el resto
+# de la API). Cada autor es un entero (su posición en orden alfabético de la BD, así que
+# comparar ids es comparar nombres como LEAST/GREATEST en SQL). Cada arista (u < v) tiene
+# sus papers en común desglosados por año en arrays paralelos; la adyacencia es CSR:
+# los vecinos del nodo n son vecinos[indptr[n]:indptr[n + 1]] y aristas[...] sus aristas.
+# Con una ventana de años el peso de todas las aristas se recalcula de una vez (bincount)
+# y las búsquedas solo cruzan aristas con algún paper en la ventana.
+# Se reconstruye cuando cambia la versión de los datos (ver indices_memoria.py).
+
+
+def _tramos(inicios, cuentas):
+    # Índices inicios[i] .. inicios[i] + cuentas[i] - 1 de todos los tramos, concatenados
+    total = int(cuentas.sum())
+    desplazamiento = np.arange(total) - np.repeat(np.cumsum(cuentas) - cuentas, cuentas)
+    return np.repeat(inicios, cuentas) + desplazamiento
+
+
+class GrafoCoautorias:
+
+    def __init__(self, autores, filas):
+        # autores: [(author_id, full_name)] por nombre; filas: [(paper_id, year, author_id)]
+        self.nombres = []
+        self.nodo_de = {}
+        ids_autor, nodos_autor = [], []
+        for author_id, nombre in autores:
+            if nombre not in self.nodo_de:
+                self.nodo_de[nombre] = len(self.nombres)
+                self.nombres.append(nombre)
+            ids_autor.append(author_id)
+            nodos_autor.append(self.nodo_de[nombre])
+        n = len(self.nombres)
+        base = max(n, 1)
+        mapa = np.full(max(ids_autor, default=0) + 1, -1, dtype=np.int64)
+        mapa[ids_autor] = nodos_autor
+
+        # Una fila por (paper, autor); los autores creados después de leer 'autores' se ignoran
+        filas = np.array(filas, dtype=np.int64).reshape(-1, 3)
+        filas = filas[filas[:, 2] < len(mapa)]
+        nodo = mapa[filas[:, 2]]
+        filas, nodo = filas[nodo >= 0], nodo[nodo >= 0]
+        claves, primera = np.unique(filas[:, 0] * base + nodo, return_index=True)
+        paper, nodo, anio = claves // base, claves % base, filas[primera, 1]
+        self.min_year = int(anio.min()) if len(anio) else 0
+        n_anios = (int(anio.max()) - self.min_year + 1) if len(anio) else 1
+
+        # Parejas de cada paper: cada fila con las que van detrás en su mismo paper (u < v)
+        inicios = np.flatnonzero(np.r_[True, paper[1:] != paper[:-1]]) if len(paper) else np.array([], dtype=np.int64)
+        tamanos = np.diff(np.r_[inicios, len(paper)])
+        posicion = np.arange(len(paper)) - np.repeat(inicios, tamanos)
+        detras = np.repeat(tamanos, tamanos) - 1 - posicion
+        izquierda = np.repeat(np.arange(len(paper)), detras)
+        derecha = izquierda + 1 + (np.arange(len(izquierda)) - np.repeat(np.cumsum(detras) - detras, detras))
+
+        # Papers por (arista, año)
+        clave = (nodo[izquierda] * base + nodo[derecha]) * n_anios + (anio[izquierda] - self.min_year)
+        claves, papers = np.unique(clave, return_counts=True)
+        pares, inicio_arista = np.unique(claves // n_anios, return_index=True)
+        self.arista_u = (pares // base).astype(np.int32)
+        self.arista_v = (pares % base).astype(np.int32)
+        self.entrada_anio = (claves % n_anios + self.min_year).astype(np.int32)
+        self.entrada_papers = papers.astype(np.int32)
+        self.entrada_arista = np.repeat(np.arange(len(pares)), np.diff(np.r_[inicio_arista, len(claves)])).astype(np.int32)
+        self.peso = np.bincount(self.entrada_arista, weights=self.entrada_papers, minlength=len(pares)).astype(np.int64)
+
+        # Adyacencia CSR (cada arista en los dos sentidos)
+        origen = np.concatenate([self.arista_u, self.arista_v])
+        orden = np.argsort(origen, kind="stable")
+        self.indptr = np.r_[0, np.cumsum(np.bincount(origen, minlength=n))].astype(np.int64)
+        self.vecinos = np.concatenate([self.arista_v, self.arista_u])[orden]
+        self.aristas = np.concatenate([np.arange(len(pares))] * 2)[orden].astype(np.int32)
+
+    @property
+    def num_aristas(self):
+        return len(self.peso)
+
+    def pesos(self, year_start=None, year_end=None):
+        """Papers en común de cada arista dentro de la ventana de años."""
+        if year_start is None and year_end is None:
+            return self.peso
+        dentro = np.ones(len(self.entrada_anio), dtype=bool)
+        if year_start is not None:
+            dentro &= self.entrada_anio >= year_start
+        if year_end is not None:
+            dentro &= self.entrada_anio <= year_end
+        return np.bincount(self.entrada_arista[dentro], weights=self.entrada_papers[dentro],
+                           minlength=self.num_aristas).astype(np.int64)
+
+    def _expandir(self, frontera, activa):
+        # (origen, vecino, arista) de todos los vecinos de la frontera por aristas activas
+        cuentas = self.indptr[frontera + 1] - self.indptr[frontera]
+        posiciones = _tramos(self.indptr[frontera], cuentas)
+        origen = np.repeat(frontera, cuentas)
+        vecino, arista = self.vecinos[posiciones], self.aristas[posiciones]
+        validas = activa[arista]
+        return origen[validas], vecino[validas], arista[validas]
+
+    def top_pares(self, year_start=None, year_end=None, top_n=20, min_papers=1):
+        """[(autor1, autor2, total)] como db_manager.top_coauthor_pairs."""
+        pesos = self.pesos(year_start, year_end)
+        candidatas = np.flatnonzero(pesos >= max(min_papers, 1))
+        if len(candidatas) > top_n:
+            # Solo hace falta ordenar las que empatan o superan al peso del puesto top_n
+            corte = -np.partition(-pesos[candidatas], top_n - 1)[top_n - 1]
+            candidatas = candidatas[pesos[candidatas] >= corte]
+        orden = np.lexsort((self.arista_v[candidatas], self.arista_u[candidatas], -pesos[candidatas]))
+        return [
+            (self.nombres[self.arista_u[e]], self.nombres[self.arista_v[e]], int(pesos[e]))
+            for e in candidatas[orden[:top_n]]
+        ]
+
+    def red_ego(self, nodo, saltos, year_start=None, year_end=None, max_nodos=200):
+        pesos = self.pesos(year_start, year_end)
+        activa = pesos > 0
+        distancia = np.full(len(self.nombres), -1, dtype=np.int16)
+        distancia[nodo] = 0
+        frontera = np.array([nodo], dtype=np.int64)
+        for paso in range(1, saltos + 1):
+            _, vecinos, _ = self._expandir(frontera, activa)
+            frontera = np.unique(vecinos[distancia[vecinos] < 0])
+            if not len(frontera):
+                break
+            distancia[frontera] = paso
+
+        # Papers en común de cada autor con todos sus coautores (en la ventana)
+        fuerza = (np.bincount(self.arista_u, weights=pesos, minlength=len(self.nombres))
+                  + np.bincount(self.arista_v, weights=pesos, minlength=len(self.nombres))).astype(np.int64)
+        nodos = np.flatnonzero(distancia >= 0)
+        truncada = len(nodos) > max_nodos
+        if truncada:
+            # Los más cercanos y, a igual distancia, los que más colaboran
+            nodos = np.sort(nodos[np.lexsort((nodos, -fuerza[nodos], distancia[nodos]))[:max_nodos]])
+
+        incluido = np.zeros(len(self.nombres), dtype=bool)
+        incluido[nodos] = True
+        origen, vecinos, aristas = self._expandir(nodos, activa)
+        internas = incluido[vecinos] & (origen < vecinos)
+        return {
+            "nodos": [
+                {"full_name": self.nombres[i], "distancia": int(distancia[i]), "coautorias": int(fuerza[i])}
+                for i in nodos[np.lexsort((nodos, distancia[nodos]))]
+            ],
+            "aristas": [
+                {"autor1": self.nombres[self.arista_u[e]], "autor2": self.nombres[self.arista_v[e]], "total": int(pesos[e])}
+                for e in aristas[internas]
+            ],
+            "truncada": truncada,
+        }
+
+    def camino(self, desde, hasta, year_start=None, year_end=None, max_saltos=6):
+        # Búsqueda en anchura: el camino con menos saltos (a igualdad, uno cualquiera)
+        pesos = self.pesos(year_start, year_end)
+        activa = pesos > 0
+        padre = np.full(len(self.nombres), -1, dtype=np.int64)
+        arista_padre = np.full(len(self.nombres), -1, dtype=np.int64)
+        visitado = np.zeros(len(self.nombres), dtype=bool)
+        visitado[desde] = True
+        frontera = np.array([desde], dtype=np.int64)
+        for _ in range(max_saltos):
+            if visitado[hasta] or not len(frontera):
+                break
+            origen, vecinos, aristas = self._expandir(frontera, activa)
+            nuevos = ~visitado[vecinos]
+            frontera, primera = np.unique(vecinos[nuevos], return_index=True)
+            padre[frontera] = origen[nuevos][primera]
+            arista_padre[frontera] = aristas[nuevos][primera]
+            visitado[frontera] = True
+        if not visitado[hasta]:
+            return None
+
+        tramos, nodo = [], hasta
+        while nodo != desde:
+            anterior = int(padre[nodo])
+            tramos.append({"autor1": self.nombres[anterior], "autor2": self.nombres[nodo],
+                           "total": int(pesos[arista_padre[nodo]])})
+            nodo = anterior
+        return tramos[::-1]
+
+
+_grafo = IndiceVersionado("Grafo de coautorías", lambda: GrafoCoautorias(*datos_grafo_coautorias()),
+                          resumen=lambda grafo: f"{len(grafo.nombres)} autores y {grafo.num_aristas} aristas")
+construir_grafo = _grafo.construir
+obtener_grafo = _grafo.obtener
+
+
+def top_pares_coautores(year_start=None, year_end=None, top_n=20, min_papers=1):
+    """Las parejas de coautores con más papers juntos en la ventana (como db_manager.top_coauthor_pairs)."""
+    return obtener_grafo().top_pares(year_start, year_end, top_n, min_papers)
+
+
+def red_de_autor(autor, saltos=1, year_start=None, year_end=None, max_nodos=200):
+    """Red ego del autor a 'saltos' de distancia, o None si no existe."""
+    grafo = obtener_grafo()
+    nodo = grafo.nodo_de.get(autor)
+    if nodo is None:
+        return None
+    return grafo.red_ego(nodo, saltos, year_start, year_end, max_nodos)
+
+
+def camino_entre_autores(origen, destino, year_start=None, year_end=None, max_saltos=6):
+    """
+    Tramos [{autor1, autor2, total}] del camino de colaboraciones más corto de origen a
+    destino; [] si son el mismo autor, None si no están conectados en max_saltos.
+    Lanza KeyError con el nombre si alguno de los dos no existe.
+    """
+    grafo = obtener_grafo()
+    for autor in (origen, destino):
+        if autor not in grafo.nodo_de:
+            raise KeyError(autor)
+    return grafo.camino(grafo.nodo_de[origen], grafo.nodo_de[destino], year_start, year_end, max_saltos)
@@ -0,0 +1,59 @@
+import logging
+import threading
+import time
+
+from cache_respuestas import version_dataset
+
+
+# =========================================
+#  Índices en memoria que siguen la versión de los datos
+# =========================================
+
+# Sugerencias, actividad de autores y grafo de coautorías mantienen por worker una
+# estructura construida con una consulta a la BD. IndiceVersionado la guarda junto a la
+# versión de los datos con la que se construyó; como mucho cada VERSION_TTL_S segundos
+# comprueba si la versión ha cambiado y, si es así, la reconstruye. Solo un hilo comprueba
+# o reconstruye a la vez; mientras tanto los demás siguen usando la que hay.
+
+VERSION_TTL_S = 5          # cada cuánto se comprueba si hay datos nuevos
+
+logger = logging.getLogger(__name__)
+
+
+class IndiceVersionado:
+
+    def __init__(self, nombre, construir, resumen=None):
+        # construir(): la estructura con los datos actuales; resumen(estructura): texto para el log
+        self.nombre = nombre
+        self._construir = construir
+        self._resumen = resumen
+        self._valor = None
+        self._version = None
+        self._comprobada = 0.0
+        self._lock = threading.Lock()
+
+    def construir(self):
+        """(Re)construye con los datos actuales. Se llama al arrancar y cuando cambian los datos."""
+        version = version_dataset()
+        inicio = time.perf_counter()
+        valor = self._construir()
+        self._valor, self._version, self._comprobada = valor, version, time.monotonic()
+        logger.info("%s: %s en %.2fs", self.nombre, self._resumen(valor) if self._resumen else "construido",
+                    time.perf_counter() - inicio)
+        return valor
+
+    def obtener(self):
+        valor = self._valor
+        if valor is not None and time.monotonic() - self._comprobada < VERSION_TTL_S:
+            return valor
+
+        # Sin nada construido todavía se espera; si no, el que no consigue el lock usa lo que hay
+        if not self._lock.acquire(blocking=valor is None):
+            return valor
+        try:
+            if self._valor is None or version_dataset() != self._version:
+                return self.construir()
+            self._comprobada = time.monotonic()
+            return self._valor
+        finally:
+            self._lock.release()
@@ -1,39 +1,117 @@
 from fastapi import FastAPI, Query, Body, HTTPException, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from typing import Optional, List
 from fastapi import Depends
-import io
-import csv
+from contextlib import asynccontextmanager
+import asyncio
+import functools
+import anyio
 import psycopg2
 from datetime import date
-import subprocess
 import json
 from fastapi import Body
 
 
 from db_manager import (
-    ranking_autores,
+    ranking_autores_con_ids,
+    obtener_ids_papers_ranking_autores,
     obtener_ids_papers_por_autor,
-    get_connection,
-    obtener_paper_completo,
-    ranking_por_conferencia,
+    contar_papers_autor,
+    conexion,
+    iniciar_pool,
+    cerrar_pool,
+    estadisticas_pool,
+    observar_consultas,
+    POOL_MAX_CONEXIONES,
+    limites_anios,
+    conferencias_unicas,
+    obtener_ids_papers_por_anios,
+    obtener_paper,
+    obtener_autores_paper,
+    existen_papers,
+    marcar_trabajos_abandonados,
+    iterar_papers_completos,
+    ranking_por_conferencia_con_ids,
+    obtener_ids_papers_ranking_conferencia,
     evolucion_autor,
     palabras_clave_mas_usadas,
     publicaciones_espanolas_por_anio,
     obtener_ids_papers_por_editorial,
     obtener_ids_papers_por_conferencia,
-    get_paper_ids_from_authors_conferencia,
     obtener_ids_papers_por_keywords,
-    top_coauthor_pairs, 
+    top_coauthor_pairs,
+    papers_por_pares,
     get_paper_ids_por_pares,
     mapa_paises_con_preview,
     detalle_series_por_pais,
+    detalle_series_paises,
     obtener_ids_papers_por_pais_y_series,
+    buscar_papers,
+    obtener_ids_papers_por_busqueda,
 )
-
-app = FastAPI()
-
+from cache_respuestas import cacheado, estadisticas_cache, crear_conjunto, obtener_conjunto, version_dataset
+from trabajos import lanzar_actualizacion, estado_trabajo
+from sugerencias import sugerir, construir_indice, TIPOS as TIPOS_SUGERENCIA
+from actividad_autores import autores_consistentes, autores_activos, rachas_autores, construir_indice as construir_indice_actividad
+from grafo_coautorias import red_de_autor, camino_entre_autores, construir_grafo
+from exportacion import FORMATOS, PYARROW, crear_codificador
+from respuestas_http import CompresionMiddleware, ETagMiddleware
+from metricas import MetricasMiddleware, TIPO_CONTENIDO as TIPO_METRICAS, exponer_metricas, medir_funcion, registrar_consulta
+from consultas_lentas import ExplainMiddleware, anotar_consulta, iniciar_registro
+
+@asynccontextmanager
+async def lifespan(app):
+    # Pool de conexiones del proceso: se abre al arrancar y se vacía al parar
+    iniciar_pool()
+    iniciar_registro()
+    marcar_trabajos_abandonados()
+    construir_indice()
+    construir_indice_actividad()
+    construir_grafo()
+    yield
+    cerrar_pool()
+
+app = FastAPI(lifespan=lifespan)
+
+# =========================================
+#  Consultas desde handlers async
+# =========================================
+
+# psycopg2 es bloqueante, así que las consultas se ejecutan en hilos, pero con límites
+# separados: las exportaciones (que ocupan una conexión mientras dura la descarga) nunca
+# dejan sin hilo ni conexión a las consultas baratas. Entre las dos suman el máximo del
+# pool, así que ningún hilo se queda esperando conexión.
+MAX_EXPORTACIONES = 4
+limite_consultas = anyio.CapacityLimiter(POOL_MAX_CONEXIONES - MAX_EXPORTACIONES)
+limite_exportaciones = anyio.CapacityLimiter(MAX_EXPORTACIONES)
+exportaciones_activas = anyio.Semaphore(MAX_EXPORTACIONES)
+
+async def consulta(funcion, *args, **kwargs):
+    # Ejecuta una función de db_manager en un hilo sin bloquear el bucle de eventos
+    # (midiendo su duración para /metrics)
+    return await anyio.to_thread.run_sync(functools.partial(medir_funcion, funcion, *args, **kwargs),
+                                          limiter=limite_consultas)
+
+def formato_exportacion(formato: str = Query("csv", alias="format")):
+    # ?format= de todas las exportaciones: csv (por defecto), parquet o arrow (ver exportacion.py)
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"format debe ser uno de: {', '.join(FORMATOS)}")
+    if formato != "csv" and not PYARROW:
+        raise HTTPException(status_code=501, detail="Exportar en Parquet o Arrow necesita pyarrow en el servidor.")
+    return formato
+
+# GET condicional (ETag / If-None-Match -> 304) en las consultas que solo dependen de los
+# datos; no en /estado/* ni en /actualizar_datos/*, que cambian sin que cambie la versión
+RUTAS_CON_ETAG = (
+    "/limites/", "/ranking/", "/conferencias_unicas", "/estadisticas/", "/suggest", "/autores/",
+    "/papers/", "/buscar", "/map/",
+)
+# ?explain=1 (solo administradores) en las rutas de análisis: planes y tiempos de cada consulta
+RUTAS_CON_EXPLAIN = ("/ranking/", "/estadisticas/", "/map/", "/buscar")
+app.add_middleware(ETagMiddleware, rutas=RUTAS_CON_ETAG, version=version_dataset)
+app.add_middleware(ExplainMiddleware, rutas=RUTAS_CON_EXPLAIN)
+app.add_middleware(CompresionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -41,107 +119,134 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Por fuera de todo: la duración incluye serialización y compresión (ver metricas.py)
+app.add_middleware(MetricasMiddleware)
+observar_consultas(registrar_consulta)
+observar_consultas(anotar_consulta)
+
+# Cuántos ids de papers devuelven los rankings y las coautorías ('ids'):
+#   none -> solo total_papers (por defecto; para exportar está el "conjunto"). La BD solo
+#           cuenta los papers, no construye la lista
+#   full -> la lista completa en paper_ids (comportamiento anterior)
+#   page -> un tramo de paper_ids con paginación por clave: ids > despues, y 'siguiente'
+#           es el 'despues' de la página siguiente (None en la última)
+MODOS_IDS = ("none", "full", "page")
+MAX_IDS_PAGINA = 10000
+
+def _validar_modo_ids(ids):
+    if ids not in MODOS_IDS:
+        raise HTTPException(status_code=400, detail=f"ids debe ser uno de: {', '.join(MODOS_IDS)}")
+
+def _campos_ids(total, paper_ids, ids, limite_ids=1000):
+    # paper_ids viene de la BD ordenado por id: todos (full), los limite_ids + 1 siguientes
+    # a 'despues' (page; si está el de más hay otra página) o ninguno (none)
+    campos = {"total_papers": total}
+    if ids == "full":
+        campos["paper_ids"] = paper_ids
+    elif ids == "page":
+        campos["paper_ids"] = paper_ids[:limite_ids]
+        campos["siguiente"] = paper_ids[limite_ids - 1] if len(paper_ids) > limite_ids else None
+    return campos
 
 @app.get("/")
-def raiz():
+async def raiz():
     return {"mensaje": "API de análisis bibliométrico en funcionamiento"}
 
 @app.get("/limites/anios")
-def obtener_limites_anios(db: psycopg2.extensions.connection = Depends(get_connection)):
-    with db.cursor() as cur:
-        cur.execute("SELECT MIN(year), MAX(year) FROM conference_editions")
-        min_year, max_year = cur.fetchone()
+async def obtener_limites_anios():
+    min_year, max_year = await consulta(limites_anios)
     return {"min_year": min_year, "max_year": max_year}
 
 # 1. Ranking general de autores
 @app.get("/ranking/autores")
-def endpoint_ranking_autores(year_start: Optional[int] = None, year_end: Optional[int] = None):
-    data = ranking_autores(year_start, year_end)
-
-    todos_ids = []
-    for full_name, _total in data:
-        ids = obtener_ids_papers_por_autor(full_name, year_start=year_start, year_end=year_end)
-        todos_ids.extend(ids)
+@cacheado("ranking_autores", conjuntos=("conjunto",))
+async def endpoint_ranking_autores(
+    year_start: Optional[int] = None,
+    year_end:   Optional[int] = None,
+    ids:        str = "none",
+    despues:    Optional[int] = None,
+    limite_ids: int = Query(1000, ge=1, le=MAX_IDS_PAGINA),
+):
+    _validar_modo_ids(ids)
+    data, total, paper_ids = await consulta(ranking_autores_con_ids, year_start, year_end, ids, despues, limite_ids)
 
     return {
         "autores": [{"full_name": r[0], "total": r[1]} for r in data],
-        "paper_ids": list(set(todos_ids))
+        **_campos_ids(total, paper_ids, ids, limite_ids),
+        "conjunto": await consulta(crear_conjunto, obtener_ids_papers_ranking_autores, year_start, year_end,
+                                   paper_ids=paper_ids if ids == "full" else None),
     }
 
 
 
 @app.post("/exportar_csv/ranking_autores", response_class=StreamingResponse)
-def exportar_csv_ranking_autores(year_start: Optional[int] = None, year_end: Optional[int] = None):
-    ranking = ranking_autores(year_start, year_end)
+async def exportar_csv_ranking_autores(year_start: Optional[int] = None, year_end: Optional[int] = None, formato: str = Depends(formato_exportacion)):
+    ranking, _total, paper_ids = await consulta(ranking_autores_con_ids, year_start, year_end)
     if not ranking:
         raise HTTPException(status_code=404, detail="No hay autores")
 
-    todos_ids = []
-    for full_name, _total in ranking:
-        ids = obtener_ids_papers_por_autor(full_name, year_start=year_start, year_end=year_end)
-        todos_ids.extend(ids)
-
-    return exportar_csv(list(set(todos_ids)))
+    return await _exportar(paper_ids, formato)
 
 
 # 2. Ranking autores por conferencia
 @app.get("/conferencias_unicas")
-def get_conferencias_unicas():
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            SELECT DISTINCT TRIM(SPLIT_PART(name, '''', 1))
-            FROM conferences
-            WHERE name IS NOT NULL AND name LIKE '%''%'
-            ORDER BY 1
-        """)
-        data = [row[0] for row in cur.fetchall()]
-        return data
-    finally:
-        cur.close()
-        conn.close()
+@cacheado("conferencias_unicas")
+async def get_conferencias_unicas():
+    return await consulta(conferencias_unicas)
 
 
 @app.get("/ranking/conferencia")
-def endpoint_ranking_conferencia(conferencia: str, year_start: Optional[int] = None, year_end: Optional[int] = None):
-    data = ranking_por_conferencia(conferencia, year_start, year_end)
-    authors = [r[0] for r in data]
-    paper_ids = get_paper_ids_from_authors_conferencia(authors, conferencia, year_start, year_end)
+@cacheado("ranking_conferencia", conjuntos=("conjunto",))
+async def endpoint_ranking_conferencia(
+    conferencia: str,
+    year_start:  Optional[int] = None,
+    year_end:    Optional[int] = None,
+    ids:         str = "none",
+    despues:     Optional[int] = None,
+    limite_ids:  int = Query(1000, ge=1, le=MAX_IDS_PAGINA),
+):
+    _validar_modo_ids(ids)
+    data, total, paper_ids = await consulta(ranking_por_conferencia_con_ids, conferencia, year_start, year_end,
+                                            ids, despues, limite_ids)
 
     return {
         "autores": [{"full_name": r[0], "total": r[1]} for r in data],
-        "paper_ids": paper_ids
+        **_campos_ids(total, paper_ids, ids, limite_ids),
+        "conjunto": await consulta(crear_conjunto, obtener_ids_papers_ranking_conferencia, conferencia, year_start, year_end,
+                                   paper_ids=paper_ids if ids == "full" else None),
     }
 
 
 @app.post("/exportar_csv/ranking_conferencia")
-def exportar_csv_ranking_conferencia(conferencia: str, year_start: Optional[int] = None, year_end: Optional[int] = None):
-    data = ranking_por_conferencia(conferencia, year_start, year_end)
-    authors = [r[0] for r in data]
-    paper_ids = get_paper_ids_from_authors_conferencia(authors, conferencia, year_start, year_end)
-    return exportar_csv(paper_ids)
+async def exportar_csv_ranking_conferencia(conferencia: str, year_start: Optional[int] = None, year_end: Optional[int] = None, formato: str = Depends(formato_exportacion)):
+    _data, _total, paper_ids = await consulta(ranking_por_conferencia_con_ids, conferencia, year_start, year_end)
+    return await _exportar(paper_ids, formato)
 
 
 # 3. Palabras más usada en ciertos años
 @app.get("/estadisticas/palabras_clave")
-def endpoint_palabras_clave(year_start: Optional[int] = None, year_end: Optional[int] = None, top: int = 20):
-    top_keywords, total_count = palabras_clave_mas_usadas(year_start, year_end, top_n=top, return_total=True)
+@cacheado("palabras_clave", conjuntos=("conjunto",))
+async def endpoint_palabras_clave(year_start: Optional[int] = None, year_end: Optional[int] = None, top: int = 20):
+    top_keywords, total_count = await consulta(palabras_clave_mas_usadas, year_start, year_end, top_n=top, return_total=True)
+    # Papers de esas keywords, para exportarlos después con /exportar_csv/conjunto/{conjunto}
     return {
         "top_keywords": [{"keyword": k, "count": v} for k, v in top_keywords],
-        "total_count": total_count
+        "total_count": total_count,
+        "conjunto": await consulta(crear_conjunto, obtener_ids_papers_por_keywords,
+                                   [k for k, _ in top_keywords], year_start, year_end),
     }
 @app.post("/exportar_csv/palabras_clave", response_class=StreamingResponse)
-def exportar_csv_palabras_clave(year_start: Optional[int] = None, year_end: Optional[int] = None, top: int = 20):
-    palabras = palabras_clave_mas_usadas(year_start, year_end, top)
+async def exportar_csv_palabras_clave(year_start: Optional[int] = None, year_end: Optional[int] = None, top: int = 20, formato: str = Depends(formato_exportacion)):
+    palabras = await consulta(palabras_clave_mas_usadas, year_start, year_end, top)
     keywords = [kw for kw, _ in palabras]
-    paper_ids = obtener_ids_papers_por_keywords(keywords,year_start, year_end)
-    return exportar_csv(paper_ids)
+    paper_ids = await consulta(obtener_ids_papers_por_keywords, keywords, year_start, year_end)
+    return await _exportar(paper_ids, formato)
 
 # 4. Estadísticas de publicaciones españolas
 @app.get("/estadisticas/publicaciones_espanolas")
-def endpoint_espanolas(year_start: Optional[int] = None, year_end: Optional[int] = None):
-    datos = publicaciones_espanolas_por_anio()
+@cacheado("publicaciones_espanolas")
+async def endpoint_espanolas(year_start: Optional[int] = None, year_end: Optional[int] = None):
+    datos = await consulta(publicaciones_espanolas_por_anio)
     if year_start:
         datos = [d for d in datos if d["year"] >= year_start]
     if year_end:
@@ -149,176 +254,257 @@ def endpoint_espanolas(year_start: Optional[int] = None, year_end: Optional[int]
     return datos
 
 @app.post("/exportar_csv/publicaciones_espanolas", response_class=StreamingResponse)
-def exportar_csv_publicaciones_espanolas(year_start: Optional[int] = None, year_end: Optional[int] = None):
-    conn = get_connection()
-    cur = conn.cursor()
-
-    try:
-        query = """
-            SELECT DISTINCT p.id
-            FROM papers p
-            JOIN conference_editions ce ON p.edition_id = ce.id
-            WHERE TRUE
-        """
-        params = []
-        if year_start:
-            query += " AND ce.year >= %s"
-            params.append(year_start)
-        if year_end:
-            query += " AND ce.year <= %s"
-            params.append(year_end)
-
-        cur.execute(query, tuple(params))
-        paper_ids = [row[0] for row in cur.fetchall()]
-
-        return exportar_csv(paper_ids)
-
-    finally:
-        cur.close()
-        conn.close()
+async def exportar_csv_publicaciones_espanolas(year_start: Optional[int] = None, year_end: Optional[int] = None, formato: str = Depends(formato_exportacion)):
+    paper_ids = await consulta(obtener_ids_papers_por_anios, year_start, year_end)
+    return await _exportar(paper_ids, formato)
 
 
 
 # 5. Evolución de un autor
 @app.get("/estadisticas/evolucion_autor")
-def endpoint_evolucion_autor(autor: str, year_start: int = None, year_end: int = None):
-    return evolucion_autor(autor, year_start, year_end)
+@cacheado("evolucion_autor")
+async def endpoint_evolucion_autor(autor: str, year_start: int = None, year_end: int = None):
+    return await consulta(evolucion_autor, autor, year_start, year_end)
+
+@app.get("/suggest")
+async def endpoint_sugerencias(q: str, tipo: Optional[str] = None, limite: int = Query(10, ge=1, le=50)):
+    # Autocompletado de autores, keywords y series (índice en memoria + pg_trgm de respaldo)
+    if tipo is not None and tipo not in TIPOS_SUGERENCIA:
+        raise HTTPException(status_code=400, detail=f"tipo debe ser uno de: {', '.join(TIPOS_SUGERENCIA)}")
+    return {"q": q, "sugerencias": await consulta(sugerir, q, tipo, limite)}
 
 @app.get("/autores/existe")
-def endpoint_autor_existe(autor: str):
-    ids = obtener_ids_papers_por_autor(autor)
-    return {"exists": len(ids) > 0, "total_papers": len(ids)}
+async def endpoint_autor_existe(autor: str):
+    total = await consulta(contar_papers_autor, autor)
+    return {"exists": total > 0, "total_papers": total}
 
 
 @app.post("/exportar_csv/evolucion_autor", response_class=StreamingResponse)
-def exportar_csv_evolucion_autor(autor: str, year_start: Optional[int] = None, year_end: Optional[int] = None):
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        # Obtener los IDs del autor (sin filtrar por año)
-        paper_ids = obtener_ids_papers_por_autor(autor)
-        if not paper_ids:
-            raise HTTPException(status_code=404, detail="No se encontraron publicaciones para este autor.")
-
-        # Ahora filtramos por años si se indican
-        if year_start is not None or year_end is not None:
-            placeholders = ','.join(['%s'] * len(paper_ids))
-            query = f"""
-                SELECT p.id
-                FROM papers p
-                JOIN conference_editions ce ON p.edition_id = ce.id
-                WHERE p.id IN ({placeholders})
-            """
-            params = paper_ids
-            if year_start is not None:
-                query += " AND ce.year >= %s"
-                params.append(year_start)
-            if year_end is not None:
-                query += " AND ce.year <= %s"
-                params.append(year_end)
-
-            cur.execute(query, tuple(params))
-            filtered_ids = [row[0] for row in cur.fetchall()]
-        else:
-            filtered_ids = paper_ids
-
-        if not filtered_ids:
-            raise HTTPException(status_code=404, detail="No hay publicaciones en el rango de años seleccionado.")
-
-        return exportar_csv(filtered_ids)
-
-    finally:
-        cur.close()
-        conn.close()
+async def exportar_csv_evolucion_autor(autor: str, year_start: Optional[int] = None, year_end: Optional[int] = None, formato: str = Depends(formato_exportacion)):
+    # IDs del autor ya filtrados por años; el total sin filtrar solo hace falta para el mensaje de error
+    filtered_ids, total = await asyncio.gather(
+        consulta(obtener_ids_papers_por_autor, autor, year_start, year_end),
+        consulta(contar_papers_autor, autor),
+    )
+    if not total:
+        raise HTTPException(status_code=404, detail="No se encontraron publicaciones para este autor.")
+    if not filtered_ids:
+        raise HTTPException(status_code=404, detail="No hay publicaciones en el rango de años seleccionado.")
+
+    return await _exportar(filtered_ids, formato)
 
 # 6. Top de coautores
 @app.get("/estadisticas/coautorias")
-def endpoint_coautorias(
+@cacheado("coautorias", conjuntos=("conjunto",))
+async def endpoint_coautorias(
     year_start: Optional[int] = None,
     year_end:   Optional[int] = None,
     top:        int = 20,
-    min_papers: int = 2
+    min_papers: int = 2,
+    ids:        str = "none",
+    despues:    Optional[int] = None,
+    limite_ids: int = Query(1000, ge=1, le=MAX_IDS_PAGINA),
 ):
-    data = top_coauthor_pairs(year_start, year_end, top_n=top, min_papers=min_papers)
+    _validar_modo_ids(ids)
+    # Las parejas salen de la tabla coauthor_pairs (la mantiene el importador)
+    data = await consulta(top_coauthor_pairs, year_start, year_end, top_n=top, min_papers=min_papers)
     pairs = [(r[0], r[1]) for r in data]
-    paper_ids = get_paper_ids_por_pares(pairs, year_start, year_end)
+    total, paper_ids = await consulta(papers_por_pares, pairs, year_start, year_end, ids, despues, limite_ids)
 
     return {
         "pairs": [{"autor1": r[0], "autor2": r[1], "total": r[2]} for r in data],
-        "paper_ids": paper_ids
+        **_campos_ids(total, paper_ids, ids, limite_ids),
+        "conjunto": await consulta(crear_conjunto, get_paper_ids_por_pares, pairs, year_start, year_end,
+                                   paper_ids=paper_ids if ids == "full" else None),
     }
 
 
 @app.post("/exportar_csv/coautorias", response_class=StreamingResponse)
-def exportar_csv_coautorias(
+async def exportar_csv_coautorias(
     year_start: Optional[int] = None,
     year_end:   Optional[int] = None,
     top:        int = 20,
-    min_papers: int = 2
+    min_papers: int = 2,
+    formato: str = Depends(formato_exportacion),
 ):
-    data = top_coauthor_pairs(year_start, year_end, top_n=top, min_papers=min_papers)
+    data = await consulta(top_coauthor_pairs, year_start, year_end, top_n=top, min_papers=min_papers)
     if not data:
         raise HTTPException(status_code=404, detail="No hay coautorías con esos filtros.")
 
     pairs = [(r[0], r[1]) for r in data]
-    paper_ids = get_paper_ids_por_pares(pairs, year_start, year_end)
+    paper_ids = await consulta(get_paper_ids_por_pares, pairs, year_start, year_end)
     if not paper_ids:
         raise HTTPException(status_code=404, detail="No hay publicaciones para las parejas seleccionadas.")
 
-    return exportar_csv(paper_ids)
+    return await _exportar(paper_ids, formato)
 
-@app.post("/exportar_csv", response_class=StreamingResponse)
-def exportar_csv(ids: List[int] = Body(...)):
-    publicaciones = []
-    for pid in ids:
-        paper, autores = obtener_paper_completo(pid)
-        if not paper:
-            continue
-        autores_bib = " and ".join(autor.strip() for autor in autores)
-        publicaciones.append({
-            "id": paper[0],
-            "author": autores_bib,
-            "title": paper[1],
-            "year": paper[9],
-            "isbn": paper[7] or "",
-            "publisher": paper[3] or "",
-            "address": paper[13] or "",
-            "url": paper[6] or "",
-            "doi": paper[5] or "",
-            "abstract": paper[4] or "",
-            "booktitle": paper[10] or "",
-            "pages": paper[2] or "",
-            "keywords": paper[8] or "",
-            "series": paper[11] or ""
-        })
-
-    if not publicaciones:
+
+# 7. Ficha de un paper
+@app.get("/papers/{paper_id}")
+async def endpoint_paper(paper_id: int):
+    # Los datos del paper y sus autores son consultas independientes: van en paralelo
+    paper, autores = await asyncio.gather(
+        consulta(obtener_paper, paper_id),
+        consulta(obtener_autores_paper, paper_id),
+    )
+    if paper is None:
+        raise HTTPException(status_code=404, detail="No existe el paper.")
+
+    campos = ["id", "title", "pages", "publisher", "abstract", "doi", "url", "isbn", "keywords",
+              "year", "booktitle", "conference_name", "editorial", "location"]
+    return {**dict(zip(campos, paper)), "authors": autores}
+
+
+# 8. Búsqueda de texto completo en título y resumen
+@app.get("/buscar")
+@cacheado("buscar")
+async def endpoint_buscar(
+    q:          str = Query(..., min_length=1),
+    year_start: Optional[int] = None,
+    year_end:   Optional[int] = None,
+    serie:      Optional[str] = None,
+    country:    Optional[str] = None,
+    pagina:     int = Query(1, ge=1),
+    por_pagina: int = Query(20, ge=1, le=100),
+):
+    # Resultados por relevancia; 'titulo' y 'fragmento' llevan las coincidencias entre <mark></mark>
+    total, filas = await consulta(buscar_papers, q, year_start, year_end, serie, country, pagina, por_pagina)
+    return {
+        "q": q,
+        "total": total,
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "resultados": [{**fila, "relevancia": round(fila["relevancia"], 4)} for fila in filas],
+    }
+
+@app.post("/exportar_csv/buscar", response_class=StreamingResponse)
+async def exportar_csv_buscar(
+    q:          str,
+    year_start: Optional[int] = None,
+    year_end:   Optional[int] = None,
+    serie:      Optional[str] = None,
+    country:    Optional[str] = None,
+    formato: str = Depends(formato_exportacion),
+):
+    ids = await consulta(obtener_ids_papers_por_busqueda, q, year_start, year_end, serie, country)
+    if not ids:
+        raise HTTPException(status_code=404, detail="La búsqueda no tiene resultados.")
+    return await _exportar(ids, formato)
+
+# 9. Actividad de los autores año a año (índice de bitsets en memoria, ver actividad_autores.py)
+def _validar_ventana(year_start, year_end):
+    if year_start > year_end:
+        raise HTTPException(status_code=400, detail="year_start no puede ser mayor que year_end.")
+
+@app.get("/estadisticas/autores_consistentes")
+async def endpoint_autores_consistentes(year_start: int, year_end: int):
+    # Autores con algún paper en todos y cada uno de los años de la ventana
+    _validar_ventana(year_start, year_end)
+    autores = await consulta(autores_consistentes, year_start, year_end)
+    return {"autores": autores, "total": len(autores)}
+
+@app.get("/estadisticas/autores_activos")
+async def endpoint_autores_activos(
+    year_start: int,
+    year_end:   int,
+    min_anios:  int = Query(..., ge=1),
+    limite:     int = Query(100, ge=1, le=10000),
+):
+    # Autores con papers en al menos min_anios años de la ventana (no necesariamente seguidos)
+    _validar_ventana(year_start, year_end)
+    total, autores = await consulta(autores_activos, year_start, year_end, min_anios, limite)
+    return {"autores": autores, "total": total}
+
+@app.get("/estadisticas/rachas_autores")
+async def endpoint_rachas_autores(year_start: int, year_end: int, top: int = Query(20, ge=1, le=1000)):
+    # Los autores con más años seguidos publicando dentro de la ventana
+    _validar_ventana(year_start, year_end)
+    return {"autores": await consulta(rachas_autores, year_start, year_end, top)}
+
+# 10. Red de coautorías de un autor (grafo en memoria, ver grafo_coautorias.py)
+@app.get("/autores/red")
+async def endpoint_red_autor(
+    autor:      str,
+    saltos:     int = Query(1, ge=1, le=3),
+    year_start: Optional[int] = None,
+    year_end:   Optional[int] = None,
+    max_nodos:  int = Query(200, ge=1, le=2000),
+):
+    # Coautores a 'saltos' de distancia y las coautorías entre ellos; 'truncada' si hay más de max_nodos
+    red = await consulta(red_de_autor, autor, saltos, year_start, year_end, max_nodos)
+    if red is None:
+        raise HTTPException(status_code=404, detail=f"No existe el autor '{autor}'.")
+    return {"autor": autor, "saltos": saltos, **red}
+
+@app.get("/autores/camino")
+async def endpoint_camino_autores(
+    origen:     str,
+    destino:    str,
+    year_start: Optional[int] = None,
+    year_end:   Optional[int] = None,
+    max_saltos: int = Query(6, ge=1, le=10),
+):
+    # Cadena más corta de coautorías de origen a destino (cada tramo con sus papers juntos)
+    try:
+        tramos = await consulta(camino_entre_autores, origen, destino, year_start, year_end, max_saltos)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"No existe el autor '{e.args[0]}'.")
+    return {
+        "origen": origen,
+        "destino": destino,
+        "conectados": tramos is not None,
+        "saltos": len(tramos) if tramos is not None else None,
+        "camino": tramos or [],
+    }
+
+async def _generar_exportacion(ids, formato):
+    # Como mucho MAX_EXPORTACIONES a la vez (cada una tiene una conexión abierta mientras dura);
+    # el resto espera aquí sin ocupar hilo ni conexión
+    async with exportaciones_activas:
+        bloques = iterar_papers_completos(ids)
+        codificador = crear_codificador(formato)
+
+        def siguiente_trozo():
+            # Un trozo del fichero por bloque de filas leído del cursor de servidor.
+            # La lectura y la codificación van en el hilo para no frenar el bucle de eventos.
+            filas = next(bloques, None)
+            if filas is None:
+                return None
+            return codificador.bloque(filas)
+
+        try:
+            while (trozo := await anyio.to_thread.run_sync(siguiente_trozo, limiter=limite_exportaciones)) is not None:
+                yield trozo
+            # Lo que quede (el pie en Parquet, el fin de stream en Arrow)
+            yield await anyio.to_thread.run_sync(codificador.fin, limiter=limite_exportaciones)
+        finally:
+            # Cierra el cursor y devuelve la conexión aunque el cliente haya cortado la descarga
+            with anyio.CancelScope(shield=True):
+                await anyio.to_thread.run_sync(bloques.close, limiter=limite_exportaciones)
+
+async def _exportar(ids, formato="csv"):
+    # Compruebo que hay algo que exportar antes de responder para poder devolver 404
+    if not await consulta(existen_papers, ids):
         raise HTTPException(status_code=404, detail="No se encontraron publicaciones.")
 
-    output = io.StringIO()
-    fieldnames = ["id", "author", "title", "year", "isbn", "publisher", "address", "url", "doi", "abstract", "booktitle", "pages", "keywords", "series"]
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(publicaciones)
+    media_type, extension = FORMATOS[formato]
+    return StreamingResponse(_generar_exportacion(ids, formato), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename=publicaciones.{extension}"})
 
-    output.seek(0)
-    return StreamingResponse(output, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=publicaciones.csv"})
+@app.post("/exportar_csv", response_class=StreamingResponse)
+async def exportar_csv(ids: List[int] = Body(...), formato: str = Depends(formato_exportacion)):
+    return await _exportar(ids, formato)
+
+@app.post("/exportar_csv/conjunto/{conjunto}", response_class=StreamingResponse)
+async def exportar_csv_conjunto(conjunto: str, formato: str = Depends(formato_exportacion)):
+    # Exporta los papers que ya resolvió un endpoint de estadísticas (campo "conjunto" de su respuesta)
+    ids = await consulta(obtener_conjunto, conjunto)
+    if ids is None:
+        raise HTTPException(status_code=404, detail="El conjunto de resultados no existe o ha caducado. Repite la consulta.")
+    return await _exportar(ids, formato)
 router = APIRouter()
 
-def ejecutar_y_mostrar(comando):
-    proceso = subprocess.Popen(
-        comando,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True
-    )
-    for linea in proceso.stdout:
-        print(linea, end='') 
-    proceso.wait()
-    if proceso.returncode != 0:
-        raise subprocess.CalledProcessError(proceso.returncode, comando)
-
-@app.post("/actualizar_datos/")
+@app.post("/actualizar_datos/", status_code=202)
 def actualizar_datos(ano_inicio: int, ano_fin: int):
     min_year_valido = 1994
     año_actual = date.today().year
@@ -330,56 +516,37 @@ def actualizar_datos(ano_inicio: int, ano_fin: int):
     if ano_inicio > ano_fin:
         raise HTTPException(status_code=400, detail="El año de inicio no puede ser mayor que el año de fin.")
 
-    try:
-        # # 1. Ejecutar scraping 
-        ejecutar_y_mostrar([
-            "python", "../Automatizacion/scrapping_amc.py",
-            str(ano_inicio), str(ano_fin)
-        ])
-
-        # 2. Ejecutar importador 
-        ejecutar_y_mostrar([
-            "python", "../importar_bibtex.py",
-            "--ano_inicio", str(ano_inicio),
-            "--ano_fin", str(ano_fin)
-        ])
-
-        # 3. Leer estadísticas
-        with open("../Automatizacion/estadisticas_resultados.txt", "r") as f:
-            data = json.load(f)
-
-        años_validos = [int(a) for a, v in data.items() if v["espanolas"] > 0]
-        if not años_validos:
-            raise HTTPException(status_code=500, detail="No hay años con publicaciones españolas.")
-
-        min_year = min(años_validos)
-        max_year = max(años_validos)
-
-        # 4. Guardar estado en la base de datos
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM sistema_estado")
-        cur.execute(
-            "INSERT INTO sistema_estado (ultima_actualizacion, min_year, max_year) VALUES (%s, %s, %s)",
-            (date.today(), min_year, max_year)
+    # El scraping y la importación tardan horas: se lanzan en segundo plano y el cliente
+    # consulta el progreso en /actualizar_datos/{trabajo_id}
+    trabajo_id = lanzar_actualizacion(ano_inicio, ano_fin)
+    if trabajo_id is None:
+        activo = estado_trabajo()
+        raise HTTPException(
+            status_code=409,
+            detail=f"Ya hay una actualización en marcha (trabajo {activo['trabajo_id']}).",
         )
-        conn.commit()
-        cur.close()
-        conn.close()
 
-        return {
-            "mensaje": f"Actualización completada de {ano_inicio} a {ano_fin}",
-            "min": min_year,
-            "max": max_year
-        }
+    return {
+        "trabajo_id": trabajo_id,
+        "estado": "ejecutando",
+        "mensaje": f"Actualización de {ano_inicio} a {ano_fin} en marcha",
+    }
 
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error al ejecutar {' '.join(e.cmd)} (código {e.returncode})"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/actualizar_datos/ultimo")
+def estado_ultima_actualizacion_lanzada(desde: int = 0):
+    # Para recuperar el trabajo en curso tras recargar la página
+    estado = estado_trabajo(desde=desde)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="No se ha lanzado ninguna actualización.")
+    return estado
+
+@app.get("/actualizar_datos/{trabajo_id}")
+def estado_actualizacion(trabajo_id: int, desde: int = 0):
+    # Etapa, año en curso, filas importadas, tiempo y las líneas nuevas del log desde el byte 'desde'
+    estado = estado_trabajo(trabajo_id, desde)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="No existe el trabajo.")
+    return estado
 
 @app.get("/estado/ultima_actualizacion")
 def estado_ultima_actualizacion():
@@ -387,12 +554,9 @@ def estado_ultima_actualizacion():
 
     try:
         # 1. Leer valores desde BD
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT ultima_actualizacion, min_year, max_year FROM sistema_estado LIMIT 1")
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with conexion() as conn, conn.cursor() as cur:
+            cur.execute("SELECT ultima_actualizacion, min_year, max_year FROM sistema_estado LIMIT 1")
+            row = cur.fetchone()
 
         if not row:
             return {"estado": "no_data"}
@@ -422,13 +586,41 @@ def estado_ultima_actualizacion():
 
 
 
+@app.get("/estado/pool")
+async def estado_pool():
+    # Uso del pool de conexiones de este worker (para dimensionarlo frente al threadpool)
+    return estadisticas_pool() or {"estado": "sin_pool"}
+
+
+@app.get("/estado/cache")
+def estado_cache():
+    # Aciertos/fallos de la caché de respuestas (compartida por todos los workers)
+    return estadisticas_cache()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    # Latencias, filas y errores por consulta SQL, por función de db_manager y por ruta,
+    # y el uso del pool, en formato de texto de Prometheus (de este worker)
+    return PlainTextResponse(exponer_metricas(estadisticas_pool()), media_type=TIPO_METRICAS)
+
+
 @app.get("/map/paises")
-def endpoint_mapa_paises(
+@cacheado("mapa_paises")
+async def endpoint_mapa_paises(
     year_start: Optional[int] = None,
     year_end:   Optional[int] = None,
     serie:      Optional[str] = None,
+    detalle:    bool = False,
 ):
-    rows = mapa_paises_con_preview(year_start, year_end, serie)
+    # detalle=true: cada país lleva también sus series (lo de /map/paises/detalle) en la misma respuesta
+    if detalle:
+        rows, series = await asyncio.gather(
+            consulta(mapa_paises_con_preview, year_start, year_end, serie),
+            consulta(detalle_series_paises, year_start, year_end, serie),
+        )
+    else:
+        rows, series = await consulta(mapa_paises_con_preview, year_start, year_end, serie), None
     items = [{
         "country": r["country"],
         "total_papers": int(r["total_papers"]),
@@ -436,33 +628,41 @@ def endpoint_mapa_paises(
         "num_series": int(r["num_series"]),
         "series_preview": r["series_preview"],  # lista corta (top-5) para tooltip
     } for r in rows]
+    if series is not None:
+        for item in items:
+            item["detalle"] = [_serie_detalle(r) for r in series.get(item["country"], [])]
     return {"items": items, "params": {"year_start": year_start, "year_end": year_end, "serie": serie}}
 
+def _serie_detalle(r):
+    return {
+        "serie": r["serie"],
+        "total_papers": int(r["total_papers"]),
+        "total_authors": int(r["total_authors"]),
+        "years": r["years"],  # array de años
+    }
+
 @app.get("/map/paises/detalle")
-def endpoint_detalle_pais(
+@cacheado("mapa_paises_detalle")
+async def endpoint_detalle_pais(
     country: str,
     year_start: Optional[int] = None,
     year_end:   Optional[int] = None,
     serie:      Optional[str] = None,
 ):
-    rows = detalle_series_por_pais(country, year_start, year_end, serie)
-    items = [{
-        "serie": r["serie"],
-        "total_papers": int(r["total_papers"]),
-        "total_authors": int(r["total_authors"]),
-        "years": r["years"],  # array de años
-    } for r in rows]
+    rows = await consulta(detalle_series_por_pais, country, year_start, year_end, serie)
+    items = [_serie_detalle(r) for r in rows]
     return {"country": country, "items": items, "params": {"year_start": year_start, "year_end": year_end, "serie": serie}}
 
 
 @app.post("/exportar_csv/mapa_paises_detalle", response_class=StreamingResponse)
-def exportar_csv_mapa_paises_detalle(
+async def exportar_csv_mapa_paises_detalle(
     country: str = Body(...),
     series:  Optional[List[str]] = Body(default=None),
     year_start: Optional[int] = None,
     year_end:   Optional[int] = None,
+    formato: str = Depends(formato_exportacion),
 ):
-    ids = obtener_ids_papers_por_pais_y_series(country, series, year_start, year_end)
+    ids = await consulta(obtener_ids_papers_por_pais_y_series, country, series, year_start, year_end)
     if not ids:
         raise HTTPException(status_code=404, detail="No hay publicaciones para los filtros indicados.")
-    return exportar_csv(ids)
+    return await _exportar(ids, formato)
@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+
+from starlette.routing import Match
+
+
+# =========================================
+#  Métricas en formato de texto de Prometheus
+# =========================================
+
+# Se guardan en memoria, por worker: Prometheus consulta /metrics de cada proceso y suma.
+# Con esto se reparte el tiempo de una petición lenta:
+#   - bibliometria_sql_*: cada consulta SQL (lo avisa db_manager._ejecutar), con sus filas
+#     y sus errores
+#   - bibliometria_funcion_*: la función de db_manager entera (pool + SQL + Python); la
+#     diferencia con su SQL es el post-procesado en Python
+#   - bibliometria_http_*: la petición entera por ruta (plantilla, no la URL), con la
+#     serialización y la compresión; lo que pasa de la función es FastAPI
+#   - bibliometria_pool_*: conexiones en uso y espera para obtener una
+# Registrar una observación es un bisect y un lock por histograma: microsegundos.
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_FILAS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+
+    def __init__(self, nombre, ayuda, etiquetas, buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}   # valores de las etiquetas -> [cuentas por bucket..., +Inf, suma]
+        self._lock = threading.Lock()
+
+    def observar(self, valores, cantidad):
+        indice = bisect.bisect_left(self.buckets, cantidad)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[indice] += 1
+            serie[-1] += cantidad
+
+    def exponer(self):
+        with self._lock:
+            series = {valores: list(serie) for valores, serie in self._series.items()}
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, cuenta in zip(self.buckets + ("+Inf",), serie):
+                acumulado += cuenta
+                le = f'le="{limite if limite == "+Inf" else _numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, valores, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, valores)} {_numero(serie[-1])}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, valores)} {acumulado}")
+        return lineas
+
+
+class Contador:
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, valores, cantidad=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        with self._lock:
+            valores = dict(self._valores)
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        for etiquetas, valor in sorted(valores.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}")
+        return lineas
+
+
+sql_segundos = Histograma("bibliometria_sql_segundos", "Duración de cada consulta SQL.", ["consulta"])
+sql_filas = Histograma("bibliometria_sql_filas", "Filas devueltas por cada consulta SQL (sin los cursores de servidor).",
+                       ["consulta"], BUCKETS_FILAS)
+sql_errores = Contador("bibliometria_sql_errores_total", "Consultas SQL que han fallado.", ["consulta"])
+funcion_segundos = Histograma("bibliometria_funcion_segundos",
+                              "Duración de cada función de db_manager (pool + SQL + Python).", ["funcion"])
+funcion_errores = Contador("bibliometria_funcion_errores_total", "Funciones de db_manager que han lanzado una excepción.",
+                           ["funcion"])
+http_segundos = Histograma("bibliometria_http_segundos", "Duración de cada petición HTTP hasta el último byte.",
+                           ["metodo", "ruta", "estado"])
+http_errores = Contador("bibliometria_http_errores_total", "Peticiones HTTP con excepción no capturada.",
+                        ["metodo", "ruta"])
+
+METRICAS = [sql_segundos, sql_filas, sql_errores, funcion_segundos, funcion_errores, http_segundos, http_errores]
+
+
+def registrar_consulta(nombre, _query, _params, segundos, filas=None, error=None):
+    """Observador para db_manager.observar_consultas()."""
+    sql_segundos.observar((nombre,), segundos)
+    if error is not None:
+        sql_errores.sumar((nombre,))
+    elif filas is not None:
+        sql_filas.observar((nombre,), filas)
+
+
+def medir_funcion(funcion, *args, **kwargs):
+    # Llama a funcion(*args, **kwargs) y anota su duración con el nombre de la función
+    inicio = time.perf_counter()
+    try:
+        return funcion(*args, **kwargs)
+    except Exception:
+        funcion_errores.sumar((funcion.__name__,))
+        raise
+    finally:
+        funcion_segundos.observar((funcion.__name__,), time.perf_counter() - inicio)
+
+
+def _metricas_pool(estadisticas):
+    if not estadisticas:
+        return []
+    return [
+        "# HELP bibliometria_pool_conexiones_en_uso Conexiones del pool prestadas ahora mismo.",
+        "# TYPE bibliometria_pool_conexiones_en_uso gauge",
+        f"bibliometria_pool_conexiones_en_uso {estadisticas['en_uso']}",
+        "# HELP bibliometria_pool_conexiones_max Tamaño máximo del pool.",
+        "# TYPE bibliometria_pool_conexiones_max gauge",
+        f"bibliometria_pool_conexiones_max {estadisticas['max_conexiones']}",
+        "# HELP bibliometria_pool_esperando Hilos esperando una conexión libre.",
+        "# TYPE bibliometria_pool_esperando gauge",
+        f"bibliometria_pool_esperando {estadisticas['esperando']}",
+        "# HELP bibliometria_pool_obtenidas_total Conexiones prestadas desde el arranque.",
+        "# TYPE bibliometria_pool_obtenidas_total counter",
+        f"bibliometria_pool_obtenidas_total {estadisticas['total_obtenidas']}",
+        "# HELP bibliometria_pool_espera_segundos_total Tiempo total esperando una conexión.",
+        "# TYPE bibliometria_pool_espera_segundos_total counter",
+        f"bibliometria_pool_espera_segundos_total {_numero(float(estadisticas['espera_total_s']))}",
+    ]
+
+
+def exponer_metricas(estadisticas_pool=None):
+    """Todas las métricas en formato de texto de Prometheus."""
+    lineas = []
+    for metrica in METRICAS:
+        lineas += metrica.exponer()
+    lineas += _metricas_pool(estadisticas_pool)
+    return "\n".join(lineas) + "\n"
+
+
+class MetricasMiddleware:
+    # La ruta es la plantilla del endpoint (/papers/{paper_id}), que FastAPI deja en el
+    # scope al enrutar. Si la respuesta sale de un middleware antes de enrutar (un 304 de
+    # ETagMiddleware, un 403 del modo explain) se busca aquí la ruta que habría atendido la
+    # petición. Las URLs sin ruta van todas a "sin_ruta" para no crear series sin fin.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = [500]
+
+        async def enviar(message):
+            if message["type"] == "http.response.start":
+                estado[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, enviar)
+        except Exception:
+            http_errores.sumar((scope["method"], self._ruta(scope)))
+            raise
+        finally:
+            http_segundos.observar((scope["method"], self._ruta(scope), str(estado[0])),
+                                   time.perf_counter() - inicio)
+
+    @staticmethod
+    def _ruta(scope):
+        ruta = scope.get("route")
+        if ruta is None and "app" in scope:
+            for candidata in scope["app"].router.routes:
+                if candidata.matches(scope)[0] == Match.FULL:
+                    ruta = candidata
+                    break
+        return getattr(ruta, "path", None) or "sin_ruta"
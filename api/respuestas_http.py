@@ -0,0 +1,177 @@
+import hashlib
+from urllib.parse import parse_qsl
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipResponder, IdentityResponder
+from starlette.responses import Response
+
+from cache_respuestas import etag_peticion, renovar_conjuntos_etag
+
+try:
+    import brotli
+    BROTLI = True
+except ImportError:
+    BROTLI = False
+
+
+# =========================================
+#  Compresión de respuestas (br / gzip)
+# =========================================
+
+# Las respuestas de más de TAM_MINIMO_COMPRESION bytes se comprimen con brotli si el
+# cliente lo acepta (y el paquete brotli está instalado) o si no con gzip. Las
+# exportaciones en streaming se comprimen trozo a trozo. Parquet ya va comprimido.
+# Si se comprime, al ETag de la respuesta se le añade la codificación aplicada.
+
+TAM_MINIMO_COMPRESION = 1024
+NIVEL_GZIP = 6
+CALIDAD_BROTLI = 5                   # las respuestas son dinámicas: prima la velocidad
+TAM_MINIMO_HILO = 128 * 1024         # trozos más grandes se comprimen fuera del bucle de eventos
+TIPOS_SIN_COMPRIMIR = DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/vnd.apache.parquet",)
+
+
+def codificacion_aceptada(accept_encoding):
+    """La codificación que se va a usar según Accept-Encoding: 'br', 'gzip' o 'identity'."""
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.partition(";")
+        q = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                q = float(parametros[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip().lower()] = q
+    for codificacion in (("br", "gzip") if BROTLI else ("gzip",)):
+        if aceptadas.get(codificacion, 0) > 0:
+            return codificacion
+    return "identity"
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size, *, exclude_content_types=TIPOS_SIN_COMPRIMIR):
+        super().__init__(app, minimum_size, exclude_content_types=exclude_content_types)
+        self._compresor = None
+
+    async def apply_compression(self, body, *, more_body):
+        if len(body) >= TAM_MINIMO_HILO:
+            return await anyio.to_thread.run_sync(self._comprimir, body, more_body)
+        return self._comprimir(body, more_body)
+
+    def _comprimir(self, body, more_body):
+        if self._compresor is None:
+            self._compresor = brotli.Compressor(quality=CALIDAD_BROTLI)
+        datos = self._compresor.process(body)
+        return datos + (self._compresor.flush() if more_body else self._compresor.finish())
+
+
+class CompresionMiddleware:
+
+    def __init__(self, app, minimum_size=TAM_MINIMO_COMPRESION):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codificacion = codificacion_aceptada(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacion == "br":
+            responder = BrotliResponder(self.app, self.minimum_size)
+        elif codificacion == "gzip":
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=NIVEL_GZIP,
+                                      exclude_content_types=TIPOS_SIN_COMPRIMIR)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size, exclude_content_types=TIPOS_SIN_COMPRIMIR)
+
+        async def enviar(message):
+            # El responder ya ha decidido: Content-Encoding solo está si de verdad ha comprimido
+            if message["type"] == "http.response.start":
+                cabeceras = MutableHeaders(scope=message)
+                if "content-encoding" in cabeceras and "etag" in cabeceras:
+                    cabeceras["etag"] = etag_codificado(cabeceras["etag"], cabeceras["content-encoding"])
+            await send(message)
+
+        await responder(scope, receive, enviar)
+
+
+# =========================================
+#  ETags y GET condicional
+# =========================================
+
+# Las respuestas de los GET de consulta solo dependen de la ruta, de los parámetros y de
+# la versión de los datos, así que el ETag se calcula sin ejecutar el endpoint. Si el
+# cliente manda ese mismo ETag en If-None-Match se responde 304 sin cuerpo. El ETag es
+# fuerte: la respuesta sin comprimir lleva el ETag base y CompresionMiddleware le añade
+# la codificación que aplica de verdad (las respuestas pequeñas van sin comprimir aunque
+# el cliente acepte br o gzip), porque cada codificación es una representación distinta.
+# Antes de un 304 se renuevan los conjuntos de resultados que lleva la respuesta (ver
+# renovar_conjuntos_etag); si alguno ha caducado se responde entera en vez de con 304.
+
+def calcular_etag(ruta, query_string, version):
+    # Parámetros normalizados: el orden en la URL no cambia la respuesta
+    parametros = sorted(parse_qsl(query_string, keep_blank_values=True))
+    texto = repr((ruta, parametros, version))
+    return f'"{hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def etag_codificado(etag, codificacion):
+    """El ETag de la misma respuesta comprimida con 'codificacion' ("abc" -> "abc-br")."""
+    return f'{etag[:-1]}-{codificacion}"' if etag.endswith('"') else etag
+
+
+def _coincide(if_none_match, etag):
+    etiquetas = [e.strip() for e in if_none_match.split(",")]
+    # W/ solo indica comparación débil; para If-None-Match vale igual
+    return "*" in etiquetas or etag in (e[2:] if e.startswith("W/") else e for e in etiquetas)
+
+
+class ETagMiddleware:
+
+    def __init__(self, app, rutas, version):
+        # rutas: prefijos de las rutas GET cuyas respuestas dependen solo de los datos;
+        # version: función (bloqueante) que devuelve la versión actual del dataset
+        self.app = app
+        self.rutas = tuple(rutas)
+        self.version = version
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] not in ("GET", "HEAD")
+                or not scope["path"].startswith(self.rutas)):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        version = await anyio.to_thread.run_sync(self.version)
+        etag = calcular_etag(scope["path"], scope["query_string"].decode("latin-1"), version)
+
+        # La representación que se enviaría: la comprimida con la codificación negociada o,
+        # si la respuesta es pequeña o no se negocia ninguna, la de sin comprimir
+        codificacion = codificacion_aceptada(headers.get("accept-encoding", ""))
+        candidatos = [etag] if codificacion == "identity" else [etag_codificado(etag, codificacion), etag]
+        for candidato in candidatos:
+            if _coincide(headers.get("if-none-match", ""), candidato):
+                if not await anyio.to_thread.run_sync(renovar_conjuntos_etag, etag):
+                    break
+                respuesta = Response(status_code=304, headers={"ETag": candidato, "Vary": "Accept-Encoding"})
+                await respuesta(scope, receive, send)
+                return
+
+        async def enviar_con_etag(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                cabeceras = MutableHeaders(scope=message)
+                cabeceras["ETag"] = etag
+                cabeceras.setdefault("Cache-Control", "no-cache")   # guardar, pero revalidar siempre
+                cabeceras.add_vary_header("Accept-Encoding")
+            await send(message)
+
+        token = etag_peticion.set(etag)
+        try:
+            await self.app(scope, receive, enviar_con_etag)
+        finally:
+            etag_peticion.reset(token)
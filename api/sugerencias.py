@@ -0,0 +1,107 @@
+import bisect
+import heapq
+import logging
+import unicodedata
+
+import psycopg2
+
+from db_manager import terminos_sugerencias, sugerencias_aproximadas
+from indices_memoria import IndiceVersionado
+
+
+# =========================================
+#  Sugerencias (autocompletado) de autores, keywords y series
+# =========================================
+
+# Índice en memoria por worker: una lista ordenada de claves normalizadas (sin tildes, en
+# minúsculas) en la que se busca el prefijo con bisect. Cada término entra una vez por
+# palabra ("john smith" y "smith"), así "smi" también encuentra a John Smith. Se
+# reconstruye cuando cambia la versión de los datos (ver indices_memoria.py); si el
+# prefijo no da suficientes resultados se completa con coincidencias aproximadas de pg_trgm.
+
+TIPOS = ("autor", "keyword", "serie")
+MIN_LONGITUD_APROXIMADA = 3
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar(texto):
+    sin_tildes = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return " ".join(sin_tildes.lower().split())
+
+
+class IndicePrefijos:
+
+    def __init__(self, terminos):
+        # terminos: [(tipo, texto, peso), ...]
+        self.terminos = terminos
+        self.por_texto = {(tipo, texto): i for i, (tipo, texto, _) in enumerate(terminos)}
+        entradas = []
+        for i, (_, texto, _) in enumerate(terminos):
+            palabras = normalizar(texto).split()
+            for j in range(len(palabras)):
+                # j == 0: el prefijo coincide con el principio del término (mejor coincidencia)
+                entradas.append((" ".join(palabras[j:]), i, j > 0))
+        entradas.sort()
+        self.claves = [e[0] for e in entradas]
+        self.ids = [e[1] for e in entradas]
+        self.por_palabra = [e[2] for e in entradas]
+
+    def buscar(self, texto, tipos, limite):
+        clave = normalizar(texto)
+        if not clave:
+            return []
+        desde = bisect.bisect_left(self.claves, clave)
+        hasta = bisect.bisect_left(self.claves, clave + "\uffff")
+
+        # Mejor coincidencia de cada término (un término puede entrar por varias palabras)
+        mejores = {}
+        for pos in range(desde, hasta):
+            i = self.ids[pos]
+            if self.terminos[i][0] in tipos:
+                mejores[i] = min(mejores.get(i, True), self.por_palabra[pos])
+
+        # Primero los que empiezan por el texto, luego los de más papers
+        elegidos = heapq.nsmallest(
+            limite, mejores.items(),
+            key=lambda item: (item[1], -self.terminos[item[0]][2], self.terminos[item[0]][1]),
+        )
+        return [self._sugerencia(i, "palabra" if por_palabra else "prefijo") for i, por_palabra in elegidos]
+
+    def peso(self, tipo, texto):
+        i = self.por_texto.get((tipo, texto))
+        return self.terminos[i][2] if i is not None else 0
+
+    def _sugerencia(self, i, coincidencia):
+        tipo, texto, peso = self.terminos[i]
+        return {"tipo": tipo, "texto": texto, "peso": peso, "coincidencia": coincidencia}
+
+
+_indice = IndiceVersionado("Índice de sugerencias", lambda: IndicePrefijos(terminos_sugerencias()),
+                           resumen=lambda indice: f"{len(indice.terminos)} términos")
+construir_indice = _indice.construir
+obtener_indice = _indice.obtener
+
+
+def sugerir(texto, tipo=None, limite=10):
+    tipos = (tipo,) if tipo else TIPOS
+    indice = obtener_indice()
+    sugerencias = indice.buscar(texto, tipos, limite)
+
+    # Pocas coincidencias por prefijo: completo con las aproximadas (erratas, orden de palabras...)
+    if len(sugerencias) < limite and len(texto.strip()) >= MIN_LONGITUD_APROXIMADA:
+        vistas = {(s["tipo"], s["texto"]) for s in sugerencias}
+        try:
+            aproximadas = sugerencias_aproximadas(texto.strip(), tipos, limite)
+        except psycopg2.Error as e:
+            # Sin pg_trgm solo hay coincidencias por prefijo
+            logger.warning("Sugerencias aproximadas no disponibles: %s", e)
+            aproximadas = []
+        for tipo_t, texto_t, _similitud in aproximadas:
+            if (tipo_t, texto_t) not in vistas and len(sugerencias) < limite:
+                vistas.add((tipo_t, texto_t))
+                sugerencias.append({
+                    "tipo": tipo_t, "texto": texto_t,
+                    "peso": indice.peso(tipo_t, texto_t), "coincidencia": "aproximada",
+                })
+    return sugerencias
@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from db_manager import (
+    crear_trabajo_actualizacion,
+    actualizar_trabajo,
+    obtener_trabajo,
+    guardar_estado_sistema,
+    marcar_trabajos_abandonados,
+)
+from cache_respuestas import invalidar_cache
+
+
+# =========================================
+#  Trabajos de actualización en segundo plano
+# =========================================
+
+# /actualizar_datos/ ya no ejecuta el scraping y la importación dentro de la petición
+# (tardan horas): crea un trabajo en la BD y arranca su supervisor, este mismo módulo
+# ejecutado como proceso aparte (python trabajos.py <id> <año inicio> <año fin>) en su
+# propia sesión, así que reiniciar o parar la API no lo interrumpe. El supervisor lanza
+# los subprocesos, guarda su salida en logs/actualizacion_<id>.log y va anotando el
+# progreso y un latido en la tabla trabajos_actualizacion, que es lo que lee la API.
+# Solo puede haber un trabajo en marcha (índice único parcial).
+#
+# Si el supervisor muere (se reinicia la máquina, se mata el proceso), el trabajo deja de
+# latir y pasa a 'abandonado' al arrancar la API o al lanzar el siguiente. Para
+# retomarlo basta con volver a lanzar la actualización de los mismos años: el
+# importador salta los papers que ya están (por DOI), así que continúa donde se quedó.
+
+DIR_LOGS = os.path.abspath("../logs")
+LOG_TRABAJO = os.path.join(DIR_LOGS, "actualizacion_{id}.log")
+INTERVALO_LATIDO = 15        # segundos entre latidos aunque el subproceso no escriba nada
+INTERVALO_PROGRESO = 2       # como mucho una escritura de progreso en la BD cada 2 s
+MAX_BYTES_LOG_POR_LECTURA = 256 * 1024
+
+# Líneas de los scripts de las que sale el progreso
+RE_ANIO = re.compile(r"\bAño (\d{4})")                              # scrapping_amc.py
+RE_PAPER = re.compile(r"Paper insertado \((\d+)\) - año (\d{4})")   # importar_bibtex.py
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorTrabajo(Exception):
+    pass
+
+
+def lanzar_actualizacion(ano_inicio, ano_fin):
+    """Crea el trabajo y arranca su supervisor en otro proceso. Devuelve el id, o None si ya hay uno en marcha."""
+    os.makedirs(DIR_LOGS, exist_ok=True)
+    # Un trabajo cuyo supervisor ya no late no debe impedir lanzar otro
+    marcar_trabajos_abandonados()
+    trabajo_id = crear_trabajo_actualizacion(ano_inicio, ano_fin, LOG_TRABAJO)
+    if trabajo_id is None:
+        return None
+    try:
+        with open(LOG_TRABAJO.format(id=trabajo_id), "a", encoding="utf-8") as log:
+            proceso = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), str(trabajo_id), str(ano_inicio), str(ano_fin)],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,     # no le llegan las señales del grupo de la API
+            )
+    except OSError as e:
+        actualizar_trabajo(trabajo_id, estado="error", mensaje=f"No se pudo arrancar el supervisor: {e}")
+        raise
+    # Mientras la API siga viva recoge su código de salida (para no dejar un proceso zombi)
+    threading.Thread(target=proceso.wait, name=f"actualizacion-{trabajo_id}", daemon=True).start()
+    return trabajo_id
+
+
+def _supervisar(trabajo_id, ano_inicio, ano_fin):
+    parar_latido = threading.Event()
+    threading.Thread(target=_latir, args=(trabajo_id, parar_latido), daemon=True).start()
+
+    try:
+        with open(LOG_TRABAJO.format(id=trabajo_id), "a", encoding="utf-8") as log:
+            # 1. Ejecutar scraping
+            actualizar_trabajo(trabajo_id, etapa="scraping")
+            _ejecutar_etapa(trabajo_id, log, [
+                sys.executable, "../Automatizacion/scrapping_amc.py",
+                str(ano_inicio), str(ano_fin)
+            ])
+
+            # 2. Ejecutar importador
+            actualizar_trabajo(trabajo_id, etapa="importacion", anio_actual=None)
+            _ejecutar_etapa(trabajo_id, log, [
+                sys.executable, "../importar_bibtex.py",
+                "--ano_inicio", str(ano_inicio),
+                "--ano_fin", str(ano_fin)
+            ])
+
+            # 3. Leer estadísticas y guardar el estado del sistema
+            actualizar_trabajo(trabajo_id, etapa="estadisticas")
+            with open("../Automatizacion/estadisticas_resultados.txt", "r") as f:
+                data = json.load(f)
+
+            años_validos = [int(a) for a, v in data.items() if v["espanolas"] > 0]
+            if not años_validos:
+                raise ErrorTrabajo("No hay años con publicaciones españolas.")
+
+            guardar_estado_sistema(min(años_validos), max(años_validos))
+
+            # 4. Las respuestas cacheadas son de los datos anteriores
+            invalidar_cache()
+
+        actualizar_trabajo(
+            trabajo_id, estado="completado",
+            mensaje=f"Actualización completada de {ano_inicio} a {ano_fin}",
+        )
+    except Exception as e:
+        logger.exception("Trabajo de actualización %s fallido", trabajo_id)
+        if isinstance(e, subprocess.CalledProcessError):
+            mensaje = f"Error al ejecutar {' '.join(e.cmd)} (código {e.returncode})"
+        else:
+            mensaje = str(e)
+        try:
+            actualizar_trabajo(trabajo_id, estado="error", mensaje=mensaje)
+        except Exception:
+            logger.exception("No se pudo marcar el trabajo %s como fallido", trabajo_id)
+    finally:
+        parar_latido.set()
+
+
+def _latir(trabajo_id, parar):
+    # Mantiene vivo el trabajo aunque el subproceso pase mucho rato sin escribir
+    while not parar.wait(INTERVALO_LATIDO):
+        try:
+            actualizar_trabajo(trabajo_id)
+        except Exception:
+            logger.exception("No se pudo renovar el latido del trabajo %s", trabajo_id)
+
+
+def _ejecutar_etapa(trabajo_id, log, comando):
+    log.write(f"$ {' '.join(comando)}\n")
+    log.flush()
+    proceso = subprocess.Popen(
+        comando,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+    )
+
+    progreso, anotado, ultima_escritura = {}, {}, 0.0
+    for linea in proceso.stdout:
+        log.write(linea)
+        log.flush()
+
+        if m := RE_PAPER.search(linea):
+            progreso = {"filas_importadas": int(m.group(1)), "anio_actual": int(m.group(2))}
+        elif m := RE_ANIO.search(linea):
+            progreso = {**progreso, "anio_actual": int(m.group(1))}
+
+        if progreso != anotado and time.monotonic() - ultima_escritura >= INTERVALO_PROGRESO:
+            actualizar_trabajo(trabajo_id, **progreso)
+            anotado, ultima_escritura = dict(progreso), time.monotonic()
+
+    proceso.wait()
+    if progreso != anotado:
+        actualizar_trabajo(trabajo_id, **progreso)
+    if proceso.returncode != 0:
+        raise subprocess.CalledProcessError(proceso.returncode, comando)
+
+
+def leer_log(trabajo, desde=0):
+    """
+    Líneas del log del trabajo a partir del byte 'desde'. Devuelve (lineas, siguiente): el
+    cliente vuelve a pedir con desde=siguiente para recibir solo lo nuevo.
+    """
+    ruta = trabajo["log_ruta"]
+    if not ruta or not os.path.exists(ruta):
+        return [], desde
+    with open(ruta, "rb") as f:
+        f.seek(desde)
+        bloque = f.read(MAX_BYTES_LOG_POR_LECTURA)
+    # Solo líneas completas; la última a medias se devuelve en la siguiente lectura
+    fin = bloque.rfind(b"\n") + 1
+    return bloque[:fin].decode("utf-8", errors="replace").splitlines(), desde + fin
+
+
+def estado_trabajo(trabajo_id=None, desde=0):
+    trabajo = obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        return None
+    lineas, siguiente = leer_log(trabajo, desde)
+    return {
+        "trabajo_id": trabajo["id"],
+        "estado": trabajo["estado"],
+        "etapa": trabajo["etapa"],
+        "ano_inicio": trabajo["ano_inicio"],
+        "ano_fin": trabajo["ano_fin"],
+        "anio_actual": trabajo["anio_actual"],
+        "filas_importadas": trabajo["filas_importadas"],
+        "segundos": trabajo["segundos"],
+        "mensaje": trabajo["mensaje"],
+        "log": lineas,
+        "siguiente": siguiente,
+    }
+
+
+if __name__ == "__main__":
+    # Supervisor de un trabajo, arrancado por lanzar_actualizacion(); sus errores van al log del trabajo
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    _supervisar(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]))
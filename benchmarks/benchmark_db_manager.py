@@ -0,0 +1,180 @@
+"""
+Benchmark de las funciones de consulta de db_manager.
+
+Ejecuta cada función con parámetros típicos (el autor, la serie, el país y la keyword más
+frecuentes) para varias ventanas de años que acaban en el último año con datos, y anota
+el tiempo total de la llamada y el tiempo de SQL (el resto es Python: recoger filas y
+post-procesarlas). Con varias --db se comparan escalas generadas con generar_datos.py:
+
+    python benchmarks/generar_datos.py --db alejandro_bench_10k --papers 10000
+    python benchmarks/generar_datos.py --db alejandro_bench_100k --papers 100000
+    python benchmarks/benchmark_db_manager.py --db alejandro_bench_10k --db alejandro_bench_100k \\
+        --ventanas 1,5,10,todo --repeticiones 5 --salida benchmark_db_manager.json
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "api"))
+import db_manager
+from db_manager import DB_PARAMS, conexion, observar_consultas, iniciar_pool, cerrar_pool
+
+
+_sql = {"segundos": 0.0, "consultas": 0}
+
+@observar_consultas
+def _sumar_sql(_nombre, _query, _params, segundos, *_):
+    _sql["segundos"] += segundos
+    _sql["consultas"] += 1
+
+
+def escala():
+    with conexion() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT (SELECT COUNT(*) FROM papers), (SELECT COUNT(*) FROM authors),
+                   (SELECT COUNT(*) FROM paper_authors), (SELECT COUNT(*) FROM paper_keywords),
+                   (SELECT COUNT(DISTINCT serie) FROM conferences), (SELECT MIN(year) FROM conference_editions),
+                   (SELECT MAX(year) FROM conference_editions)
+        """)
+        papers, autores, paper_authors, paper_keywords, series, min_year, max_year = cur.fetchone()
+    return {"papers": papers, "autores": autores, "paper_authors": paper_authors,
+            "paper_keywords": paper_keywords, "series": series, "min_year": min_year, "max_year": max_year}
+
+
+def valores_tipicos():
+    # Los valores más frecuentes: el peor caso realista para cada filtro
+    with conexion() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT a.full_name FROM author_year_counts ayc JOIN authors a ON a.id = ayc.author_id
+            GROUP BY a.full_name ORDER BY SUM(ayc.papers) DESC LIMIT 1
+        """)
+        autor = cur.fetchone()[0]
+        cur.execute("""
+            SELECT c.serie, c.country FROM papers p
+            JOIN conference_editions ce ON ce.id = p.edition_id JOIN conferences c ON c.id = ce.conference_id
+            WHERE c.country IS NOT NULL GROUP BY c.serie, c.country ORDER BY COUNT(*) DESC LIMIT 1
+        """)
+        serie, pais = cur.fetchone()
+        cur.execute("SELECT keyword FROM paper_keywords GROUP BY keyword ORDER BY COUNT(*) DESC LIMIT 1")
+        keyword = cur.fetchone()[0]
+        cur.execute("SELECT MIN(id) FROM papers")
+        paper_id = cur.fetchone()[0]
+    return autor, serie, pais, keyword, paper_id
+
+
+def casos(min_year, max_year, ventanas):
+    """[(función, ventana, llamada), ...]; ventana None = sin filtro de años."""
+    autor, serie, pais, keyword, paper_id = valores_tipicos()
+    lista = [
+        ("limites_anios", None, lambda: db_manager.limites_anios()),
+        ("conferencias_unicas", None, lambda: db_manager.conferencias_unicas()),
+        ("contar_papers_autor", None, lambda: db_manager.contar_papers_autor(autor)),
+        ("obtener_paper_completo", None, lambda: db_manager.obtener_paper_completo(paper_id)),
+        ("terminos_sugerencias", None, lambda: db_manager.terminos_sugerencias()),
+    ]
+    for ventana in ventanas:
+        ys = None if ventana is None else max(min_year, max_year - ventana + 1)
+        ye = None if ventana is None else max_year
+        pares = [(r[0], r[1]) for r in db_manager.top_coauthor_pairs(ys, ye, top_n=20, min_papers=2)]
+        ids = db_manager.obtener_ids_papers_por_anios(ys, ye)
+        lista += [(nombre, ventana, llamada) for nombre, llamada in [
+            ("ranking_autores", lambda ys=ys, ye=ye: db_manager.ranking_autores(ys, ye)),
+            ("ranking_autores_con_ids", lambda ys=ys, ye=ye: db_manager.ranking_autores_con_ids(ys, ye)),
+            ("obtener_ids_papers_por_autor", lambda ys=ys, ye=ye: db_manager.obtener_ids_papers_por_autor(autor, ys, ye)),
+            ("evolucion_autor", lambda ys=ys, ye=ye: db_manager.evolucion_autor(autor, ys, ye)),
+            ("ranking_por_conferencia_con_ids", lambda ys=ys, ye=ye: db_manager.ranking_por_conferencia_con_ids(serie, ys, ye)),
+            ("autores_por_conferencia", lambda ys=ys, ye=ye: db_manager.autores_por_conferencia(serie, ys, ye)),
+            ("palabras_clave_mas_usadas", lambda ys=ys, ye=ye: db_manager.palabras_clave_mas_usadas(ys, ye, 20, True)),
+            ("obtener_ids_papers_por_keywords", lambda ys=ys, ye=ye: db_manager.obtener_ids_papers_por_keywords([keyword], ys, ye)),
+            ("obtener_ids_papers_por_anios", lambda ys=ys, ye=ye: db_manager.obtener_ids_papers_por_anios(ys, ye)),
+            ("top_coauthor_pairs", lambda ys=ys, ye=ye: db_manager.top_coauthor_pairs(ys, ye, top_n=20, min_papers=2)),
+            ("get_paper_ids_por_pares", lambda ys=ys, ye=ye, pares=pares: db_manager.get_paper_ids_por_pares(pares, ys, ye)),
+            ("autores_consistentes", lambda ys=ys, ye=ye: db_manager.autores_consistentes(ys or min_year, ye or max_year)),
+            ("mapa_paises_con_preview", lambda ys=ys, ye=ye: db_manager.mapa_paises_con_preview(ys, ye)),
+            ("detalle_series_por_pais", lambda ys=ys, ye=ye: db_manager.detalle_series_por_pais(pais, ys, ye)),
+            ("detalle_series_paises", lambda ys=ys, ye=ye: db_manager.detalle_series_paises(ys, ye)),
+            ("obtener_ids_papers_por_pais_y_series", lambda ys=ys, ye=ye: db_manager.obtener_ids_papers_por_pais_y_series(pais, [serie], ys, ye)),
+            ("buscar_papers", lambda ys=ys, ye=ye: db_manager.buscar_papers(keyword, ys, ye)),
+            ("obtener_ids_papers_por_busqueda", lambda ys=ys, ye=ye: db_manager.obtener_ids_papers_por_busqueda(keyword, ys, ye)),
+            ("iterar_papers_completos", lambda ids=ids: [f for b in db_manager.iterar_papers_completos(ids) for f in b]),
+        ]]
+    return lista
+
+
+def filas(resultado):
+    # Tamaño del resultado para el informe (las funciones devuelven formas distintas)
+    if isinstance(resultado, list):
+        return len(resultado)
+    if isinstance(resultado, dict):
+        return sum(len(v) for v in resultado.values())   # {país: filas}
+    if isinstance(resultado, tuple) and any(isinstance(r, list) for r in resultado):
+        return sum(len(r) for r in resultado if isinstance(r, list))   # (ranking, ids), (total, filas)...
+    return 0 if resultado is None else 1
+
+
+def medir(llamada, repeticiones):
+    llamada()   # calentamiento: caché de Postgres y del planificador
+    totales, sql = [], []
+    for _ in range(repeticiones):
+        _sql["segundos"] = 0.0
+        inicio = time.perf_counter()
+        resultado = llamada()
+        totales.append(time.perf_counter() - inicio)
+        sql.append(_sql["segundos"])
+    ms = lambda s: round(s * 1000, 2)
+    return {
+        "repeticiones": repeticiones,
+        "media_ms": ms(statistics.mean(totales)),
+        "p50_ms": ms(statistics.median(totales)),
+        "min_ms": ms(min(totales)),
+        "max_ms": ms(max(totales)),
+        "sql_media_ms": ms(statistics.mean(sql)),
+        "filas": filas(resultado),
+    }
+
+
+def medir_base_de_datos(db, ventanas, repeticiones):
+    cerrar_pool()
+    DB_PARAMS["dbname"] = db
+    iniciar_pool(1, 2)
+    try:
+        datos = escala()
+        print(f"\n{db}: {datos['papers']} papers, {datos['autores']} autores")
+        resultados = []
+        for nombre, ventana, llamada in casos(datos["min_year"], datos["max_year"], ventanas):
+            medida = {"funcion": nombre, "ventana_anios": ventana, **medir(llamada, repeticiones)}
+            resultados.append(medida)
+            print(f"  {nombre:38} {('todo' if ventana is None else ventana):>5}  "
+                  f"{medida['p50_ms']:>10.2f} ms  (sql {medida['sql_media_ms']:.2f} ms, {medida['filas']} filas)")
+        return {"db": db, "escala": datos, "resultados": resultados}
+    finally:
+        cerrar_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", action="append", required=True, help="base de datos a medir (se puede repetir)")
+    parser.add_argument("--ventanas", default="1,5,10,todo", help="años de cada ventana, 'todo' = sin filtro")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", default="benchmark_db_manager.json", help="informe JSON")
+    args = parser.parse_args()
+
+    ventanas = [None if v.strip() == "todo" else int(v) for v in args.ventanas.split(",")]
+    informe = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "repeticiones": args.repeticiones,
+        "ventanas_anios": ventanas,
+        "bases_de_datos": [medir_base_de_datos(db, ventanas, args.repeticiones) for db in args.db],
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\nInforme en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de concurrencia de la API.
+
+Mide la latencia de una llamada barata (/limites/anios) primero con la API en reposo y
+después mientras varios clientes lanzan exportaciones CSV completas sin parar. Sirve para
+comparar versiones de la API (antes/después) arrancada con uvicorn:
+
+    cd api && uvicorn main:app --port 8000
+    python benchmarks/concurrencia_api.py --url http://localhost:8000 --exportaciones 40
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def peticion(url, metodo="GET", timeout=300):
+    req = urllib.request.Request(url, method=metodo, data=b"" if metodo == "POST" else None)
+    inicio = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        tam = len(resp.read())
+    return time.perf_counter() - inicio, tam
+
+
+def percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    def p(q):
+        return round(tiempos[min(len(tiempos) - 1, int(q * len(tiempos)))] * 1000, 1)
+    return {
+        "n": len(tiempos),
+        "media_ms": round(statistics.mean(tiempos) * 1000, 1),
+        "p50_ms": p(0.50),
+        "p95_ms": p(0.95),
+        "max_ms": round(tiempos[-1] * 1000, 1),
+    }
+
+
+def sondear(base, n, concurrencia):
+    # n llamadas a /limites/anios con 'concurrencia' clientes en paralelo
+    with ThreadPoolExecutor(concurrencia) as ex:
+        return [t for t, _ in ex.map(lambda _: peticion(f"{base}/limites/anios"), range(n))]
+
+
+def exportar_sin_parar(base, parar, resultados):
+    while not parar.is_set():
+        try:
+            t, tam = peticion(f"{base}/exportar_csv/publicaciones_espanolas", "POST")
+            resultados.append((t, tam))
+        except Exception as e:
+            resultados.append((None, str(e)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--exportaciones", type=int, default=40, help="clientes exportando en paralelo")
+    parser.add_argument("--sondeos", type=int, default=200, help="llamadas a /limites/anios por fase")
+    parser.add_argument("--concurrencia-sondeos", type=int, default=10)
+    parser.add_argument("--calentamiento", type=float, default=2.0, help="segundos de exportaciones antes de medir")
+    args = parser.parse_args()
+
+    informe = {"url": args.url, "exportaciones": args.exportaciones}
+
+    # 1. API en reposo
+    informe["reposo"] = percentiles(sondear(args.url, args.sondeos, args.concurrencia_sondeos))
+
+    # 2. Con exportaciones lentas ocupando la API
+    parar, exportadas = threading.Event(), []
+    hilos = [threading.Thread(target=exportar_sin_parar, args=(args.url, parar, exportadas), daemon=True)
+             for _ in range(args.exportaciones)]
+    for h in hilos:
+        h.start()
+    time.sleep(args.calentamiento)
+    inicio = time.perf_counter()
+    informe["con_exportaciones"] = percentiles(sondear(args.url, args.sondeos, args.concurrencia_sondeos))
+    duracion = time.perf_counter() - inicio
+    parar.set()
+    for h in hilos:
+        h.join()
+
+    correctas = [t for t, _ in exportadas if t is not None]
+    informe["exportaciones_completadas"] = len(correctas)
+    informe["exportaciones_fallidas"] = len(exportadas) - len(correctas)
+    informe["exportacion"] = percentiles(correctas) if correctas else None
+    informe["duracion_fase_s"] = round(duracion, 2)
+
+    print(json.dumps(informe, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
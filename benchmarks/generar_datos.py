@@ -0,0 +1,290 @@
+"""
+Generador de datos sintéticos para los benchmarks.
+
+Crea (si no existe) una base de datos aparte, le aplica el esquema con las migraciones y
+la llena con papers con distribuciones parecidas a las de la ACM DL:
+  - más papers cada año y series de tamaño muy desigual (Zipf),
+  - autores por paper entre 1 y 10 (lo normal 2-4) y autores de popularidad Zipf,
+  - keywords y localizaciones sesgadas (unas pocas se llevan casi todo).
+Con la misma semilla y los mismos parámetros los datos son idénticos. No usa la red.
+
+    python benchmarks/generar_datos.py --db alejandro_bench_10k --papers 10000
+    python benchmarks/generar_datos.py --db alejandro_bench_100k --papers 100000
+    python benchmarks/generar_datos.py --db alejandro_bench_1m --papers 1000000
+
+Se niega a usar la base de datos de la API salvo con --permitir-bd-api (además de --db),
+y si la base de datos ya tiene papers solo la vacía con --reiniciar. Son dos opciones
+distintas a propósito: --reiniciar es la de todos los días con las bases de benchmark y
+no basta para borrar los datos de la API.
+"""
+import argparse
+import bisect
+import io
+import itertools
+import os
+import random
+import sys
+import time
+
+import psycopg2
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "api"))
+sys.path.insert(0, os.path.join(BASE_DIR, "migraciones"))
+from db_manager import DB_PARAMS
+import migrar
+
+BD_API = DB_PARAMS["dbname"]
+FILAS_POR_COPY = 50000
+
+SERIES_CONOCIDAS = [
+    "CHI", "UIST", "CSCW", "UbiComp", "IUI", "DIS", "RecSys", "MobileHCI", "ASSETS", "TEI",
+    "KDD", "WWW", "SIGIR", "CIKM", "MM", "ICSE", "FSE", "VRST", "ETRA", "IDC",
+]
+
+# De más a menos frecuente; el orden fija el peso Zipf
+LUGARES = [
+    "New York, NY, USA", "San Francisco, CA, USA", "Honolulu, HI, USA", "Seattle, WA, USA",
+    "Montreal, QC, Canada", "Virtual Event, USA", "Glasgow, Scotland Uk", "Paris, France",
+    "Yokohama, Japan", "Hamburg, Germany", "Barcelona, Spain", "Madrid, Spain", "Seoul, Republic of Korea",
+    "Beijing, China", "Amsterdam, Netherlands", "Stockholm, Sweden", "Vienna, Austria",
+    "Melbourne, VIC, Australia", "Toronto, ON, Canada", "Lisbon, Portugal", "Oldenburg, Germany",
+    "Valencia, Spain", "Bilbao, Spain", "Copenhagen, Denmark", "Oslo, Norway", "Helsinki, Finland",
+    "Bern &amp; Zurich, Switzerland", "Rio de Janeiro, Brazil", "Mexico City, Mexico", "Cape Town, South Africa",
+    "Singapore, Singapore", "Hyderabad, India", "Dublin, Ireland", "Prague, Czech Republic", "Athens, Greece",
+    "Online",
+]
+
+EDITORIALES = ["Association for Computing Machinery", "IEEE Computer Society", "Springer-Verlag"]
+
+KEYWORDS_CONOCIDAS = [
+    "virtual reality", "augmented reality", "accessibility", "machine learning", "user study",
+    "haptics", "eye tracking", "visualization", "education", "games", "health", "privacy",
+    "crowdsourcing", "fabrication", "social computing", "mobile devices", "interaction design",
+    "recommender systems", "information retrieval", "deep learning", "older adults", "children",
+    "wearables", "gesture recognition", "conversational agents", "explainable ai", "ethics",
+    "software engineering", "security", "natural language processing",
+]
+
+PALABRAS = (
+    "we present study novel approach system users design evaluation results participants "
+    "interaction interface model data method performance task analysis framework prototype "
+    "show propose findings improve support provide technique based using between across "
+    "experiment qualitative quantitative implications future work tool community dataset"
+).split()
+
+NOMBRES = [
+    "Alejandro", "Lourdes", "María", "José", "Ana", "David", "Laura", "Carlos", "Elena", "Javier",
+    "John", "Mary", "Wei", "Li", "Yuki", "Hiroshi", "Anna", "Peter", "Sarah", "Michael",
+    "Fatima", "Ahmed", "Priya", "Rahul", "Olga", "Ivan", "Sofia", "Lucas", "Emma", "Noah",
+    "Chen", "Jin", "Min-jun", "Seo-yeon", "Lars", "Ingrid", "Pierre", "Camille", "Giulia", "Marco",
+]
+APELLIDOS = [
+    "García", "Fernández", "González", "Rodríguez", "López", "Martínez", "Sánchez", "Pérez", "Gómez", "Martín",
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Miller", "Davis", "Wilson", "Anderson", "Taylor",
+    "Wang", "Zhang", "Liu", "Chen", "Yang", "Huang", "Zhao", "Wu", "Zhou", "Xu",
+    "Kim", "Lee", "Park", "Choi", "Tanaka", "Suzuki", "Sato", "Müller", "Schmidt", "Schneider",
+    "Rossi", "Russo", "Ferrari", "Dubois", "Bernard", "Nielsen", "Hansen", "Johansson", "Kowalski", "Novak",
+]
+INICIALES = [""] + [f"{c}. " for c in "ABCDEFGHIJKLMNOPRSTVW"]
+
+# Autores por paper (1..10): la mayoría entre 2 y 4, cola larga
+PESOS_AUTORES_POR_PAPER = [8, 18, 22, 19, 13, 8, 5, 3, 2, 2]
+PESOS_KEYWORDS_POR_PAPER = [10, 6, 12, 22, 24, 16, 10]          # 0..6
+
+
+def pesos_zipf(n, s):
+    # Pesos acumulados 1/rango^s para random.choices(cum_weights=...)
+    return list(itertools.accumulate(1.0 / (rango ** s) for rango in range(1, n + 1)))
+
+
+def nombres_autores(rng, n):
+    # n nombres distintos "Nombre [X. ]Apellido Apellido" sin materializar todas las combinaciones
+    radios = [len(NOMBRES), len(INICIALES), len(APELLIDOS), len(APELLIDOS)]
+    total = radios[0] * radios[1] * radios[2] * radios[3]
+    nombres = []
+    for indice in rng.sample(range(total * ((n - 1) // total + 1)), n):
+        vuelta, indice = divmod(indice, total)
+        partes = []
+        for radio in radios:
+            indice, resto = divmod(indice, radio)
+            partes.append(resto)
+        nombre = f"{NOMBRES[partes[0]]} {INICIALES[partes[1]]}{APELLIDOS[partes[2]]} {APELLIDOS[partes[3]]}"
+        nombres.append(nombre + (f" {vuelta + 1}" if vuelta else ""))
+    return nombres
+
+
+def _copy(cur, tabla, columnas, filas):
+    # COPY en formato texto; los textos generados no llevan tabuladores, saltos ni barras
+    buffer = io.StringIO()
+    for fila in filas:
+        buffer.write("\t".join("\\N" if v is None else str(v) for v in fila))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN", buffer)
+
+
+def copiar_por_lotes(cur, tabla, columnas, filas):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= FILAS_POR_COPY:
+            _copy(cur, tabla, columnas, lote)
+            lote = []
+    if lote:
+        _copy(cur, tabla, columnas, lote)
+
+
+def preparar_base_de_datos(args):
+    # La crea si no existe y le aplica las migraciones (esquema completo)
+    conn = psycopg2.connect(**{**DB_PARAMS, "dbname": "postgres"})
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (args.db,))
+        if cur.fetchone() is None:
+            cur.execute(f'CREATE DATABASE "{args.db}"')
+            print(f"Base de datos {args.db} creada")
+    conn.close()
+
+    DB_PARAMS["dbname"] = args.db
+    migrar.migrar()
+
+    conn = psycopg2.connect(**DB_PARAMS)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM papers)")
+        if cur.fetchone()[0]:
+            if not args.reiniciar:
+                sys.exit(f"{args.db} ya tiene papers; usa --reiniciar para vaciarla")
+            cur.execute("""
+                TRUNCATE papers, paper_authors, paper_keywords, authors, conference_editions,
+                         conferences, editorials, sistema_estado RESTART IDENTITY CASCADE
+            """)
+    return conn
+
+
+def generar(args):
+    rng = random.Random(args.semilla)
+    anios = list(range(args.desde, args.hasta + 1))
+    n_autores = args.autores or max(100, int(args.papers * 0.9))
+    n_series = args.series
+    n_keywords = max(args.keywords, len(KEYWORDS_CONOCIDAS))
+
+    series = SERIES_CONOCIDAS[:n_series] + [f"SYMP{i:03d}" for i in range(n_series - len(SERIES_CONOCIDAS))]
+    keywords = KEYWORDS_CONOCIDAS + [f"{rng.choice(PALABRAS)} {rng.choice(PALABRAS)} {i}"
+                                     for i in range(n_keywords - len(KEYWORDS_CONOCIDAS))]
+
+    # Una conferencia (nombre + lugar) y una edición por serie y año, como en la ACM DL
+    acum_lugares = pesos_zipf(len(LUGARES), 1.0)
+    ediciones = []           # (edition_id, serie_idx, year)
+    conferencias = []
+    for s, serie in enumerate(series):
+        for year in anios:
+            cid = len(conferencias) + 1
+            nombre = f"{serie} '{str(year)[2:]}: Proceedings of the {year} {serie} Conference"
+            editorial = 1 if rng.random() < 0.85 else rng.randint(2, len(EDITORIALES))
+            conferencias.append((cid, nombre, rng.choices(LUGARES, cum_weights=acum_lugares)[0], editorial))
+            ediciones.append((cid, s, year, nombre))
+
+    # Peso de cada edición: tamaño Zipf de la serie x crecimiento anual (~8 % al año)
+    tam_serie = [1.0 / (rango ** 1.1) for rango in range(1, n_series + 1)]
+    acum_ediciones = list(itertools.accumulate(
+        tam_serie[s] * 1.08 ** (year - args.desde) for _, s, year, _ in ediciones
+    ))
+    acum_autores = pesos_zipf(n_autores, args.zipf_autores)
+    acum_keywords = pesos_zipf(len(keywords), args.zipf_keywords)
+    n_por_paper = range(1, len(PESOS_AUTORES_POR_PAPER) + 1)
+    nombres = nombres_autores(rng, n_autores)
+    # Los autores más prolíficos no tienen por qué ser los primeros ids
+    orden_autores = list(range(1, n_autores + 1))
+    rng.shuffle(orden_autores)
+
+    def papers():
+        for pid in range(1, args.papers + 1):
+            edicion = ediciones[bisect.bisect_left(acum_ediciones, rng.random() * acum_ediciones[-1])]
+            k = rng.choices(range(len(PESOS_KEYWORDS_POR_PAPER)), weights=PESOS_KEYWORDS_POR_PAPER)[0]
+            kws = list(dict.fromkeys(rng.choices(keywords, cum_weights=acum_keywords, k=k)))
+            n = rng.choices(n_por_paper, weights=PESOS_AUTORES_POR_PAPER)[0]
+            autores = list(dict.fromkeys(orden_autores[i] for i in (
+                bisect.bisect_left(acum_autores, rng.random() * acum_autores[-1]) for _ in range(n)
+            )))
+            tema = kws[0] if kws else rng.choice(KEYWORDS_CONOCIDAS)
+            titulo = f"{rng.choice(PALABRAS).capitalize()} {tema} {' '.join(rng.choices(PALABRAS, k=rng.randint(2, 8)))}"
+            resumen = " ".join(rng.choices(PALABRAS + kws, k=rng.randint(40, 120))) if rng.random() < 0.9 else None
+            yield pid, edicion, titulo, resumen, kws, autores
+
+    return series, conferencias, ediciones, nombres, papers()
+
+
+def cargar(conn, args):
+    inicio = time.perf_counter()
+    series, conferencias, ediciones, nombres, papers = generar(args)
+    with conn, conn.cursor() as cur:
+        copiar_por_lotes(cur, "editorials", ["id", "name"], enumerate(EDITORIALES, 1))
+        copiar_por_lotes(cur, "conferences", ["id", "name", "location", "editorial_id"], conferencias)
+        copiar_por_lotes(cur, "conference_editions", ["id", "conference_id", "year", "booktitle"],
+                         ((cid, cid, year, nombre) for cid, _, year, nombre in ediciones))
+        copiar_por_lotes(cur, "authors", ["id", "full_name"], enumerate(nombres, 1))
+
+        # paper_authors de cada lote va detrás de sus papers (clave ajena)
+        columnas_papers = ["id", "authors", "edition_id", "title", "pages", "publisher",
+                           "abstract", "doi", "url", "isbn", "keywords"]
+        lote, paper_authors = [], []
+        for pid, (edition_id, _, _, _), titulo, resumen, kws, autores in papers:
+            lote.append((pid, " and ".join(nombres[a - 1] for a in autores), edition_id, titulo,
+                         f"{pid % 97 + 1}-{pid % 97 + 12}", "ACM", resumen, f"10.5555/sint.{pid}",
+                         f"https://dl.acm.org/doi/10.5555/sint.{pid}", None, ", ".join(kws) or None))
+            paper_authors.extend((pid, a, orden) for orden, a in enumerate(autores))
+            if len(lote) >= FILAS_POR_COPY or pid == args.papers:
+                _copy(cur, "papers", columnas_papers, lote)
+                _copy(cur, "paper_authors", ["paper_id", "author_id", "author_order"], paper_authors)
+                lote, paper_authors = [], []
+        print(f"Papers y autores cargados en {time.perf_counter() - inicio:.1f}s")
+
+        # Lo mismo que hace el importador al terminar
+        cur.execute("""
+            INSERT INTO paper_keywords (paper_id, keyword)
+            SELECT p.id, k FROM papers p, normalizar_keywords(p.keywords) AS k
+        """)
+        for tabla in ("editorials", "conferences", "conference_editions", "authors", "papers"):
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), (SELECT MAX(id) FROM {tabla}))")
+        cur.execute("INSERT INTO sistema_estado VALUES (CURRENT_DATE, %s, %s)", (args.desde, args.hasta))
+        cur.execute("SELECT reconstruir_coauthor_pairs()")   # la carga con COPY no pasa por el importador
+        cur.execute("SELECT refrescar_agregados()")
+
+    # Estadísticas y mapa de visibilidad al día, como en una base de datos ya asentada
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE")
+    print(f"{args.papers} papers, {len(nombres)} autores, {len(series)} series en {args.db} "
+          f"({time.perf_counter() - inicio:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="base de datos destino (se crea si no existe)")
+    parser.add_argument("--papers", type=int, default=10000)
+    parser.add_argument("--autores", type=int, default=None, help="por defecto 0.9 x papers")
+    parser.add_argument("--series", type=int, default=40)
+    parser.add_argument("--keywords", type=int, default=2000, help="tamaño del vocabulario de keywords")
+    parser.add_argument("--zipf-autores", type=float, default=0.6,
+                        help="exponente de la popularidad de autores (más alto = más concentrada)")
+    parser.add_argument("--zipf-keywords", type=float, default=0.8)
+    parser.add_argument("--desde", type=int, default=2000)
+    parser.add_argument("--hasta", type=int, default=2024)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--reiniciar", action="store_true", help="vacía la base de datos si ya tiene papers")
+    parser.add_argument("--permitir-bd-api", action="store_true",
+                        help=f"permite usar {BD_API}, la base de datos de la API (con --reiniciar, la vacía)")
+    args = parser.parse_args()
+
+    if args.db == BD_API and not args.permitir_bd_api:
+        sys.exit(f"{BD_API} es la base de datos de la API; usa otra o --permitir-bd-api si es a propósito")
+    conn = preparar_base_de_datos(args)
+    try:
+        cargar(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+-- Esquema de partida (versión 000 de las migraciones). Los cambios posteriores van en
+-- migraciones/NNN_*.sql y se aplican con: python migraciones/migrar.py
 SET search_path TO public;
 
 -- Extensión para búsquedas por similitud (trigram)
@@ -62,6 +64,13 @@ CREATE TABLE IF NOT EXISTS paper_authors (
     PRIMARY KEY (paper_id, author_id)
 );
 
+-- Palabras clave normalizadas (N:N papers <-> keyword)
+CREATE TABLE IF NOT EXISTS paper_keywords (
+    paper_id INTEGER NOT NULL REFERENCES papers(id) ON DELETE CASCADE,
+    keyword  TEXT    NOT NULL,
+    PRIMARY KEY (paper_id, keyword)
+);
+
 -- Estado del sistema
 CREATE TABLE IF NOT EXISTS sistema_estado (
     ultima_actualizacion DATE,
@@ -69,6 +78,50 @@ CREATE TABLE IF NOT EXISTS sistema_estado (
     max_year INT
 );
 
+-- Trabajos de /actualizar_datos/ (scraping + importación en segundo plano)
+CREATE TABLE IF NOT EXISTS trabajos_actualizacion (
+    id               SERIAL PRIMARY KEY,
+    ano_inicio       INT NOT NULL,
+    ano_fin          INT NOT NULL,
+    estado           TEXT NOT NULL DEFAULT 'ejecutando'
+                     CHECK (estado IN ('ejecutando', 'completado', 'error', 'abandonado')),
+    etapa            TEXT,              -- scraping | importacion | estadisticas
+    anio_actual      INT,
+    filas_importadas INT NOT NULL DEFAULT 0,
+    mensaje          TEXT,
+    log_ruta         TEXT,
+    creado           TIMESTAMPTZ NOT NULL DEFAULT now(),
+    terminado        TIMESTAMPTZ,
+    latido           TIMESTAMPTZ NOT NULL DEFAULT now()  -- lo renueva el supervisor mientras vive
+);
+
+-- =========================================
+--  Columnas derivadas
+--  (las calcula Postgres al insertar/actualizar, no cada consulta)
+-- =========================================
+
+-- Serie = lo que hay antes del apóstrofe en el nombre ("CHI" en "CHI '20: ...")
+ALTER TABLE conferences ADD COLUMN IF NOT EXISTS serie TEXT
+    GENERATED ALWAYS AS (btrim(split_part(name, '''', 1))) STORED;
+
+-- País = lo que hay tras la última coma de la localización (NULL si queda vacío)
+ALTER TABLE conferences ADD COLUMN IF NOT EXISTS country TEXT
+    GENERATED ALWAYS AS (NULLIF(btrim(regexp_replace(replace(location, '&amp;', '&'), '.*,\s*', '')), '')) STORED;
+
+-- =========================================
+--  Agregados precalculados
+--  (se refrescan al final de cada importación con refrescar_agregados(), que se define en
+--  las migraciones porque cada agregado nuevo la amplía)
+-- =========================================
+
+-- Nº de papers por autor y año: base de ranking, evolución, consistencia y existencia de autores
+CREATE MATERIALIZED VIEW IF NOT EXISTS author_year_counts AS
+SELECT pa.author_id, ce.year, COUNT(*)::int AS papers
+FROM paper_authors pa
+JOIN papers p               ON p.id = pa.paper_id
+JOIN conference_editions ce ON ce.id = p.edition_id
+GROUP BY pa.author_id, ce.year;
+
 -- =========================================
 --  Índices
 -- =========================================
@@ -77,9 +130,45 @@ CREATE TABLE IF NOT EXISTS sistema_estado (
 CREATE INDEX IF NOT EXISTS idx_ce_year   ON conference_editions (year);
 CREATE INDEX IF NOT EXISTS idx_conf_name ON conferences (name);
 CREATE INDEX IF NOT EXISTS idx_auth_name ON authors (full_name);
+CREATE INDEX IF NOT EXISTS idx_conf_serie   ON conferences (serie, id);
+CREATE INDEX IF NOT EXISTS idx_conf_country ON conferences (country, id);
 
 -- Búsqueda por similitud en keywords (trigram GIN)
 CREATE INDEX IF NOT EXISTS idx_papers_kw_trgm
     ON papers USING gin (keywords gin_trgm_ops);
 
+-- Keywords normalizadas: agregación y búsqueda exacta por keyword
+CREATE INDEX IF NOT EXISTS idx_pkw_keyword ON paper_keywords (keyword, paper_id);
+
+-- Un solo trabajo de actualización en marcha a la vez (aunque haya varios workers)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_trabajo_activo ON trabajos_actualizacion ((TRUE)) WHERE estado = 'ejecutando';
+
+-- author_year_counts: el único es necesario para REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ayc_author_year ON author_year_counts (author_id, year);
+CREATE INDEX IF NOT EXISTS idx_ayc_year ON author_year_counts (year, author_id) INCLUDE (papers);
+
 -- (Nota: no se crea el índice único parcial por DOI porque la columna ya es UNIQUE NOT NULL)
+
+-- =========================================
+--  Funciones
+-- =========================================
+
+-- Trocea papers.keywords por comas y normaliza cada keyword (sin espacios, minúsculas).
+-- La usan el importador y el backfill para que ambos normalicen igual.
+CREATE OR REPLACE FUNCTION normalizar_keywords(texto TEXT)
+RETURNS SETOF TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT DISTINCT lower(btrim(k, E' \t\r\n'))
+    FROM unnest(string_to_array(texto, ',')) AS k
+    WHERE btrim(k, E' \t\r\n') <> ''
+$$;
+
+-- =========================================
+--  Backfill
+-- =========================================
+
+-- paper_keywords para los papers importados antes de existir la tabla (idempotente)
+INSERT INTO paper_keywords (paper_id, keyword)
+SELECT p.id, k
+FROM papers p, normalizar_keywords(p.keywords) AS k
+ON CONFLICT DO NOTHING;
@@ -126,6 +126,38 @@ def realizar_busqueda():
     st.session_state["cargando"] = True
     st.session_state["forzar_rerun"] = True  
 
+@st.cache_resource
+def respuestas_con_etag():
+    # (ruta, params) -> (etag, json); compartido entre sesiones de este servidor de Streamlit
+    return {}
+
+def consultar_api(ruta, params=None):
+    # GET condicional: si los datos no han cambiado la API contesta 304 y se reutiliza el JSON guardado
+    guardadas = respuestas_con_etag()
+    clave = (ruta, tuple(sorted((k, str(v)) for k, v in (params or {}).items() if v is not None)))
+    anterior = guardadas.get(clave)
+    cabeceras = {"If-None-Match": anterior[0]} if anterior else {}
+    r = requests.get(f"{API_BASE}{ruta}", params=params, headers=cabeceras)
+    if r.status_code == 304 and anterior:
+        return anterior[1]
+    r.raise_for_status()
+    datos = r.json()
+    if "ETag" in r.headers:
+        if len(guardadas) >= 500:
+            guardadas.clear()
+        guardadas[clave] = (r.headers["ETag"], datos)
+    return datos
+
+def descargar_csv(respuesta, export_endpoint, params):
+    # Si la API guardó los papers de la consulta ("conjunto"), se exportan sin repetirla;
+    # si no hay conjunto o ha caducado, se recalcula con el endpoint de exportación de siempre
+    conjunto = respuesta.get("conjunto") if isinstance(respuesta, dict) else None
+    if conjunto:
+        r = requests.post(f"{API_BASE}/exportar_csv/conjunto/{conjunto}")
+        if r.status_code != 404:
+            return r.content
+    return requests.post(f"{API_BASE}{export_endpoint}", params=params).content
+
 # ---- Estilos  ----
 if st.session_state.get("carga_completada"):
     st.markdown("""
@@ -366,6 +398,34 @@ if st.session_state.get("carga_completada"):
 
         st.text_input("Enter full author name", key="autor_input", placeholder="Full author name")
 
+        # Autocompletado: sugerencias de /suggest para lo que se lleva escrito
+        autor_escrito = st.session_state.get("autor_input", "").strip()
+        if len(autor_escrito) >= 2:
+            try:
+                r_sug = requests.get(
+                    f"{API_BASE}/suggest",
+                    params={"q": autor_escrito, "tipo": "autor", "limite": 8},
+                    timeout=5,
+                )
+                r_sug.raise_for_status()
+                sugerencias_autor = [s["texto"] for s in r_sug.json().get("sugerencias", [])]
+            except Exception:
+                sugerencias_autor = []
+
+            if sugerencias_autor and autor_escrito not in sugerencias_autor:
+                def elegir_sugerencia_autor():
+                    elegido = st.session_state.get("autor_sugerido")
+                    if elegido:
+                        st.session_state["autor_input"] = elegido
+
+                st.selectbox(
+                    "Did you mean...",
+                    [""] + sugerencias_autor,
+                    key="autor_sugerido",
+                    format_func=lambda s: s or "Select a suggested author",
+                    on_change=elegir_sugerencia_autor,
+                )
+
 
 
     # --- Modal de actualización con token  ---
@@ -426,22 +486,53 @@ if st.session_state.get("carga_completada"):
                     )
                     st.stop()
 
-                # Llamada al backend
+                # Llamada al backend: lanza el trabajo y devuelve su id al momento
                 try:
-                    with st.spinner("Running backend update..."):
-                        r = requests.post(
-                            f"{API_BASE}/actualizar_datos/",
-                            params={
-                                "ano_inicio": int(ano_inicio_form),
-                                "ano_fin": int(ano_fin_form),
-                            },
-                            timeout=(15, 60 * 60 * 24),  # 15s conexión, hasta 1h lectura
-                            # headers={"Authorization": f"Bearer {token_input}"}
+                    r = requests.post(
+                        f"{API_BASE}/actualizar_datos/",
+                        params={
+                            "ano_inicio": int(ano_inicio_form),
+                            "ano_fin": int(ano_fin_form),
+                        },
+                        timeout=15,
+                        # headers={"Authorization": f"Bearer {token_input}"}
+                    )
+                    r.raise_for_status()
+                    trabajo_id = r.json()["trabajo_id"]
+
+                    # Consulto el progreso cada pocos segundos hasta que termine
+                    progreso = st.empty()
+                    caja_log = st.empty()
+                    lineas, desde = [], 0
+                    while True:
+                        r = requests.get(
+                            f"{API_BASE}/actualizar_datos/{trabajo_id}",
+                            params={"desde": desde},
+                            timeout=15,
                         )
                         r.raise_for_status()
-                        data = r.json()
+                        estado = r.json()
+                        desde = estado["siguiente"]
+                        lineas = (lineas + estado["log"])[-15:]
+
+                        minutos, segundos = divmod(estado["segundos"] or 0, 60)
+                        progreso.info(
+                            f"Stage: {estado['etapa'] or '-'} · "
+                            f"Year: {estado['anio_actual'] or '-'} · "
+                            f"Papers imported: {estado['filas_importadas']} · "
+                            f"Elapsed: {minutos}m {segundos:02d}s"
+                        )
+                        caja_log.code("\n".join(lineas) or "...", language=None)
+
+                        if estado["estado"] != "ejecutando":
+                            break
+                        time.sleep(3)
+
+                    if estado["estado"] != "completado":
+                        st.error(estado.get("mensaje") or "Update failed.")
+                        st.stop()
 
-                    st.success(data.get("mensaje", "Update completed."))
+                    st.success(estado.get("mensaje", "Update completed."))
 
                     # Cierra modal y refresca banner/estado
                     st.session_state["open_update_modal"] = False
@@ -618,9 +709,7 @@ if st.session_state.get("carga_completada"):
 
 
 
-                r = requests.get(f"{API_BASE}{endpoint}", params=params)
-                r.raise_for_status()
-                respuesta = r.json()
+                respuesta = consultar_api(endpoint, params)
 
                 if accion == "Most Frequent Keywords":
                     st.session_state["df_keywords"] = pd.DataFrame(respuesta["top_keywords"])
@@ -729,7 +818,7 @@ if st.session_state.get("carga_completada"):
                     st.session_state["df_pairs"] = df_pairs
 
                     # KPIs
-                    st.session_state["kpi_pub_total"] = len(set(respuesta.get("paper_ids", [])))
+                    st.session_state["kpi_pub_total"] = respuesta.get("total_papers", "-")
                     autores_involucrados = set()
                     if not df_pairs.empty:
                         autores_involucrados = set(df_pairs["autor1"]).union(set(df_pairs["autor2"]))
@@ -740,7 +829,7 @@ if st.session_state.get("carga_completada"):
                 else:
                     df = pd.DataFrame(respuesta.get("autores", respuesta))
                     st.session_state["df_ranking"] = df
-                    st.session_state["kpi_pub_total"] = len(set(respuesta.get("paper_ids", [])))
+                    st.session_state["kpi_pub_total"] = respuesta.get("total_papers", "-")
                     st.session_state["kpi_autores_unicos"] = len(df)
 
 
@@ -750,7 +839,7 @@ if st.session_state.get("carga_completada"):
                     elif accion == "Author Ranking" and not conferencia_seleccionada:
                         try:
                             if not conferencia_seleccionada:
-                                st.session_state["csv_data"] = requests.post(f"{API_BASE}/exportar_csv/ranking_autores", params=params).content
+                                st.session_state["csv_data"] = descargar_csv(respuesta, "/exportar_csv/ranking_autores", params)
                             
                             df_csv = pd.read_csv(io.BytesIO(st.session_state["csv_data"]))
 
@@ -778,7 +867,7 @@ if st.session_state.get("carga_completada"):
 
                 # Solo aquí generamos csv_data y nombre
                 if export_endpoint:
-                    st.session_state["csv_data"] = requests.post(f"{API_BASE}{export_endpoint}", params=params).content
+                    st.session_state["csv_data"] = descargar_csv(respuesta, export_endpoint, params)
                     
                     # Solo si NO es evolución de autor, generamos el nombre por defecto,
                     if accion == "Author Ranking":
@@ -1289,8 +1378,8 @@ if st.session_state.get("carga_completada"):
         col_vacia, col_a, col_b = st.columns(3)
 
         with col_a:
-            # Desplegable para "Max. top pairs" (5..35). Cambiar relanza la búsqueda.
-            opciones_top = list(range(5, 36))
+            # Desplegable para "Max. top pairs" (5..35 y hasta 500). Cambiar relanza la búsqueda.
+            opciones_top = list(range(5, 36)) + [50, 100, 200, 300, 500]
             st.session_state.setdefault("top_pairs", 20)
             st.selectbox(
                 "Max. top pairs",
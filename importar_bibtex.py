@@ -324,8 +324,15 @@ def importar_bibtex():
                             paper_id = cur.fetchone()[0]
                             inserted_papers += 1
                             nuevo_paper = True
+                            # Progreso que sigue el supervisor de /actualizar_datos/
+                            logging.info(f"Paper insertado ({inserted_papers}) - año {year}")
 
-                        for nombre in autores_finales:
+                            cur.execute(
+                                "INSERT INTO paper_keywords (paper_id, keyword) SELECT %s, k FROM normalizar_keywords(%s) AS k ON CONFLICT DO NOTHING",
+                                (paper_id, entry.get('keywords'))
+                            )
+
+                        for orden, nombre in enumerate(autores_finales):
                             cur.execute("SELECT id, publication_count, first_publication_year, last_publication_year FROM authors WHERE full_name = %s", (nombre,))
                             row = cur.fetchone()
                             if row:
@@ -339,7 +346,18 @@ def importar_bibtex():
                                 cur.execute("INSERT INTO authors (full_name, publication_count, first_publication_year, last_publication_year) VALUES (%s, %s, %s, %s) RETURNING id", (nombre, 1, year, year))
                                 author_id = cur.fetchone()[0]
 
-                            cur.execute("INSERT INTO paper_authors (paper_id, author_id) VALUES (%s, %s) ON CONFLICT DO NOTHING", (paper_id, author_id))
+                            cur.execute("INSERT INTO paper_authors (paper_id, author_id, author_order) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING", (paper_id, author_id, orden))
+                            if cur.rowcount == 1:
+                                # Autor nuevo en el paper: una coautoría más (el año del paper) con cada autor que ya tenía
+                                cur.execute("""
+                                    INSERT INTO coauthor_pairs (author_a, author_b, year, papers)
+                                    SELECT LEAST(pa.author_id, %(autor)s), GREATEST(pa.author_id, %(autor)s), ce.year, 1
+                                    FROM paper_authors pa
+                                    JOIN papers p               ON p.id = pa.paper_id
+                                    JOIN conference_editions ce ON ce.id = p.edition_id
+                                    WHERE pa.paper_id = %(paper)s AND pa.author_id <> %(autor)s
+                                    ON CONFLICT (author_a, author_b, year) DO UPDATE SET papers = coauthor_pairs.papers + 1
+                                """, {"autor": author_id, "paper": paper_id})
 
                             cur.execute("""
                                 SELECT c.name, COUNT(*) FROM paper_authors pa
@@ -354,6 +372,12 @@ def importar_bibtex():
                                 cur.execute("UPDATE authors SET most_common_conference = %s WHERE id = %s", (res[0], author_id))
 
     conn.commit()
+
+    # Agregados precalculados (author_year_counts, ...) con los datos recién importados
+    logging.info("Refrescando agregados...")
+    cur.execute("SELECT refrescar_agregados()")
+    conn.commit()
+
     cur.close()
     conn.close()
     driver.quit()
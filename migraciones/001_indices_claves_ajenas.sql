@@ -0,0 +1,22 @@
+-- Índices para las claves ajenas por las que se hacen todos los JOIN de db_manager,
+-- con las columnas que leen las consultas (INCLUDE) para que puedan ser index-only.
+
+-- papers -> conference_editions
+CREATE INDEX IF NOT EXISTS idx_papers_edition ON papers (edition_id) INCLUDE (id);
+
+-- paper_authors: la PK es (paper_id, author_id); para ir de un autor a sus papers hace falta la inversa
+CREATE INDEX IF NOT EXISTS idx_pa_author ON paper_authors (author_id, paper_id);
+
+-- conference_editions -> conferences (con el año, que filtra casi todas las consultas)
+CREATE INDEX IF NOT EXISTS idx_ce_conference ON conference_editions (conference_id, year) INCLUDE (id);
+
+-- conferences -> editorials
+CREATE INDEX IF NOT EXISTS idx_conf_editorial ON conferences (editorial_id);
+
+-- Filtro por año devolviendo la edición y su conferencia sin leer la tabla
+DROP INDEX IF EXISTS idx_ce_year;
+CREATE INDEX idx_ce_year ON conference_editions (year) INCLUDE (id, conference_id);
+
+-- Búsqueda de autores por nombre devolviendo el id
+DROP INDEX IF EXISTS idx_auth_name;
+CREATE INDEX idx_auth_name ON authors (full_name) INCLUDE (id);
@@ -0,0 +1,6 @@
+-- Coincidencias aproximadas de /suggest (operador % de pg_trgm) sin recorrer las tablas.
+-- Las series salen de conferences, que es pequeña y no lo necesita.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_auth_name_trgm ON authors USING gin (full_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_pkw_keyword_trgm ON paper_keywords USING gin (keyword gin_trgm_ops);
@@ -0,0 +1,12 @@
+-- Búsqueda de texto completo en título y resumen (/buscar).
+-- Columna generada: Postgres la mantiene al insertar/actualizar papers (también desde el importador).
+-- El título pesa más (A) que el resumen (B) en el ranking.
+-- Añadir la columna reescribe papers: conviene un VACUUM ANALYZE papers después (fuera de la
+-- transacción) para que el planificador vuelva a usar los index-only scans.
+ALTER TABLE papers ADD COLUMN IF NOT EXISTS busqueda tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(abstract, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_papers_busqueda ON papers USING gin (busqueda);
@@ -0,0 +1,32 @@
+-- Parejas de coautores por año: nº de papers que author_a y author_b (author_a < author_b)
+-- firmaron juntos ese año. La mantiene importar_bibtex.py al enlazar cada autor nuevo de un
+-- paper con los que ya tenía; top_coauthor_pairs suma sobre ella en vez de cruzar
+-- paper_authors consigo misma.
+CREATE TABLE IF NOT EXISTS coauthor_pairs (
+    author_a INTEGER NOT NULL REFERENCES authors(id) ON DELETE CASCADE,
+    author_b INTEGER NOT NULL REFERENCES authors(id) ON DELETE CASCADE,
+    year     INTEGER NOT NULL,
+    papers   INTEGER NOT NULL,
+    PRIMARY KEY (author_a, author_b, year),
+    CHECK (author_a < author_b)
+);
+
+-- Suma por rango de años sin leer la tabla (index-only)
+CREATE INDEX IF NOT EXISTS idx_coauthor_pairs_year ON coauthor_pairs (year) INCLUDE (author_a, author_b, papers);
+
+-- Recalcula la tabla entera desde paper_authors (backfill, o tras cargas que no pasan por el importador)
+CREATE OR REPLACE FUNCTION reconstruir_coauthor_pairs()
+RETURNS void
+LANGUAGE sql AS $$
+    DELETE FROM coauthor_pairs;
+    INSERT INTO coauthor_pairs (author_a, author_b, year, papers)
+    SELECT pa1.author_id, pa2.author_id, ce.year, COUNT(*)
+    FROM paper_authors pa1
+    JOIN paper_authors pa2      ON pa2.paper_id = pa1.paper_id AND pa1.author_id < pa2.author_id
+    JOIN papers p               ON p.id = pa1.paper_id
+    JOIN conference_editions ce ON ce.id = p.edition_id
+    GROUP BY pa1.author_id, pa2.author_id, ce.year;
+$$;
+
+-- Backfill de los papers ya importados
+SELECT reconstruir_coauthor_pairs();
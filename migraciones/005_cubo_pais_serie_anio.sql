@@ -0,0 +1,30 @@
+-- Cubo país × serie × año para /map/paises y /map/paises/detalle: nº de papers de cada celda
+-- y los ids de sus autores (ordenados, sin repetir). Los papers se suman entre celdas (cada
+-- paper está en una sola); los autores distintos de varias celdas salen de unir sus arrays.
+-- Solo conferencias con país (el mapa no muestra el resto).
+CREATE MATERIALIZED VIEW IF NOT EXISTS pais_serie_anio AS
+SELECT
+    c.country,
+    c.serie,
+    ce.year,
+    COUNT(DISTINCT p.id)::int                                                             AS papers,
+    COALESCE(array_agg(DISTINCT pa.author_id) FILTER (WHERE pa.author_id IS NOT NULL), '{}') AS autores
+FROM papers p
+JOIN conference_editions ce ON ce.id = p.edition_id
+JOIN conferences c          ON c.id = ce.conference_id
+LEFT JOIN paper_authors pa  ON pa.paper_id = p.id
+WHERE c.country IS NOT NULL
+GROUP BY c.country, c.serie, ce.year;
+
+-- Necesario para REFRESH ... CONCURRENTLY; sirve también para filtrar por país
+CREATE UNIQUE INDEX IF NOT EXISTS idx_pais_serie_anio ON pais_serie_anio (country, serie, year);
+
+-- Se refresca con los demás agregados al final de cada importación
+CREATE OR REPLACE FUNCTION refrescar_agregados()
+RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY author_year_counts;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY pais_serie_anio;
+END
+$$;
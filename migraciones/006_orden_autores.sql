@@ -0,0 +1,21 @@
+-- Posición de cada autor en la firma del paper (0 = primer autor), para que las
+-- exportaciones y la ficha del paper listen los autores en el orden original.
+ALTER TABLE paper_authors ADD COLUMN IF NOT EXISTS author_order SMALLINT;
+
+-- Backfill: la posición del nombre en papers.authors (la firma tal como la guardó el
+-- importador, separada por ', '); si no aparece, el orden en que se insertaron las filas.
+UPDATE paper_authors pa
+SET author_order = o.posicion
+FROM (
+    SELECT pa.paper_id, pa.author_id,
+           ROW_NUMBER() OVER (
+               PARTITION BY pa.paper_id
+               ORDER BY array_position(string_to_array(p.authors, ', '), a.full_name) NULLS LAST, pa.ctid
+           ) - 1 AS posicion
+    FROM paper_authors pa
+    JOIN papers p  ON p.id = pa.paper_id
+    JOIN authors a ON a.id = pa.author_id
+) o
+WHERE pa.paper_id = o.paper_id AND pa.author_id = o.author_id AND pa.author_order IS NULL;
+
+ALTER TABLE paper_authors ALTER COLUMN author_order SET NOT NULL;
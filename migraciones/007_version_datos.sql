@@ -0,0 +1,23 @@
+-- Versión de los datos: la usan la caché de respuestas, los ETags y los índices en memoria
+-- de la API para saber que hay datos nuevos. sistema_estado.ultima_actualizacion es una
+-- fecha y no cambia con una segunda importación el mismo día, así que la versión es un
+-- contador que incrementa refrescar_agregados(), a la que llama todo lo que carga datos
+-- (importar_bibtex.py, benchmarks/generar_datos.py) al terminar.
+CREATE TABLE IF NOT EXISTS version_datos (
+    unica       BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (unica),    -- una sola fila
+    version     BIGINT NOT NULL DEFAULT 0,
+    actualizada TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO version_datos DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+-- Refresca los agregados precalculados (CONCURRENTLY: la API sigue leyendo mientras tanto)
+-- y anuncia la nueva versión en la misma transacción
+CREATE OR REPLACE FUNCTION refrescar_agregados()
+RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY author_year_counts;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY pais_serie_anio;
+    UPDATE version_datos SET version = version + 1, actualizada = now();
+END
+$$;
@@ -0,0 +1,153 @@
+"""
+Comprobación de planes de las consultas de db_manager.
+
+Llama a cada función de consulta con parámetros selectivos (un autor, una serie, un país,
+un año...), captura el SQL que ejecuta con observar_consultas() y pide su plan con
+EXPLAIN. Termina con código 1 si algún plan hace Seq Scan sobre una tabla grande, que
+casi siempre significa que falta un índice o que una migración ha dejado uno inservible.
+
+Se lanza contra una base de datos ya migrada y con datos (reales o sembrados):
+
+    python migraciones/migrar.py
+    python migraciones/comprobar_planes.py [--min-filas 5000]
+"""
+import argparse
+import json
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "api"))
+import db_manager
+from db_manager import conexion, observar_consultas
+
+
+def valores_de_muestra():
+    # Un valor real de cada cosa por la que filtran las consultas
+    with conexion() as conn, conn.cursor() as cur:
+        cur.execute("SELECT MAX(year) FROM conference_editions")
+        anio = cur.fetchone()[0]
+        cur.execute("""
+            SELECT a.full_name FROM authors a JOIN paper_authors pa ON pa.author_id = a.id
+            GROUP BY a.full_name ORDER BY COUNT(*) DESC LIMIT 1
+        """)
+        autor = cur.fetchone()[0]
+        cur.execute("SELECT serie, country FROM conferences WHERE country IS NOT NULL ORDER BY id LIMIT 1")
+        serie, pais = cur.fetchone()
+        cur.execute("SELECT keyword FROM paper_keywords GROUP BY keyword ORDER BY COUNT(*) DESC LIMIT 1")
+        keyword = cur.fetchone()[0]
+        cur.execute("""
+            SELECT a1.full_name, a2.full_name
+            FROM paper_authors pa1
+            JOIN paper_authors pa2 ON pa2.paper_id = pa1.paper_id AND pa2.author_id > pa1.author_id
+            JOIN authors a1 ON a1.id = pa1.author_id
+            JOIN authors a2 ON a2.id = pa2.author_id
+            LIMIT 1
+        """)
+        par = cur.fetchone()
+        cur.execute("SELECT MIN(id) FROM papers")
+        paper_id = cur.fetchone()[0]
+    return anio, autor, serie, pais, keyword, par, paper_id
+
+
+def casos():
+    # No están las cargas enteras de los índices en memoria (terminos_sugerencias,
+    # anios_activos_autores, datos_grafo_coautorias): leen tablas completas a propósito
+    anio, autor, serie, pais, keyword, par, paper_id = valores_de_muestra()
+    return [
+        (db_manager.limites_anios, ()),
+        (db_manager.ranking_autores, (anio, anio)),
+        (db_manager.ranking_autores_con_ids, (anio, anio)),
+        # Solo el recuento (ids=none) y una página por clave (ids=page) de los papers
+        (db_manager.ranking_autores_con_ids, (anio, anio, "none")),
+        (db_manager.ranking_autores_con_ids, (anio, anio, "page", paper_id, 100)),
+        (db_manager.obtener_ids_papers_por_autor, (autor, anio, anio)),
+        (db_manager.contar_papers_autor, (autor,)),
+        (db_manager.evolucion_autor, (autor, anio, anio)),
+        (db_manager.ranking_por_conferencia_con_ids, (serie, anio, anio)),
+        (db_manager.ranking_por_conferencia_con_ids, (serie, anio, anio, "none")),
+        (db_manager.ranking_por_conferencia_con_ids, (serie, anio, anio, "page", paper_id, 100)),
+        (db_manager.ranking_por_conferencia, (serie, anio, anio)),
+        (db_manager.autores_por_conferencia, (serie, anio, anio)),
+        (db_manager.palabras_clave_mas_usadas, (anio, anio, 20)),
+        (db_manager.obtener_ids_papers_por_keywords, ([keyword], anio, anio)),
+        (db_manager.obtener_ids_papers_por_anios, (anio, anio)),
+        (db_manager.obtener_ids_papers_por_editorial, (anio, anio)),
+        (db_manager.obtener_ids_papers_por_conferencia, (anio, anio)),
+        (db_manager.top_coauthor_pairs, (anio, anio)),
+        (db_manager.get_paper_ids_por_pares, ([par], anio, anio)),
+        (db_manager.papers_por_pares, ([par], anio, anio, "none")),
+        (db_manager.papers_por_pares, ([par], anio, anio, "page", paper_id, 100)),
+        (db_manager.obtener_paper, (paper_id,)),
+        (db_manager.obtener_autores_paper, (paper_id,)),
+        (db_manager.existen_papers, ([paper_id],)),
+        (lambda ids: list(db_manager.iterar_papers_completos(ids)), ([paper_id],)),
+        (db_manager.autores_consistentes, (anio, anio)),
+        (db_manager.sugerencias_aproximadas, (autor[:-1], ["autor", "keyword", "serie"])),
+        # Agregaciones del cubo pais_serie_anio, con y sin filtros
+        (db_manager.mapa_paises_con_preview, (anio, anio, serie)),
+        (db_manager.mapa_paises_con_preview, (anio, anio)),
+        (db_manager.mapa_paises_con_preview, ()),
+        (db_manager.detalle_series_por_pais, (pais, anio, anio)),
+        (db_manager.detalle_series_por_pais, (pais, anio, anio, serie)),
+        (db_manager.detalle_series_paises, (anio, anio)),
+        (db_manager.detalle_series_paises, (anio, anio, serie)),
+        (db_manager.obtener_ids_papers_por_pais_y_series, (pais, [serie], anio, anio)),
+        # Búsqueda de texto completo: con y sin filtros, y una página que no es la primera
+        (db_manager.buscar_papers, (keyword, anio, anio, serie, pais)),
+        (db_manager.buscar_papers, (keyword,)),
+        (db_manager.buscar_papers, (keyword, None, None, None, None, 3)),
+        (db_manager.contar_resultados_busqueda, (keyword,)),
+        (db_manager.contar_resultados_busqueda, (keyword, anio, anio, serie, pais)),
+        (db_manager.obtener_ids_papers_por_busqueda, (keyword, None, None, serie)),
+        (db_manager.obtener_ids_papers_por_busqueda, (keyword, anio, anio)),
+    ]
+
+
+def tablas_grandes(min_filas):
+    # Tablas y vistas materializadas con al menos min_filas según las estadísticas del planificador
+    with conexion() as conn, conn.cursor() as cur:
+        cur.execute("ANALYZE")
+        cur.execute("""
+            SELECT relname FROM pg_class
+            WHERE relkind IN ('r', 'm') AND relnamespace = 'public'::regnamespace AND reltuples >= %s
+        """, (min_filas,))
+        return {r[0] for r in cur.fetchall()}
+
+
+def seq_scans(nodo):
+    if nodo.get("Node Type") == "Seq Scan":
+        yield nodo["Relation Name"]
+    for hijo in nodo.get("Plans", []):
+        yield from seq_scans(hijo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-filas", type=int, default=5000, help="a partir de cuántas filas una tabla es grande")
+    args = parser.parse_args()
+
+    grandes = tablas_grandes(args.min_filas)
+    consultas = []
+    observar_consultas(lambda nombre, query, params, *_: consultas.append((nombre, query, params)))
+    for funcion, argumentos in casos():
+        funcion(*argumentos)
+
+    fallos = 0
+    with conexion() as conn, conn.cursor() as cur:
+        for nombre, query, params in consultas:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0][0]["Plan"]
+            malas = sorted(set(seq_scans(plan)) & grandes)
+            if malas:
+                fallos += 1
+                print(f"FALLO  {nombre}: Seq Scan sobre {', '.join(malas)}")
+            else:
+                print(f"ok     {nombre}")
+
+    print(f"\n{len(consultas)} consultas, {fallos} con Seq Scan sobre tablas grandes ({', '.join(sorted(grandes)) or 'ninguna'})")
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
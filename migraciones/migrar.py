@@ -0,0 +1,76 @@
+"""
+Aplica las migraciones pendientes de la base de datos.
+
+ddl_inicial.sql es la versión 000 (esquema de partida). Los cambios posteriores van en
+migraciones/NNN_descripcion.sql: se aplican en orden, cada una en su propia transacción,
+y quedan anotadas en la tabla schema_migrations para no repetirlas.
+
+    python migraciones/migrar.py            # aplica las pendientes
+    python migraciones/migrar.py --estado   # solo lista aplicadas y pendientes
+"""
+import argparse
+import os
+import re
+import sys
+
+import psycopg2
+
+DIR_MIGRACIONES = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(DIR_MIGRACIONES)
+
+sys.path.insert(0, os.path.join(BASE_DIR, "api"))
+from db_manager import DB_PARAMS
+
+
+def listar_migraciones():
+    migraciones = [("000_ddl_inicial", os.path.join(BASE_DIR, "ddl_inicial.sql"))]
+    for nombre in sorted(os.listdir(DIR_MIGRACIONES)):
+        if re.fullmatch(r"\d{3}_\w+\.sql", nombre):
+            migraciones.append((nombre[:-len(".sql")], os.path.join(DIR_MIGRACIONES, nombre)))
+    return migraciones
+
+
+def migraciones_aplicadas(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version  TEXT PRIMARY KEY,
+            aplicada TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+
+def migrar(solo_estado=False):
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        # Evita que dos procesos migren a la vez (se libera al cerrar la conexión)
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(hashtext('schema_migrations'))")
+            aplicadas = migraciones_aplicadas(cur)
+
+        pendientes = [(v, ruta) for v, ruta in listar_migraciones() if v not in aplicadas]
+        for version in sorted(aplicadas):
+            print(f"  aplicada   {version}")
+        for version, _ in pendientes:
+            print(f"  pendiente  {version}")
+        if solo_estado or not pendientes:
+            return
+
+        for version, ruta in pendientes:
+            with open(ruta, encoding="utf-8") as f:
+                sql = f.read()
+            # Una transacción por migración: si falla no queda a medias ni anotada
+            with conn, conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+            print(f"Aplicada {version}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--estado", action="store_true", help="no aplica nada, solo muestra el estado")
+    args = parser.parse_args()
+    migrar(solo_estado=args.estado)